@@ -1,4 +1,5 @@
 import os
+import click
 from app import create_app, db
 from app.models import *
 
@@ -21,22 +22,197 @@ def make_shell_context():
         'TicketType': TicketType,
         'Booking': Booking,
         'PromoCode': PromoCode,
+        'TicketPDFJob': TicketPDFJob,
         'Payment': Payment,
         'PartnerPayout': PartnerPayout,
+        'PartnerLedgerEntry': PartnerLedgerEntry,
+        'MpesaCallback': MpesaCallback,
         'Category': Category,
         'Location': Location,
         'Notification': Notification,
-        'AdminLog': AdminLog
+        'NotificationCounter': NotificationCounter,
+        'OutboundEmail': OutboundEmail,
+        'SMSMessage': SMSMessage,
+        'EventReminder': EventReminder,
+        'AdminLog': AdminLog,
+        'AnalyticsHourly': AnalyticsHourly,
+        'AnalyticsDaily': AnalyticsDaily
     }
 
 
 @app.cli.command()
 def init_db():
     """Initialize the database"""
+    from app.utils.search import create_search_index
     db.create_all()
+    create_search_index()
     print('Database initialized!')
 
 
+@app.cli.command()
+def rebuild_search_index():
+    """Create the event search index and re-index all events"""
+    from app.utils.search import create_search_index, rebuild_search_index as rebuild
+    if not create_search_index():
+        print('Full-text search is not supported on this database.')
+        return
+    count = rebuild()
+    print(f'Indexed {count} events.')
+
+
+@app.cli.command()
+def backfill_checkout_request_ids():
+    """Copy M-Pesa CheckoutRequestIDs from payment metadata into the indexed column"""
+    batch_size = 1000
+    last_id = 0
+    updated = 0
+    while True:
+        payments = Payment.query.filter(
+            Payment.id > last_id,
+            Payment.checkout_request_id.is_(None),
+            Payment.payment_metadata.isnot(None)
+        ).order_by(Payment.id).limit(batch_size).all()
+        if not payments:
+            break
+        
+        for payment in payments:
+            checkout_request_id = (payment.payment_metadata or {}).get('CheckoutRequestID')
+            if checkout_request_id:
+                payment.checkout_request_id = checkout_request_id
+                updated += 1
+        db.session.commit()
+        last_id = payments[-1].id
+    print(f'Backfilled {updated} payments.')
+
+
+@app.cli.command()
+def rebuild_ticket_reservations():
+    """Recompute reserved ticket counters from pending bookings"""
+    from app.utils.inventory import rebuild_reserved_counts
+    count = rebuild_reserved_counts()
+    print(f'Updated reserved counts on {count} ticket types.')
+
+
+@app.cli.command()
+@click.option('--once', is_flag=True, help='Run a single sweep and exit')
+def reservation_sweeper(once):
+    """Release expired ticket reservations as they expire"""
+    from app.utils.reservation_sweeper import reservation_sweeper as sweeper
+    if once:
+        print(f'Released {sweeper.sweep()} expired booking(s).')
+        return
+    print('Reservation sweeper running, press Ctrl+C to stop.')
+    try:
+        sweeper.run_forever()
+    except KeyboardInterrupt:
+        sweeper.stop()
+
+
+@app.cli.command()
+@click.option('--requeue-dead', is_flag=True, help='Retry dead-lettered callbacks first')
+@click.option('--once', is_flag=True, help='Process the queued callbacks and exit')
+def mpesa_callback_worker(requeue_dead, once):
+    """Process queued M-Pesa payment callbacks"""
+    from app.utils.mpesa_inbox import callback_workers, requeue_dead as requeue
+    if requeue_dead:
+        print(f'Requeued {requeue()} dead callback(s).')
+    if once:
+        print(f'Processed {callback_workers.drain()} callback(s).')
+        return
+    print('MPesa callback worker running, press Ctrl+C to stop.')
+    try:
+        callback_workers.run_forever()
+    except KeyboardInterrupt:
+        callback_workers.stop()
+
+
+@app.cli.command()
+@click.option('--requeue-dead', is_flag=True, help='Retry dead-lettered emails first')
+@click.option('--once', is_flag=True, help='Send the queued emails and exit')
+def email_worker(requeue_dead, once):
+    """Deliver queued emails from the email outbox"""
+    from app.utils.email_outbox import email_outbox
+    if requeue_dead:
+        print(f'Requeued {email_outbox.requeue_dead()} dead email(s).')
+    if once:
+        print(f'Sent {email_outbox.drain()} email(s).')
+        return
+    print('Email worker running, press Ctrl+C to stop.')
+    try:
+        email_outbox.run_forever()
+    except KeyboardInterrupt:
+        email_outbox.stop()
+
+
+@app.cli.command()
+@click.option('--requeue-dead', is_flag=True, help='Retry dead-lettered SMS first')
+@click.option('--once', is_flag=True, help='Send the queued SMS and exit')
+def sms_worker(requeue_dead, once):
+    """Deliver queued SMS from the SMS outbox"""
+    from app.utils.sms_outbox import sms_outbox
+    if requeue_dead:
+        print(f'Requeued {sms_outbox.requeue_dead()} dead SMS.')
+    if once:
+        print(f'Sent {sms_outbox.drain()} SMS.')
+        return
+    print('SMS worker running, press Ctrl+C to stop.')
+    try:
+        sms_outbox.run_forever()
+    except KeyboardInterrupt:
+        sms_outbox.stop()
+
+
+@app.cli.command()
+def recover_ticket_pdf_jobs():
+    """Fail interrupted bulk ticket PDF jobs and run the stale queued ones"""
+    from app.utils.ticket_pdf_jobs import ticket_pdf_jobs
+    
+    job_ids = ticket_pdf_jobs.recover_stale()
+    for job_id in job_ids:
+        ticket_pdf_jobs.run(job_id)
+    print(f'Ran {len(job_ids)} stale ticket PDF job(s).')
+
+
+@app.cli.command()
+@click.option('--hours-before', default=24, show_default=True, help='Remind attendees of events starting in this many hours.')
+@click.option('--chunk-size', default=500, show_default=True, help='Attendees handled per transaction.')
+def send_event_reminders(hours_before, chunk_size):
+    """Send event reminders (run hourly from cron)"""
+    from app.utils.reminders import send_event_reminders as run_reminders
+    
+    result = run_reminders(hours_before, chunk_size=chunk_size)
+    print(f"Sent {result['reminders_sent']} reminder(s) for {result['events_processed']} event(s): "
+          f"{result['sms_queued']} SMS and {result['emails_queued']} email(s) queued.")
+    if result['failed_events']:
+        print(f"Failed events: {', '.join(str(event_id) for event_id in result['failed_events'])}")
+
+
+@app.cli.command()
+def recount_notifications():
+    """Rebuild the unread notification counters from the notifications table"""
+    from app.utils.notification_counters import recount_all
+    
+    print(f'Rebuilt {recount_all()} unread notification counter(s).')
+
+
+@app.cli.command()
+@click.option('--full', is_flag=True, help='Rebuild all rollups from scratch.')
+def refresh_analytics(full):
+    """Refresh the hourly and daily rollups behind the admin charts"""
+    from app.utils.analytics_rollups import refresh
+    
+    ranges = refresh(full=full)
+    print(f'Analytics rollups refreshed ({ranges} range(s) recomputed).')
+
+
+@app.cli.command()
+def rebuild_partner_ledger():
+    """Replay paid bookings and payouts into the partner ledger and reset partner balances"""
+    from app.utils.partner_ledger import rebuild
+
+    print(f'Partner ledger rebuilt ({rebuild()} entries).')
+
+
 @app.cli.command()
 def seed_db():
     """Seed the database with initial data"""
@@ -48,6 +48,42 @@ def create_app(config_name='default'):
     jwt.init_app(app)
     mail.init_app(app)
     
+    # Response cache for public listing endpoints
+    from app.utils.cache import response_cache
+    response_cache.init_app(app)
+    
+    # Release expired ticket reservations in the background (opt-in)
+    from app.utils.reservation_sweeper import reservation_sweeper
+    reservation_sweeper.init_app(app)
+    
+    # Process queued M-Pesa callbacks in worker threads
+    from app.utils.mpesa_inbox import callback_workers
+    callback_workers.init_app(app)
+    
+    # Deliver queued emails in worker threads
+    from app.utils.email_outbox import email_outbox
+    email_outbox.init_app(app)
+    
+    # Deliver queued SMS in worker threads
+    from app.utils.sms_outbox import sms_outbox
+    sms_outbox.init_app(app)
+    
+    # Push new notifications to open Server-Sent Events streams
+    from app.utils.notification_stream import notification_stream
+    notification_stream.init_app(app)
+    
+    # Pre-render new tickets' QR codes after the booking commits
+    from app.utils.qr_pipeline import qr_pipeline
+    qr_pipeline.init_app(app)
+    
+    # Size the cache of finished ticket PDFs
+    from app.utils.ticket_pdf import ticket_pdf_cache
+    ticket_pdf_cache.max_bytes = app.config.get('TICKET_PDF_CACHE_BYTES', 64 * 1024 * 1024)
+    
+    # Run partners' bulk ticket PDF jobs in the background
+    from app.utils.ticket_pdf_jobs import ticket_pdf_jobs
+    ticket_pdf_jobs.init_app(app)
+    
     # Patch Flask-Mail to support timeout (only if email sending is enabled)
     # Flask-Mail doesn't expose timeout directly, so we patch the connection method
     # Note: This is optional since MAIL_SUPPRESS_SEND=True prevents email sending anyway
@@ -1,11 +1,12 @@
 from app.models.user import User
 from app.models.partner import Partner
 from app.models.event import Event, EventHost, EventInterest, EventPromotion
-from app.models.ticket import Ticket, TicketType, Booking, PromoCode
-from app.models.payment import Payment, PartnerPayout
+from app.models.ticket import Ticket, TicketType, Booking, PromoCode, TicketPDFJob
+from app.models.payment import Payment, PartnerPayout, PartnerLedgerEntry, MpesaCallback
 from app.models.category import Category, Location
-from app.models.notification import Notification
+from app.models.notification import Notification, NotificationCounter, OutboundEmail, SMSMessage, EventReminder
 from app.models.admin import AdminLog
+from app.models.analytics import AnalyticsHourly, AnalyticsDaily, AnalyticsRollupState
 from app.models.review import Review
 from app.models.message import Feedback, ContactMessage
 from app.models.rejection_reason import RejectionReason
@@ -21,12 +22,22 @@ __all__ = [
     'TicketType',
     'Booking',
     'PromoCode',
+    'TicketPDFJob',
     'Payment',
     'PartnerPayout',
+    'PartnerLedgerEntry',
+    'MpesaCallback',
     'Category',
     'Location',
     'Notification',
+    'NotificationCounter',
+    'OutboundEmail',
+    'SMSMessage',
+    'EventReminder',
     'AdminLog',
+    'AnalyticsHourly',
+    'AnalyticsDaily',
+    'AnalyticsRollupState',
     'Review',
     'Feedback',
     'ContactMessage',
@@ -0,0 +1,31 @@
+from datetime import datetime
+from app import db
+
+
+class AnalyticsHourly(db.Model):
+    """Hourly totals per metric, maintained by app/utils/analytics_rollups.py"""
+    __tablename__ = 'analytics_hourly'
+
+    metric = db.Column(db.String(50), primary_key=True)  # users, partners, events, bookings, revenue, platform_fees, ...
+    bucket = db.Column(db.DateTime, primary_key=True)  # Start of the hour (UTC)
+    count = db.Column(db.Integer, default=0, nullable=False)
+    amount = db.Column(db.Numeric(14, 2), default=0, nullable=False)
+
+
+class AnalyticsDaily(db.Model):
+    """Daily totals per metric, summed from analytics_hourly"""
+    __tablename__ = 'analytics_daily'
+
+    metric = db.Column(db.String(50), primary_key=True)
+    bucket = db.Column(db.Date, primary_key=True)
+    count = db.Column(db.Integer, default=0, nullable=False)
+    amount = db.Column(db.Numeric(14, 2), default=0, nullable=False)
+
+
+class AnalyticsRollupState(db.Model):
+    """When the rollups were last refreshed"""
+    __tablename__ = 'analytics_rollup_state'
+
+    name = db.Column(db.String(50), primary_key=True)
+    refreshed_at = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -70,6 +70,35 @@ class Event(db.Model):
     
     def to_dict(self, include_stats=False):
         """Convert event to dictionary"""
+        stats = None
+        if include_stats:
+            # Add bucketlist count (likes) - query the bucketlist table directly
+            from app.models.user import bucketlist
+            from sqlalchemy import func
+            bucketlist_count = db.session.query(func.count(bucketlist.c.user_id)).filter(
+                bucketlist.c.event_id == self.id
+            ).scalar() or 0
+            # Add actual bookings count (people going) - kept for backward compatibility
+            bookings_count = self.bookings.filter_by(status='confirmed').count()
+            stats = {
+                'bucketlist_count': bucketlist_count,
+                'bookings_count': bookings_count
+            }
+        
+        return self.build_dict(
+            hosts=list(self.hosts),
+            interests=list(self.interests),
+            ticket_types=list(self.ticket_types),
+            promo_codes=list(self.promo_codes),
+            stats=stats
+        )
+    
+    def build_dict(self, hosts, interests, ticket_types, promo_codes, stats=None):
+        """Serialize event from already-loaded relations.
+        
+        Used by to_dict() and by app.utils.serializers.serialize_events(), which
+        loads the dynamic relations for a whole page of events in bulk.
+        """
         # Filter out base64 data URIs from poster_image (they shouldn't be in DB, but handle if they are)
         poster_image = self.poster_image
         if poster_image and poster_image.startswith('data:image'):
@@ -81,7 +110,7 @@ class Event(db.Model):
         total_tickets_available = 0
         has_limited_tickets = False
         
-        for ticket_type in self.ticket_types:
+        for ticket_type in ticket_types:
             if ticket_type.quantity_available is not None:
                 has_limited_tickets = True
                 total_tickets_available += ticket_type.quantity_available
@@ -112,29 +141,21 @@ class Event(db.Model):
             'is_featured': self.is_featured,
             'created_at': self.created_at.isoformat(),
             'published_at': self.published_at.isoformat() if self.published_at else None,
-            'hosts': [host.to_dict() for host in self.hosts],
-            'interests': [interest.name for interest in self.interests],
-            'ticket_types': [tt.to_dict() for tt in self.ticket_types],
-            'promo_codes': [pc.to_dict() for pc in self.promo_codes],
+            'hosts': [host.to_dict() for host in hosts],
+            'interests': [interest.name for interest in interests],
+            'ticket_types': [tt.to_dict() for tt in ticket_types],
+            'promo_codes': [pc.to_dict() for pc in promo_codes],
             # Always include attendee_count (total tickets sold, not number of bookings)
             'attendee_count': self.attendee_count,
             'tickets_left': tickets_left  # None means unlimited tickets
         }
         
-        if include_stats:
+        if stats is not None:
             data['view_count'] = self.view_count
             data['total_tickets_sold'] = self.total_tickets_sold
             data['revenue'] = float(self.revenue)
-            # Add bucketlist count (likes) - query the bucketlist table directly
-            from app.models.user import bucketlist
-            from sqlalchemy import func
-            bucketlist_count = db.session.query(func.count(bucketlist.c.user_id)).filter(
-                bucketlist.c.event_id == self.id
-            ).scalar() or 0
-            data['bucketlist_count'] = bucketlist_count
-            # Add actual bookings count (people going) - kept for backward compatibility
-            bookings_count = self.bookings.filter_by(status='confirmed').count()
-            data['bookings_count'] = bookings_count
+            data['bucketlist_count'] = stats.get('bucketlist_count', 0)
+            data['bookings_count'] = stats.get('bookings_count', 0)
             
         return data
     
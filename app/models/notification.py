@@ -37,6 +37,13 @@ class Notification(db.Model):
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     
+    __table_args__ = (
+        # Recipient list and unread-only queries, newest first
+        db.Index('ix_notifications_user_read_created', 'user_id', 'is_read', 'created_at'),
+        db.Index('ix_notifications_partner_read_created', 'partner_id', 'is_read', 'created_at'),
+        db.Index('ix_notifications_admin_read_created', 'admin_id', 'is_read', 'created_at'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -52,3 +59,118 @@ class Notification(db.Model):
             'created_at': self.created_at.isoformat()
         }
 
+
+class NotificationCounter(db.Model):
+    """Unread notifications per recipient, kept in step by app/utils/notification_counters.py"""
+    __tablename__ = 'notification_counters'
+    
+    recipient_type = db.Column(db.String(10), primary_key=True)  # user, partner, admin
+    recipient_id = db.Column(db.Integer, primary_key=True)
+    unread_count = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class OutboundEmail(db.Model):
+    """Email outbox, delivered by the email workers (app/utils/email_outbox.py)"""
+    __tablename__ = 'email_outbox'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    
+    # Message
+    sender = db.Column(db.String(255), nullable=True)  # Defaults to MAIL_DEFAULT_SENDER
+    recipients = db.Column(db.JSON, nullable=False)
+    subject = db.Column(db.String(500), nullable=False)
+    html_body = db.Column(db.Text, nullable=True)
+    text_body = db.Column(db.Text, nullable=True)
+    # Recipient domain, used to pace delivery per mail provider
+    domain = db.Column(db.String(255), nullable=True)
+    
+    # Delivery
+    status = db.Column(db.String(20), default='pending', nullable=False)  # pending, sending, sent, failed, dead
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    last_error = db.Column(db.Text, nullable=True)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    locked_until = db.Column(db.DateTime, nullable=True)  # Lease held by the worker sending it
+    claimed_by = db.Column(db.String(36), nullable=True)
+    
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (
+        db.Index('ix_email_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'recipients': self.recipients,
+            'subject': self.subject,
+            'status': self.status,
+            'attempts': self.attempts,
+            'last_error': self.last_error,
+            'next_attempt_at': self.next_attempt_at.isoformat() if self.next_attempt_at else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'sent_at': self.sent_at.isoformat() if self.sent_at else None
+        }
+
+
+class SMSMessage(db.Model):
+    """SMS outbox with per-message delivery results (app/utils/sms_outbox.py)"""
+    __tablename__ = 'sms_outbox'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    
+    # Message
+    phone_number = db.Column(db.String(20), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    
+    # Delivery
+    status = db.Column(db.String(20), default='pending', nullable=False)  # pending, sending, sent, failed, dead
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    locked_until = db.Column(db.DateTime, nullable=True)  # Lease held by the worker sending it
+    claimed_by = db.Column(db.String(36), nullable=True)
+    
+    # Provider result
+    provider_message_id = db.Column(db.String(100), nullable=True)
+    response_code = db.Column(db.Integer, nullable=True)
+    response_description = db.Column(db.String(255), nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (
+        db.Index('ix_sms_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'phone_number': self.phone_number,
+            'status': self.status,
+            'attempts': self.attempts,
+            'provider_message_id': self.provider_message_id,
+            'response_code': self.response_code,
+            'response_description': self.response_description,
+            'last_error': self.last_error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'sent_at': self.sent_at.isoformat() if self.sent_at else None
+        }
+
+
+class EventReminder(db.Model):
+    """Reminders already sent, so the reminder job can be rerun safely (app/utils/reminders.py)"""
+    __tablename__ = 'event_reminders'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    event_id = db.Column(db.Integer, db.ForeignKey('events.id', ondelete='CASCADE'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    hours_before = db.Column(db.Integer, nullable=False)
+    sent_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('event_id', 'user_id', 'hours_before', name='unique_event_user_reminder'),
+    )
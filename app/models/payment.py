@@ -1,4 +1,5 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+from flask import current_app
 from app import db
 
 
@@ -29,6 +30,7 @@ class Payment(db.Model):
     # MPesa Details
     mpesa_receipt_number = db.Column(db.String(100), nullable=True)
     phone_number = db.Column(db.String(20), nullable=True)
+    checkout_request_id = db.Column(db.String(100), unique=True, nullable=True, index=True)  # STK push CheckoutRequestID
     
     # Status
     status = db.Column(db.String(20), default='pending')  # pending, completed, failed, refunded
@@ -44,9 +46,44 @@ class Payment(db.Model):
     
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
-    completed_at = db.Column(db.DateTime, nullable=True)
+    completed_at = db.Column(db.DateTime, nullable=True, index=True)
     failed_at = db.Column(db.DateTime, nullable=True)
     
+    @classmethod
+    def find_by_checkout_request_id(cls, checkout_request_id):
+        """Find a payment by its STK push CheckoutRequestID
+        
+        Uses the indexed checkout_request_id column. Payments created before
+        the column existed and not yet backfilled (see
+        `flask backfill_checkout_request_ids`) can only still be pending:
+        those created in the last MPESA_LEGACY_LOOKUP_HOURS hours (0 turns
+        the fallback off) are checked against payment_metadata, at most
+        MPESA_LEGACY_LOOKUP_LIMIT of them, and the column is filled in when
+        one matches.
+        """
+        payment = cls.query.filter_by(checkout_request_id=checkout_request_id).first()
+        if payment or not checkout_request_id:
+            return payment
+        
+        hours = current_app.config.get('MPESA_LEGACY_LOOKUP_HOURS', 24)
+        if not hours:
+            return None
+        legacy = cls.query.filter(
+            cls.checkout_request_id.is_(None),
+            cls.status == 'pending',
+            cls.payment_metadata.isnot(None),
+            cls.created_at >= datetime.utcnow() - timedelta(hours=hours)
+        ).order_by(cls.created_at.desc()).limit(
+            current_app.config.get('MPESA_LEGACY_LOOKUP_LIMIT', 100)
+        ).all()
+        payment = next(
+            (p for p in legacy if p.payment_metadata.get('CheckoutRequestID') == checkout_request_id),
+            None
+        )
+        if payment:
+            payment.checkout_request_id = checkout_request_id
+        return payment
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -95,9 +132,9 @@ class PartnerPayout(db.Model):
     rejection_reason = db.Column(db.Text, nullable=True)
     
     # Timestamps
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     processed_at = db.Column(db.DateTime, nullable=True)
-    completed_at = db.Column(db.DateTime, nullable=True)
+    completed_at = db.Column(db.DateTime, nullable=True, index=True)
     
     def to_dict(self):
         return {
@@ -112,3 +149,83 @@ class PartnerPayout(db.Model):
             'completed_at': self.completed_at.isoformat() if self.completed_at else None
         }
 
+
+
+class PartnerLedgerEntry(db.Model):
+    """Append-only record of every change to a partner's earnings, maintained by app/utils/partner_ledger.py"""
+    __tablename__ = 'partner_ledger'
+    __table_args__ = (
+        db.UniqueConstraint('entry_type', 'booking_id', name='unique_ledger_booking_entry'),
+        db.UniqueConstraint('entry_type', 'payout_id', name='unique_ledger_payout_entry'),
+        db.Index('ix_partner_ledger_partner_created', 'partner_id', 'created_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    partner_id = db.Column(db.Integer, db.ForeignKey('partners.id', ondelete='CASCADE'), nullable=False)
+    entry_type = db.Column(db.String(20), nullable=False)  # ticket_sale, refund, payout, fee
+    amount = db.Column(db.Numeric(12, 2), nullable=False)  # Change to the available balance (negative for debits)
+    
+    # Partner balances right after this entry
+    balance_after = db.Column(db.Numeric(12, 2), nullable=False)  # pending_earnings
+    earned_after = db.Column(db.Numeric(12, 2), nullable=False)  # total_earnings
+    withdrawn_after = db.Column(db.Numeric(12, 2), nullable=False)  # withdrawn_earnings
+    
+    # What the entry is for
+    booking_id = db.Column(db.Integer, db.ForeignKey('bookings.id', ondelete='SET NULL'), nullable=True)
+    payment_id = db.Column(db.Integer, db.ForeignKey('payments.id', ondelete='SET NULL'), nullable=True)
+    payout_id = db.Column(db.Integer, db.ForeignKey('partner_payouts.id', ondelete='SET NULL'), nullable=True)
+    description = db.Column(db.String(255), nullable=True)
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'entry_type': self.entry_type,
+            'amount': float(self.amount),
+            'balance_after': float(self.balance_after),
+            'earned_after': float(self.earned_after),
+            'withdrawn_after': float(self.withdrawn_after),
+            'booking_id': self.booking_id,
+            'payment_id': self.payment_id,
+            'payout_id': self.payout_id,
+            'description': self.description,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+
+class MpesaCallback(db.Model):
+    """Inbox of raw M-Pesa STK callbacks, processed asynchronously"""
+    __tablename__ = 'mpesa_callbacks'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    # Idempotency key: Safaricom may deliver the same callback more than once
+    checkout_request_id = db.Column(db.String(100), unique=True, nullable=False, index=True)
+    result_code = db.Column(db.Integer, nullable=True)
+    payload = db.Column(db.JSON, nullable=False)
+    
+    # Processing
+    status = db.Column(db.String(20), default='pending', nullable=False, index=True)  # pending, processing, processed, failed, dead
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    outcome = db.Column(db.String(20), nullable=True)  # completed, failed, pending, duplicate
+    last_error = db.Column(db.Text, nullable=True)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    locked_until = db.Column(db.DateTime, nullable=True)  # Lease held by the worker processing it
+    
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime, nullable=True)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'checkout_request_id': self.checkout_request_id,
+            'result_code': self.result_code,
+            'status': self.status,
+            'attempts': self.attempts,
+            'outcome': self.outcome,
+            'last_error': self.last_error,
+            'next_attempt_at': self.next_attempt_at.isoformat() if self.next_attempt_at else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'processed_at': self.processed_at.isoformat() if self.processed_at else None
+        }
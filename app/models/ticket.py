@@ -17,7 +17,8 @@ class TicketType(db.Model):
     # Availability
     quantity_total = db.Column(db.Integer, nullable=True)  # None = unlimited
     quantity_sold = db.Column(db.Integer, default=0)
-    quantity_available = db.Column(db.Integer, nullable=True)
+    quantity_available = db.Column(db.Integer, nullable=True)  # Unsold tickets (total - sold)
+    quantity_reserved = db.Column(db.Integer, default=0, nullable=False)  # Held by pending bookings
     
     # Sales Period
     sales_start = db.Column(db.DateTime, nullable=True)
@@ -40,6 +41,7 @@ class TicketType(db.Model):
             'quantity_total': self.quantity_total,
             'quantity_sold': self.quantity_sold,
             'quantity_available': self.quantity_available,
+            'quantity_reserved': self.quantity_reserved,
             'sales_start': self.sales_start.isoformat() if self.sales_start else None,
             'sales_end': self.sales_end.isoformat() if self.sales_end else None,
             'is_active': self.is_active,
@@ -59,6 +61,7 @@ class Booking(db.Model):
     # References
     user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     event_id = db.Column(db.Integer, db.ForeignKey('events.id', ondelete='CASCADE'), nullable=False)
+    ticket_type_id = db.Column(db.Integer, db.ForeignKey('ticket_types.id'), nullable=True)  # Ticket type held for this booking
     
     # Booking Details
     quantity = db.Column(db.Integer, default=1)
@@ -82,8 +85,8 @@ class Booking(db.Model):
     
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
-    confirmed_at = db.Column(db.DateTime, nullable=True)
-    cancelled_at = db.Column(db.DateTime, nullable=True)
+    confirmed_at = db.Column(db.DateTime, nullable=True, index=True)
+    cancelled_at = db.Column(db.DateTime, nullable=True, index=True)
     reserved_until = db.Column(db.DateTime, nullable=True, index=True)  # When reservation expires (5 minutes for payment)
     
     # Relationships
@@ -91,6 +94,11 @@ class Booking(db.Model):
     payment = db.relationship('Payment', backref='booking', foreign_keys=[payment_id])
     promo_code = db.relationship('PromoCode', backref='bookings')
     
+    __table_args__ = (
+        # Attendee lists: an event's confirmed bookings, newest first (keyset on created_at, id)
+        db.Index('ix_bookings_event_status_created', 'event_id', 'status', 'created_at', 'id'),
+    )
+    
     def __init__(self, **kwargs):
         super(Booking, self).__init__(**kwargs)
         if not self.booking_number:
@@ -158,7 +166,7 @@ class Ticket(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     ticket_number = db.Column(db.String(50), unique=True, nullable=False, index=True)
-    qr_code = db.Column(db.String(500), nullable=True)  # Path to QR code image
+    qr_code = db.Column(db.String(500), nullable=True)  # URL of the QR code image endpoint
     
     # References
     booking_id = db.Column(db.Integer, db.ForeignKey('bookings.id', ondelete='CASCADE'), nullable=False)
@@ -239,3 +247,47 @@ class PromoCode(db.Model):
             'is_active': self.is_active
         }
 
+
+
+class TicketPDFJob(db.Model):
+    """Bulk ticket PDF job: every confirmed booking of an event (app/utils/ticket_pdf_jobs.py)"""
+    __tablename__ = 'ticket_pdf_jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    partner_id = db.Column(db.Integer, db.ForeignKey('partners.id', ondelete='CASCADE'), nullable=False, index=True)
+    event_id = db.Column(db.Integer, db.ForeignKey('events.id', ondelete='CASCADE'), nullable=False)
+    output_format = db.Column(db.String(10), nullable=False)  # pdf (one merged document), zip (one PDF per booking)
+    
+    # Progress
+    status = db.Column(db.String(20), default='pending', nullable=False)  # pending, running, completed, failed
+    total_bookings = db.Column(db.Integer, default=0, nullable=False)
+    processed_bookings = db.Column(db.Integer, default=0, nullable=False)
+    error = db.Column(db.Text, nullable=True)
+    
+    # Result (blob URL or /uploads path, under an unguessable name)
+    file_location = db.Column(db.String(500), nullable=True)
+    file_size = db.Column(db.Integer, nullable=True)
+    
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'event_id': self.event_id,
+            'format': self.output_format,
+            'status': self.status,
+            'total_bookings': self.total_bookings,
+            'processed_bookings': self.processed_bookings,
+            'progress': round(100 * self.processed_bookings / self.total_bookings) if self.total_bookings else (
+                100 if self.status == 'completed' else 0
+            ),
+            'error': self.error,
+            'file_size': self.file_size,
+            'download_url': f'/api/partners/ticket-pdf-jobs/{self.id}/download' if self.status == 'completed' else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None
+        }
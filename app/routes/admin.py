@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify, current_app
 from datetime import datetime, timedelta
 from sqlalchemy import func, desc
+from sqlalchemy.orm import joinedload
 from app import db, limiter
 from app.models.user import User
 from app.models.partner import Partner, PartnerSupportRequest
@@ -11,6 +12,10 @@ from app.models.category import Category, Location
 from app.models.admin import AdminLog
 from app.models.message import Feedback, ContactMessage
 from app.utils.decorators import admin_required
+from app.utils.serializers import serialize_events
+from app.utils.cache import cached_response, invalidate_event_listings, invalidate_locations, invalidate_admin_dashboard
+from app.utils import analytics_rollups as rollups
+from app.utils import dashboard_stats, partner_ledger
 from app.utils.email import send_partner_approval_email, send_event_approval_email, send_partner_suspension_email, send_partner_activation_email, send_payout_approval_email, send_email
 from app.routes.notifications import notify_event_approved, notify_event_rejected, notify_partner_approved, notify_partner_rejected
 from app.utils.sms import send_partner_suspension_sms, send_partner_activation_sms, send_payout_approval_sms
@@ -37,148 +42,20 @@ def log_admin_action(admin, action, resource_type, resource_id, description=None
 @bp.route('/dashboard', methods=['GET'])
 @limiter.exempt
 @admin_required
+@cached_response('admin.dashboard', ttl=30)
 def get_dashboard(current_admin):
     """Get admin dashboard overview"""
     try:
-        # Get stats
-        total_users = User.query.count()
-        total_partners = Partner.query.filter_by(status='approved').count()
-        total_events = Event.query.filter_by(status='approved').count()
-        total_bookings = Booking.query.count()
-        
-        # Pending approvals - get details
-        pending_partners_list = Partner.query.filter_by(status='pending').order_by(Partner.created_at.desc()).limit(5).all()
-        pending_events_list = Event.query.filter_by(status='pending').order_by(Event.created_at.desc()).limit(5).all()
-        
-        pending_partners_count = Partner.query.filter_by(status='pending').count()
-        pending_events_count = Event.query.filter_by(status='pending').count()
-        
-        # Revenue
-        total_revenue = db.session.query(func.sum(Payment.amount)).filter(
-            Payment.status == 'completed'
-        ).scalar() or 0
-        
-        # Platform fees (7% commission from ticket payments)
-        platform_fees = db.session.query(func.sum(Payment.platform_fee)).filter(
-            Payment.status == 'completed',
-            Payment.payment_type == 'ticket'  # Only from ticket sales
-        ).scalar() or 0
-        
-        # Withdrawal fees revenue (from completed payouts)
-        from app.models.payment import PartnerPayout
-        try:
-            withdrawal_fees_revenue = db.session.query(func.sum(PartnerPayout.withdrawal_fee)).filter(
-                PartnerPayout.status == 'completed'
-            ).scalar() or 0
-        except Exception as e:
-            # If column doesn't exist yet, return 0
-            current_app.logger.warning(f'withdrawal_fee column may not exist: {str(e)}')
-            withdrawal_fees_revenue = 0
-        
-        # Promotion payments revenue (all promotion payments)
-        promotion_revenue = db.session.query(func.sum(Payment.amount)).filter(
-            Payment.status == 'completed',
-            Payment.payment_type == 'promotion'
-        ).scalar() or 0
-        
-        # Recent activity - get recent users, partners, events
-        recent_users = User.query.order_by(User.created_at.desc()).limit(5).all()
-        recent_partners = Partner.query.order_by(Partner.created_at.desc()).limit(5).all()
-        recent_events = Event.query.order_by(Event.created_at.desc()).limit(5).all()
-        
         # Recent admin activity logs
         recent_admin_logs = AdminLog.query.order_by(AdminLog.created_at.desc()).limit(10).all()
-        
-        # Calculate month-over-month changes (simplified - last 30 days vs previous 30 days)
-        from datetime import timedelta
-        thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-        sixty_days_ago = datetime.utcnow() - timedelta(days=60)
-        
-        users_this_month = User.query.filter(User.created_at >= thirty_days_ago).count()
-        users_last_month = User.query.filter(
-            User.created_at >= sixty_days_ago,
-            User.created_at < thirty_days_ago
-        ).count()
-        users_change = ((users_this_month - users_last_month) / users_last_month * 100) if users_last_month > 0 else 0
-        
-        partners_this_month = Partner.query.filter(
-            Partner.created_at >= thirty_days_ago,
-            Partner.status == 'approved'
-        ).count()
-        partners_last_month = Partner.query.filter(
-            Partner.created_at >= sixty_days_ago,
-            Partner.created_at < thirty_days_ago,
-            Partner.status == 'approved'
-        ).count()
-        partners_change = ((partners_this_month - partners_last_month) / partners_last_month * 100) if partners_last_month > 0 else 0
-        
-        events_this_month = Event.query.filter(
-            Event.created_at >= thirty_days_ago,
-            Event.status == 'approved'
-        ).count()
-        events_last_month = Event.query.filter(
-            Event.created_at >= sixty_days_ago,
-            Event.created_at < thirty_days_ago,
-            Event.status == 'approved'
-        ).count()
-        events_change = events_this_month - events_last_month
-        
-        # Safely get category and partner names
-        pending_partners_data = []
-        for p in pending_partners_list:
-            try:
-                category_name = p.category.name if p.category else 'N/A'
-            except:
-                category_name = 'N/A'
-            pending_partners_data.append({
-                'id': p.id,
-                'name': p.business_name,
-                'email': p.email,
-                'category': category_name,
-                'submittedDate': p.created_at.isoformat() if p.created_at else '',
-                'status': p.status
-            })
-        
-        pending_events_data = []
-        for e in pending_events_list:
-            try:
-                partner_name = e.organizer.business_name if e.organizer else 'N/A'
-            except:
-                partner_name = 'N/A'
-            try:
-                category_name = e.category.name if e.category else 'N/A'
-            except:
-                category_name = 'N/A'
-            pending_events_data.append({
-                'id': e.id,
-                'title': e.title,
-                'partner': partner_name,
-                'category': category_name,
-                'date': e.start_date.isoformat() if e.start_date else None,
-                'status': e.status
-            })
-        
+
         response = jsonify({
-            'stats': {
-                'total_users': total_users,
-                'total_partners': total_partners,
-                'total_events': total_events,
-                'total_bookings': total_bookings,
-                'pending_partners': pending_partners_count,
-                'pending_events': pending_events_count,
-                'total_revenue': float(total_revenue),
-                'platform_fees': float(platform_fees),
-                'withdrawal_fees': float(withdrawal_fees_revenue),
-                'promotion_revenue': float(promotion_revenue),
-                'users_change': round(users_change, 1),
-                'partners_change': round(partners_change, 1),
-                'events_change': events_change
-            },
-            'pending_partners': pending_partners_data,
-            'pending_events': pending_events_data,
-            'recent_users': [user.to_dict() for user in recent_users],
-            'recent_partners': [partner.to_dict() for partner in recent_partners],
-            'recent_events': [event.to_dict() for event in recent_events],
+            'stats': dashboard_stats.collect_stats(),
+            'pending_partners': dashboard_stats.pending_partners(),
+            'pending_events': dashboard_stats.pending_events(),
+            'recent_users': dashboard_stats.recent_users(),
+            'recent_partners': dashboard_stats.recent_partners(),
+            'recent_events': dashboard_stats.recent_events(),
             'recent_activity': [log.to_dict() for log in recent_admin_logs]
         })
         return response, 200
@@ -390,6 +267,9 @@ def resend_partner_credentials(current_admin, partner_id):
                     error_msg = f'Failed to send credentials SMS: {str(notify_error)}'
                     print(f"❌ {error_msg}")
                     current_app.logger.warning(error_msg)
+                
+                # Queued email and SMS are only sent once committed
+                db.session.commit()
         
         # Start background thread
         thread = Thread(target=send_credentials_async)
@@ -458,6 +338,7 @@ def approve_partner(current_admin, partner_id):
         )
         
         db.session.commit()
+        invalidate_admin_dashboard()
         
         # Prepare response first (return immediately to user)
         response = jsonify({
@@ -611,6 +492,7 @@ def reject_partner(current_admin, partner_id):
     )
     
     db.session.commit()
+    invalidate_admin_dashboard()
     
     # Send rejection email (includes reason and internal note)
     send_partner_approval_email(partner, approved=False, rejection_reason=rejection_reason, internal_note=internal_note)
@@ -672,6 +554,7 @@ def unreject_partner(current_admin, partner_id):
     # Delete the partner record (cascade will handle events, payouts, support_requests, team_members, notifications)
     db.session.delete(partner)
     db.session.commit()
+    invalidate_admin_dashboard()
     
     # Create a temporary partner object for email/SMS (without saving to DB)
     class TempPartner:
@@ -726,6 +609,7 @@ def suspend_partner(current_admin, partner_id):
     )
     
     db.session.commit()
+    invalidate_admin_dashboard()
     
     # Send suspension SMS and email to partner
     reason = data.get('reason')
@@ -766,6 +650,7 @@ def activate_partner(current_admin, partner_id):
     )
     
     db.session.commit()
+    invalidate_admin_dashboard()
     
     # Send activation SMS and email to partner
     try:
@@ -838,16 +723,22 @@ def get_events(current_admin):
     from datetime import datetime
     now = datetime.utcnow()
     
-    events_data = []
-    for event in events.items:
-        event_dict = event.to_dict(include_stats=True)
-        # Check if event has an active promotion
-        active_promotion = EventPromotion.query.filter(
-            EventPromotion.event_id == event.id,
+    # Active promotions for the whole page in one query
+    active_promotions = {}
+    page_event_ids = [event.id for event in events.items]
+    if page_event_ids:
+        for promo in EventPromotion.query.filter(
+            EventPromotion.event_id.in_(page_event_ids),
             EventPromotion.is_active == True,
             EventPromotion.start_date <= now,
             EventPromotion.end_date >= now
-        ).first()
+        ).order_by(EventPromotion.id).all():
+            active_promotions.setdefault(promo.event_id, promo)
+    
+    events_data = []
+    for event, event_dict in zip(events.items, serialize_events(events.items, include_stats=True)):
+        # Check if event has an active promotion
+        active_promotion = active_promotions.get(event.id)
         
         event_dict['is_promoted'] = active_promotion is not None
         if active_promotion:
@@ -891,6 +782,10 @@ def approve_event(current_admin, event_id):
     
     db.session.commit()
     
+    # Public event listings changed
+    invalidate_event_listings()
+    invalidate_admin_dashboard()
+    
     # Send approval email
     send_event_approval_email(event, approved=True)
     
@@ -930,6 +825,10 @@ def reject_event(current_admin, event_id):
     
     db.session.commit()
     
+    # Public event listings changed
+    invalidate_event_listings()
+    invalidate_admin_dashboard()
+    
     # Send rejection email
     send_event_approval_email(event, approved=False)
     
@@ -964,6 +863,9 @@ def feature_event(current_admin, event_id):
     
     db.session.commit()
     
+    # Public event listings changed
+    invalidate_event_listings()
+    
     return jsonify({
         'message': 'Event featured successfully'
     }), 200
@@ -1046,6 +948,9 @@ def promote_event(current_admin, event_id):
     
     db.session.commit()
     
+    # Public event listings changed
+    invalidate_event_listings()
+    
     return jsonify({
         'message': 'Event promoted successfully',
         'promotion': promotion.to_dict()
@@ -1089,6 +994,9 @@ def unpromote_event(current_admin, event_id):
     
     db.session.commit()
     
+    # Public event listings changed
+    invalidate_event_listings()
+    
     return jsonify({
         'message': 'Promotion removed successfully'
     }), 200
@@ -1101,24 +1009,22 @@ def get_promoted_events(current_admin):
     from app.models.event import EventPromotion
     
     # Get all promotions (active and inactive)
-    promotions = EventPromotion.query.order_by(EventPromotion.created_at.desc()).all()
+    promotions = EventPromotion.query.options(
+        joinedload(EventPromotion.event)
+    ).order_by(EventPromotion.created_at.desc()).all()
+    promotions = [promo for promo in promotions if promo.event]
     
     now = datetime.utcnow()
     promotions_data = []
     
-    for promo in promotions:
-        event = promo.event
-        if not event:
-            continue
-            
+    event_dicts = serialize_events([promo.event for promo in promotions], include_stats=True)
+    for promo, event_dict in zip(promotions, event_dicts):
         # Calculate promotion status
         is_active_now = (
             promo.is_active and 
             promo.start_date <= now <= promo.end_date
         )
         
-        event_dict = event.to_dict(include_stats=True) if event else {}
-        
         promotion_dict = {
             'id': promo.id,
             'event_id': promo.event_id,
@@ -1357,6 +1263,7 @@ def delete_user(current_admin, user_id):
             f"Deleted user: {user_email}"
         )
         db.session.commit()
+        invalidate_admin_dashboard()
         
         current_app.logger.info(f'User deleted by admin: {user_email} (ID: {user_id_val})')
         
@@ -1420,6 +1327,9 @@ def create_category(current_admin):
     
     db.session.commit()
     
+    # Public event listings changed
+    invalidate_event_listings()
+    
     return jsonify({
         'message': 'Category created successfully',
         'category': category.to_dict()
@@ -1465,6 +1375,15 @@ def update_category(current_admin, category_id):
     
     db.session.commit()
     
+    # Public event listings changed
+    invalidate_event_listings()
+    
+    # Category names are part of the event search index
+    if data.get('name'):
+        from app.utils.search import search_enabled, rebuild_search_index
+        if search_enabled():
+            rebuild_search_index(category_id=category_id)
+    
     return jsonify({
         'message': 'Category updated successfully',
         'category': category.to_dict()
@@ -1520,6 +1439,8 @@ def create_location(current_admin):
     
     db.session.commit()
     
+    invalidate_locations()
+    
     return jsonify({
         'message': 'Location created successfully',
         'location': location.to_dict()
@@ -1622,59 +1543,12 @@ def get_chart_data(current_admin):
         start_date = None
         group_by = 'month'
     
-    # Helper function to format date for grouping
-    def format_date_for_group(date_obj, group_type):
-        if group_type == 'hour':
-            return date_obj.strftime('%Y-%m-%d %H:00')
-        elif group_type == 'day':
-            return date_obj.strftime('%Y-%m-%d')
-        elif group_type == 'month':
-            return date_obj.strftime('%Y-%m')
-        return date_obj.strftime('%Y-%m-%d')
-    
-    # Events data
-    events_query = Event.query
-    if start_date:
-        events_query = events_query.filter(Event.created_at >= start_date)
-    events = events_query.all()
-    
-    events_data = {}
-    for event in events:
-        key = format_date_for_group(event.created_at, group_by)
-        events_data[key] = events_data.get(key, 0) + 1
-    
-    # Partners data
-    partners_query = Partner.query
-    if start_date:
-        partners_query = partners_query.filter(Partner.created_at >= start_date)
-    partners = partners_query.all()
-    
-    partners_data = {}
-    for partner in partners:
-        key = format_date_for_group(partner.created_at, group_by)
-        partners_data[key] = partners_data.get(key, 0) + 1
-    
-    # Users data
-    users_query = User.query
-    if start_date:
-        users_query = users_query.filter(User.created_at >= start_date)
-    users = users_query.all()
-    
-    users_data = {}
-    for user in users:
-        key = format_date_for_group(user.created_at, group_by)
-        users_data[key] = users_data.get(key, 0) + 1
-    
-    # Revenue data
-    revenue_query = Payment.query.filter(Payment.status == 'completed')
-    if start_date:
-        revenue_query = revenue_query.filter(Payment.created_at >= start_date)
-    payments = revenue_query.all()
-    
-    revenue_data = {}
-    for payment in payments:
-        key = format_date_for_group(payment.created_at, group_by)
-        revenue_data[key] = revenue_data.get(key, 0) + float(payment.amount)
+    # Bucketed counts and revenue come from the rollup tables
+    rollups.refresh_if_stale()
+    events_data = rollups.series('events', group_by, start_date)
+    partners_data = rollups.series('partners', group_by, start_date)
+    users_data = rollups.series('users', group_by, start_date)
+    revenue_data = rollups.series('revenue', group_by, start_date)
     
     # Convert to sorted arrays with filled dates
     def create_chart_data(data_dict, group_type, start_dt=None, end_dt=None):
@@ -1762,13 +1636,8 @@ def get_chart_data(current_admin):
         start_date_for_fill = now - timedelta(days=30)
     else:  # all_time
         # For all_time, get the earliest event/partner/user date
-        earliest_event = db.session.query(func.min(Event.created_at)).scalar()
-        earliest_partner = db.session.query(func.min(Partner.created_at)).scalar()
-        earliest_user = db.session.query(func.min(User.created_at)).scalar()
-        
-        earliest_dates = [d for d in [earliest_event, earliest_partner, earliest_user] if d is not None]
-        if earliest_dates:
-            start_date_for_fill = min(earliest_dates)
+        start_date_for_fill = rollups.earliest('events', 'partners', 'users')
+        if start_date_for_fill:
             # Round down to first of month
             start_date_for_fill = datetime(start_date_for_fill.year, start_date_for_fill.month, 1)
         else:
@@ -1810,59 +1679,11 @@ def get_revenue_chart_data(current_admin):
         start_date = None
         group_by = 'month'
     
-    # Helper function to format date for grouping
-    def format_date_for_group(date_obj, group_type):
-        if group_type == 'hour':
-            return date_obj.strftime('%Y-%m-%d %H:00')
-        elif group_type == 'day':
-            return date_obj.strftime('%Y-%m-%d')
-        elif group_type == 'month':
-            return date_obj.strftime('%Y-%m')
-        return date_obj.strftime('%Y-%m-%d')
-    
-    revenue_data = {}
-    
-    if revenue_type == 'platform_fees':
-        # Platform fees from ticket payments
-        query = Payment.query.filter(
-            Payment.status == 'completed',
-            Payment.payment_type == 'ticket'
-        )
-        if start_date:
-            query = query.filter(Payment.created_at >= start_date)
-        payments = query.all()
-        
-        for payment in payments:
-            key = format_date_for_group(payment.created_at, group_by)
-            revenue_data[key] = revenue_data.get(key, 0) + float(payment.platform_fee)
-    
-    elif revenue_type == 'withdrawal_fees':
-        # Withdrawal fees from completed payouts
-        from app.models.payment import PartnerPayout
-        query = PartnerPayout.query.filter(PartnerPayout.status == 'completed')
-        if start_date:
-            query = query.filter(PartnerPayout.created_at >= start_date)
-        payouts = query.all()
-        
-        for payout in payouts:
-            key = format_date_for_group(payout.created_at, group_by)
-            # Handle case where withdrawal_fee might not exist
-            fee = getattr(payout, 'withdrawal_fee', 0) or 0
-            revenue_data[key] = revenue_data.get(key, 0) + float(fee)
-    
-    elif revenue_type == 'promotions':
-        # Promotion payments
-        query = Payment.query.filter(
-            Payment.status == 'completed',
-            Payment.payment_type == 'promotion'
-        )
-        if start_date:
-            query = query.filter(Payment.created_at >= start_date)
-        payments = query.all()
-        
-        for payment in payments:
-            key = format_date_for_group(payment.created_at, group_by)
-            revenue_data[key] = revenue_data.get(key, 0) + float(payment.amount)
+    if revenue_type not in ('platform_fees', 'withdrawal_fees', 'promotions'):
+        revenue_data = {}
+    else:
+        rollups.refresh_if_stale()
+        revenue_data = rollups.series(revenue_type, group_by, start_date)
     
     # Use the same create_chart_data function from above
     def create_chart_data(data_dict, group_type, start_dt=None, end_dt=None):
@@ -1959,6 +1780,11 @@ def approve_payout(current_admin, payout_id):
     if payout.status != 'pending':
         return jsonify({'error': 'Payout is not pending'}), 400
     
+    # Debit the partner's balance in the same transaction (fails if it no longer covers the payout)
+    if not partner_ledger.record_payout(payout):
+        db.session.rollback()
+        return jsonify({'error': 'Partner balance does not cover this payout'}), 400
+    
     payout.status = 'processing'
     payout.processed_by = current_admin.id
     payout.processed_at = datetime.utcnow()
@@ -1973,6 +1799,7 @@ def approve_payout(current_admin, payout_id):
     )
     
     db.session.commit()
+    invalidate_admin_dashboard()
     
     # Send payout approval SMS and email to partner
     partner = payout.partner
@@ -2013,6 +1840,36 @@ def get_admin_logs(current_admin):
     }), 200
 
 
+@bp.route('/metrics/reservations', methods=['GET'])
+@admin_required
+def get_reservation_metrics(current_admin):
+    """Ticket reservation sweeper metrics and the current expiry backlog"""
+    from app.utils.reservation_sweeper import reservation_sweeper
+    
+    now = datetime.utcnow()
+    pending = db.session.query(
+        func.count(Booking.id),
+        func.min(Booking.reserved_until)
+    ).filter(
+        Booking.status == 'pending',
+        Booking.payment_status != 'paid',
+        Booking.reserved_until.isnot(None)
+    )
+    held_count, next_deadline = pending.first()
+    overdue_count, oldest_overdue = pending.filter(Booking.reserved_until < now).first()
+    
+    return jsonify({
+        'sweeper': reservation_sweeper.metrics.snapshot(),
+        'in_process': reservation_sweeper.running,
+        'backlog': {
+            'held_bookings': held_count,
+            'overdue_bookings': overdue_count,
+            'oldest_overdue_seconds': round((now - oldest_overdue).total_seconds(), 1) if oldest_overdue else 0,
+            'next_deadline': next_deadline.isoformat() if next_deadline else None
+        }
+    }), 200
+
+
 @bp.route('/support', methods=['GET'])
 @admin_required
 def get_support_requests(current_admin):
@@ -6,8 +6,12 @@ from app.models.event import Event, EventHost, EventInterest, EventPromotion
 from app.models.category import Category, Location
 from app.models.user import User
 from sqlalchemy import func
+from sqlalchemy.orm import joinedload
 from app.utils.decorators import optional_user, user_required
 from app.utils.file_upload import upload_file
+from app.utils.serializers import serialize_events, apply_user_event_flags
+from app.utils.search import search_subquery
+from app.utils.cache import cached_response
 
 bp = Blueprint('events', __name__)
 
@@ -16,8 +20,16 @@ bp = Blueprint('events', __name__)
 @bp.route('', methods=['GET'])  # Also handle without trailing slash
 @optional_user
 @limiter.exempt
+@cached_response(
+    'events.list', ttl=60,
+    user_overlay=lambda data, user: apply_user_event_flags(data['events'], user)
+)
 def get_events(current_user):
-    """Get all events with filters"""
+    """Get all events with filters
+
+    Builds the shared page only; per-user flags (in_bucketlist, is_booked)
+    are merged in by the cache overlay with one bulk query per flag.
+    """
     # Query parameters
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 20, type=int)
@@ -71,8 +83,11 @@ def get_events(current_user):
             Event.start_date < monday
         )
     
-    # Search by keyword
-    if search:
+    # Search by keyword - use the full-text index when available
+    matches = search_subquery(search) if search else None
+    if matches is not None:
+        query = query.join(matches, matches.c.event_id == Event.id)
+    elif search:
         query = query.filter(
             or_(
                 Event.title.ilike(f'%{search}%'),
@@ -80,22 +95,17 @@ def get_events(current_user):
             )
         )
     
-    # Order by date
-    query = query.order_by(Event.start_date.asc())
+    # Order by relevance when searching the index, then by date
+    if matches is not None:
+        query = query.order_by(matches.c.rank.desc(), Event.start_date.asc())
+    else:
+        query = query.order_by(Event.start_date.asc())
     
     # Paginate
     events = query.paginate(page=page, per_page=per_page, error_out=False)
     
-    # Build events list with bucketlist status
-    events_list = []
-    for event in events.items:
-        event_dict = event.to_dict()
-        # Check if event is in user's bucketlist
-        if current_user:
-            event_dict['in_bucketlist'] = event in current_user.bucketlist
-        else:
-            event_dict['in_bucketlist'] = False
-        events_list.append(event_dict)
+    # Build the shared events list; per-user flags start out false
+    events_list = apply_user_event_flags(serialize_events(events.items), current_user)
     
     return jsonify({
         'events': events_list,
@@ -128,13 +138,9 @@ def get_event(current_user, event_id):
     event.view_count += 1
     db.session.commit()
     
-    # Check if user has bookmarked this event
-    in_bucketlist = False
-    if current_user:
-        in_bucketlist = event in current_user.bucketlist
-    
+    # Add bucketlist / booked flags for the current user
     event_data = event.to_dict(include_stats=True)
-    event_data['in_bucketlist'] = in_bucketlist
+    apply_user_event_flags([event_data], current_user)
     
     # Show full attendee count only if user is logged in
     if not current_user:
@@ -144,6 +150,7 @@ def get_event(current_user, event_id):
 
 
 @bp.route('/promoted', methods=['GET'])
+@cached_response('events.promoted', ttl=60)
 def get_promoted_events():
     """Get promoted events (Can't Miss banner)"""
     # Get active promotions (both free and paid)
@@ -151,7 +158,9 @@ def get_promoted_events():
     
     # Only show promotions that are currently active (between start and end time)
     # This ensures events only show during their scheduled promotion window
-    promotions = EventPromotion.query.filter(
+    promotions = EventPromotion.query.options(
+        joinedload(EventPromotion.event)
+    ).filter(
         EventPromotion.is_active == True,
         EventPromotion.start_date <= now,
         EventPromotion.end_date >= now
@@ -160,7 +169,8 @@ def get_promoted_events():
         EventPromotion.start_date.asc()  # Then by start date (earliest first)
     ).limit(10).all()
     
-    events = []
+    # Keep only promotions whose event is live and not past
+    visible_promotions = []
     for promo in promotions:
         if promo.event and promo.event.is_published and promo.event.status == 'approved':
             # Check if event is past - use end_date if available, otherwise start_date
@@ -168,37 +178,39 @@ def get_promoted_events():
             if event_end_date < now:
                 # Event is past, skip it
                 continue
-            
-            event_dict = promo.event.to_dict()
-            
-            # Calculate promotion status
-            time_until_start = None
-            time_until_end = None
-            is_active_now = promo.start_date <= now <= promo.end_date
-            
-            if now < promo.start_date:
-                # Promotion hasn't started yet
-                time_until_start = (promo.start_date - now).total_seconds()
-            elif now > promo.end_date:
-                # Promotion has ended
-                time_until_end = 0
-            else:
-                # Promotion is active
-                time_until_end = (promo.end_date - now).total_seconds()
-            
-            # Include promotion info with status
-            event_dict['promotion'] = {
-                'id': promo.id,
-                'is_paid': promo.is_paid,
-                'days_count': promo.days_count,
-                'start_date': promo.start_date.isoformat(),
-                'end_date': promo.end_date.isoformat(),
-                'is_active_now': is_active_now,
-                'time_until_start': time_until_start,  # seconds until start (None if already started)
-                'time_until_end': time_until_end,  # seconds until end (None if not started or already ended)
-                'total_cost': float(promo.total_cost)
-            }
-            events.append(event_dict)
+            visible_promotions.append(promo)
+    
+    events = []
+    event_dicts = serialize_events([promo.event for promo in visible_promotions])
+    for promo, event_dict in zip(visible_promotions, event_dicts):
+        # Calculate promotion status
+        time_until_start = None
+        time_until_end = None
+        is_active_now = promo.start_date <= now <= promo.end_date
+        
+        if now < promo.start_date:
+            # Promotion hasn't started yet
+            time_until_start = (promo.start_date - now).total_seconds()
+        elif now > promo.end_date:
+            # Promotion has ended
+            time_until_end = 0
+        else:
+            # Promotion is active
+            time_until_end = (promo.end_date - now).total_seconds()
+        
+        # Include promotion info with status
+        event_dict['promotion'] = {
+            'id': promo.id,
+            'is_paid': promo.is_paid,
+            'days_count': promo.days_count,
+            'start_date': promo.start_date.isoformat(),
+            'end_date': promo.end_date.isoformat(),
+            'is_active_now': is_active_now,
+            'time_until_start': time_until_start,  # seconds until start (None if already started)
+            'time_until_end': time_until_end,  # seconds until end (None if not started or already ended)
+            'total_cost': float(promo.total_cost)
+        }
+        events.append(event_dict)
     
     return jsonify({
         'events': events,
@@ -209,6 +221,7 @@ def get_promoted_events():
 @bp.route('/categories', methods=['GET', 'OPTIONS'])
 @bp.route('/categories/', methods=['GET', 'OPTIONS'])
 @limiter.exempt
+@cached_response('events.categories', ttl=300)
 def get_categories():
     """Get all event categories"""
     # Handle OPTIONS preflight request
@@ -249,6 +262,7 @@ def get_categories():
 
 
 @bp.route('/categories/<int:category_id>/events', methods=['GET'])
+@cached_response('events.category_events', ttl=120)
 def get_category_events(category_id):
     """Get events by category with preview"""
     category = Category.query.get(category_id)
@@ -266,13 +280,14 @@ def get_category_events(category_id):
     
     return jsonify({
         'category': category.to_dict(),
-        'events': [event.to_dict() for event in events],
+        'events': serialize_events(events),
         'count': len(events)
     }), 200
 
 
 @bp.route('/locations', methods=['GET'])
 @limiter.exempt
+@cached_response('events.locations', ttl=3600)
 def get_locations():
     """Get all locations"""
     locations = Location.query.filter_by(is_active=True).order_by(Location.display_order).all()
@@ -306,6 +321,7 @@ def generate_share_link(event_id):
 
 
 @bp.route('/calendar', methods=['GET'])
+@cached_response('events.calendar', ttl=300)
 def get_calendar_events():
     """Get events for calendar view"""
     # Get date range from query params
@@ -352,6 +368,7 @@ def get_calendar_events():
 
 
 @bp.route('/this-weekend', methods=['GET'])
+@cached_response('events.this_weekend', ttl=120)
 def get_this_weekend_events():
     """Get events happening this weekend"""
     from datetime import timedelta
@@ -375,7 +392,7 @@ def get_this_weekend_events():
     ).order_by(Event.start_date).all()
     
     return jsonify({
-        'events': [event.to_dict() for event in events],
+        'events': serialize_events(events),
         'count': len(events),
         'weekend_start': saturday.isoformat(),
         'weekend_end': sunday.isoformat()
@@ -390,12 +407,19 @@ def autocomplete_search():
     if not query or len(query) < 2:
         return jsonify({'suggestions': []}), 200
     
-    # Search events
-    events = Event.query.filter(
+    # Search events - prefix match on the full-text index when available
+    events_query = Event.query.options(joinedload(Event.category)).filter(
         Event.is_published == True,
-        Event.status == 'approved',
-        Event.title.ilike(f'%{query}%')
-    ).limit(5).all()
+        Event.status == 'approved'
+    )
+    matches = search_subquery(query, prefix=True)
+    if matches is not None:
+        events_query = events_query.join(
+            matches, matches.c.event_id == Event.id
+        ).order_by(matches.c.rank.desc())
+    else:
+        events_query = events_query.filter(Event.title.ilike(f'%{query}%'))
+    events = events_query.limit(5).all()
     
     suggestions = []
     for event in events:
@@ -1,5 +1,6 @@
 from flask import Blueprint, request, jsonify, current_app
 from datetime import datetime
+from sqlalchemy import insert
 from app import db, limiter
 from app.models.notification import Notification
 from app.models.user import User
@@ -11,9 +12,14 @@ from app.utils.sms import (
     send_event_notification_sms,
     send_event_rejection_sms,
     send_partner_rejection_sms,
-    send_new_booking_sms_to_partner
+    send_new_booking_sms_to_partner,
+    format_phone_for_sms
 )
 from app.utils.email import send_new_booking_to_partner_email, send_event_reminder_email
+from app.utils.email_outbox import email_outbox
+from app.utils.sms_outbox import sms_outbox
+from app.utils.notification_stream import notification_stream, publish_after_commit, recipient_channels
+from app.utils import notification_counters
 
 bp = Blueprint('notifications', __name__)
 
@@ -37,11 +43,94 @@ def create_notification(user_id=None, partner_id=None, admin_id=None, title=None
     )
     
     db.session.add(notification)
+    db.session.flush()
+    notification_counters.add_unread([notification])
+    publish_after_commit(db.session, recipient_channels(user_id, partner_id, admin_id),
+                         'notification', notification.to_dict())
     db.session.commit()
     
     return notification
 
 
+def create_notifications(recipients, title=None, message=None, notification_type='general',
+                         event_id=None, booking_id=None, action_url=None, action_text=None,
+                         email_subject=None, email_html=None, sms_message=None, commit=True):
+    """
+    Create one notification per recipient with a single bulk insert
+    
+    Args:
+        recipients: Iterable of dicts with user_id, partner_id or admin_id. A recipient's
+            email and phone_number are used for delivery; title, message, email_subject,
+            email_html and sms_message set there override the arguments for that recipient.
+        email_subject, email_html: Also queue this email in the email outbox
+        sms_message: Also queue this SMS in the SMS outbox
+        commit: Commit now; pass False to commit with the caller's transaction
+            (the outbox workers are woken when it commits)
+    
+    Returns:
+        dict: Number of notifications created, emails and SMS queued
+    """
+    config = current_app.config
+    queue_email = (not config.get('MAIL_SUPPRESS_SEND', False) and config.get('MAIL_SERVER')
+                   and config.get('MAIL_USERNAME') and config.get('MAIL_PASSWORD'))
+    queue_sms = not config.get('SMS_SUPPRESS_SEND', False)
+    now = datetime.utcnow()
+    
+    rows, emails, sms = [], [], []
+    for recipient in recipients:
+        subject = recipient.get('email_subject', email_subject)
+        html_body = recipient.get('email_html', email_html)
+        text = recipient.get('sms_message', sms_message)
+        rows.append({
+            'user_id': recipient.get('user_id'),
+            'partner_id': recipient.get('partner_id'),
+            'admin_id': recipient.get('admin_id'),
+            'title': recipient.get('title', title),
+            'message': recipient.get('message', message),
+            'notification_type': notification_type,
+            'event_id': event_id,
+            'booking_id': booking_id,
+            'action_url': action_url,
+            'action_text': action_text,
+            'is_read': False,
+            'send_email': bool(subject and html_body),
+            'email_sent': False,
+            'created_at': now
+        })
+        if queue_email and subject and html_body and recipient.get('email'):
+            emails.append((subject, recipient['email'], html_body, None))
+        if queue_sms and text and recipient.get('phone_number'):
+            phone = format_phone_for_sms(recipient['phone_number'])
+            if phone:
+                sms.append((phone, text))
+    
+    listening = [
+        [channel for channel in recipient_channels(row['user_id'], row['partner_id'], row['admin_id'])
+         if notification_stream.is_listening(channel)]
+        for row in rows
+    ]
+    if any(listening):
+        # Ids are needed to push the new notifications to open streams
+        ids = db.session.scalars(
+            insert(Notification).returning(Notification.id, sort_by_parameter_order=True), rows
+        ).all()
+        for notification_id, row, channels in zip(ids, rows, listening):
+            if channels:
+                publish_after_commit(db.session, channels, 'notification',
+                                     Notification(id=notification_id, **row).to_dict())
+    elif rows:
+        db.session.execute(insert(Notification), rows)
+    notification_counters.add_unread(rows)
+    result = {
+        'notifications': len(rows),
+        'emails': email_outbox.enqueue_many(emails, commit=False),
+        'sms': sms_outbox.enqueue_many(sms, commit=False)
+    }
+    if commit:
+        db.session.commit()
+    return result
+
+
 @bp.route('/user', methods=['GET', 'OPTIONS'])
 @limiter.limit("120 per hour")  # Allow more frequent polling (2 requests per minute max)
 @user_required
@@ -80,17 +169,10 @@ def get_user_notifications(current_user):
         page=page, per_page=per_page, error_out=False
     )
     
-    # Calculate unread count for both user and admin notifications if admin
+    # Unread count for both user and admin notifications if admin
+    unread_count = notification_counters.unread_count('user', current_user.id)
     if is_admin:
-        unread_count = Notification.query.filter(
-            ((Notification.user_id == current_user.id) | (Notification.admin_id == current_user.id)),
-            Notification.is_read == False
-        ).count()
-    else:
-        unread_count = Notification.query.filter_by(
-            user_id=current_user.id,
-            is_read=False
-        ).count()
+        unread_count += notification_counters.unread_count('admin', current_user.id)
     
     response = jsonify({
         'notifications': [notif.to_dict() for notif in notifications.items],
@@ -134,10 +216,7 @@ def get_partner_notifications(current_partner):
                 print(f"Error serializing notification {notif.id}: {str(e)}")
                 continue
         
-        unread_count = Notification.query.filter_by(
-            partner_id=current_partner.id,
-            is_read=False
-        ).count()
+        unread_count = notification_counters.unread_count('partner', current_partner.id)
         
         return jsonify({
             'notifications': notifications_list,
@@ -159,13 +238,16 @@ def get_partner_notifications(current_partner):
 @bp.route('/<int:notification_id>/read', methods=['PUT'])
 def mark_as_read(notification_id):
     """Mark notification as read"""
-    notification = Notification.query.get(notification_id)
+    notification = notification_counters.mark_read(notification_id)
     
     if not notification:
         return jsonify({'error': 'Notification not found'}), 404
     
-    notification.is_read = True
-    notification.read_at = datetime.utcnow()
+    publish_after_commit(
+        db.session,
+        recipient_channels(notification.user_id, notification.partner_id, notification.admin_id),
+        'read', {'ids': [notification.id]}
+    )
     db.session.commit()
     
     return jsonify({
@@ -177,13 +259,8 @@ def mark_as_read(notification_id):
 @user_required
 def mark_all_user_read(current_user):
     """Mark all user notifications as read"""
-    Notification.query.filter_by(
-        user_id=current_user.id,
-        is_read=False
-    ).update({
-        'is_read': True,
-        'read_at': datetime.utcnow()
-    })
+    notification_counters.mark_all_read('user', current_user.id)
+    publish_after_commit(db.session, recipient_channels(user_id=current_user.id), 'read', {'all': True})
     
     db.session.commit()
     
@@ -196,13 +273,8 @@ def mark_all_user_read(current_user):
 @partner_required
 def mark_all_partner_read(current_partner):
     """Mark all partner notifications as read"""
-    Notification.query.filter_by(
-        partner_id=current_partner.id,
-        is_read=False
-    ).update({
-        'is_read': True,
-        'read_at': datetime.utcnow()
-    })
+    notification_counters.mark_all_read('partner', current_partner.id)
+    publish_after_commit(db.session, recipient_channels(partner_id=current_partner.id), 'read', {'all': True})
     
     db.session.commit()
     
@@ -231,10 +303,7 @@ def get_admin_notifications(current_admin):
     return jsonify({
         'notifications': [notif.to_dict() for notif in notifications.items],
         'total': notifications.total,
-        'unread_count': Notification.query.filter_by(
-            admin_id=current_admin.id,
-            is_read=False
-        ).count(),
+        'unread_count': notification_counters.unread_count('admin', current_admin.id),
         'page': notifications.page,
         'pages': notifications.pages
     }), 200
@@ -244,13 +313,8 @@ def get_admin_notifications(current_admin):
 @admin_required
 def mark_all_admin_read(current_admin):
     """Mark all admin notifications as read"""
-    Notification.query.filter_by(
-        admin_id=current_admin.id,
-        is_read=False
-    ).update({
-        'is_read': True,
-        'read_at': datetime.utcnow()
-    })
+    notification_counters.mark_all_read('admin', current_admin.id)
+    publish_after_commit(db.session, recipient_channels(admin_id=current_admin.id), 'read', {'all': True})
     
     db.session.commit()
     
@@ -259,6 +323,59 @@ def mark_all_admin_read(current_admin):
     }), 200
 
 
+def _stream_ticket(recipients):
+    return jsonify({
+        'ticket': notification_stream.issue_ticket(recipients),
+        'expires_in': notification_stream.ticket_ttl
+    }), 200
+
+
+@bp.route('/stream-ticket', methods=['POST', 'OPTIONS'])
+@limiter.limit("60 per hour")
+@user_required
+def user_stream_ticket(current_user):
+    """Ticket for opening /stream with the user's notifications"""
+    recipients = [('user', current_user.id)]
+    if current_user.email == current_app.config.get('ADMIN_EMAIL'):
+        recipients.append(('admin', current_user.id))
+    return _stream_ticket(recipients)
+
+
+@bp.route('/partner/stream-ticket', methods=['POST', 'OPTIONS'])
+@limiter.limit("60 per hour")
+@partner_required
+def partner_stream_ticket(current_partner):
+    """Ticket for opening /stream with the partner's notifications"""
+    return _stream_ticket([('partner', current_partner.id)])
+
+
+@bp.route('/admin/stream-ticket', methods=['POST', 'OPTIONS'])
+@limiter.limit("60 per hour")
+@admin_required
+def admin_stream_ticket(current_admin):
+    """Ticket for opening /stream with the admin's notifications"""
+    return _stream_ticket([('admin', current_admin.id)])
+
+
+@bp.route('/stream', methods=['GET'])
+@limiter.limit("60 per hour")
+def stream_notifications():
+    """
+    Server-Sent Events: new notifications and unread count, replaces polling
+
+    Opened with ?ticket= from one of the stream-ticket endpoints, since
+    EventSource can't send an Authorization header.
+    """
+    recipients = notification_stream.read_ticket(request.args.get('ticket', ''))
+    if not recipients:
+        return jsonify({'error': 'Invalid or expired stream ticket'}), 401
+    
+    return notification_stream.response(
+        [f'{recipient_type}:{recipient_id}' for recipient_type, recipient_id in recipients],
+        lambda: sum(notification_counters.unread_count(*recipient) for recipient in recipients)
+    )
+
+
 @bp.route('/<int:notification_id>', methods=['DELETE'])
 def delete_notification(notification_id):
     """Delete notification"""
@@ -268,6 +385,8 @@ def delete_notification(notification_id):
         return jsonify({'error': 'Notification not found'}), 404
     
     db.session.delete(notification)
+    db.session.flush()
+    notification_counters.remove(notification)
     db.session.commit()
     
     return jsonify({
@@ -438,45 +557,15 @@ def notify_payment_completed(booking, payment):
 @bp.route('/event/reminder', methods=['POST'])
 @admin_required
 def send_event_reminders(current_admin):
-    """Send event reminders to users (can be called by scheduled task/cron)"""
-    from app.models.event import Event
-    from app.models.ticket import Booking
-    from datetime import datetime, timedelta
+    """Send event reminders to users (cron can run `flask send_event_reminders` instead)"""
+    from app.utils.reminders import send_event_reminders as run_reminders
     
     hours_before = request.json.get('hours_before', 24) if request.is_json else 24
     
-    # Find events happening in the next 'hours_before' hours
-    reminder_time = datetime.utcnow() + timedelta(hours=hours_before)
-    time_window_start = datetime.utcnow() + timedelta(hours=hours_before - 1)
-    time_window_end = datetime.utcnow() + timedelta(hours=hours_before + 1)
-    
-    # Get events in the time window
-    events = Event.query.filter(
-        Event.start_date >= time_window_start,
-        Event.start_date <= time_window_end,
-        Event.status == 'approved',
-        Event.is_published == True
-    ).all()
-    
-    reminders_sent = 0
-    for event in events:
-        # Get all confirmed bookings for this event
-        bookings = Booking.query.filter_by(
-            event_id=event.id,
-            status='confirmed'
-        ).all()
-        
-        for booking in bookings:
-            if booking.user and booking.user.phone_number:
-                try:
-                    notify_event_reminder(booking.user, event, hours_before)
-                    reminders_sent += 1
-                except Exception as e:
-                    print(f"Error sending reminder to user {booking.user.id}: {str(e)}")
+    result = run_reminders(hours_before)
     
     return jsonify({
         'message': f'Event reminders sent',
-        'reminders_sent': reminders_sent,
-        'events_processed': len(events)
+        **result
     }), 200
 
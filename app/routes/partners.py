@@ -1,15 +1,21 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context, redirect, send_file
 from datetime import datetime
 from sqlalchemy import func, or_
+import os
 import json
 from app import db, limiter
 from app.models.partner import Partner, PartnerSupportRequest, PartnerTeamMember, PartnerStaff
 from app.models.event import Event, EventHost, EventInterest, EventPromotion
-from app.models.ticket import TicketType, PromoCode, Booking
-from app.models.payment import PartnerPayout, Payment
+from app.models.ticket import TicketType, PromoCode, Booking, TicketPDFJob
+from app.models.payment import PartnerPayout, PartnerLedgerEntry, Payment
 from app.models.user import User
 from app.utils.decorators import partner_required
-from app.utils.file_upload import upload_file
+from app.utils.file_upload import upload_file, local_file_path
+from app.utils.serializers import serialize_events
+from app.utils.search import index_event, remove_event as remove_event_from_search
+from app.utils.cache import invalidate_event_listings
+from app.utils import attendee_export, attendee_listing, partner_analytics, partner_ledger
+from app.utils.ticket_pdf_jobs import ticket_pdf_jobs, pdf_merge_available, JOB_FOLDER, FORMATS as TICKET_PDF_FORMATS
 
 bp = Blueprint('partners', __name__)
 
@@ -42,23 +48,8 @@ def get_dashboard(current_partner):
         Event.partner_id == current_partner.id
     ).scalar() or 0
     
-    # Calculate actual earnings from database (only from completed payments)
-    # Join with Payment to ensure we only count bookings with completed payments
-    actual_total_earnings = db.session.query(func.sum(Booking.partner_amount)).join(Event).join(Payment).filter(
-        Event.partner_id == current_partner.id,
-        Booking.status == 'confirmed',
-        Payment.status == 'completed',
-        Booking.payment_id == Payment.id
-    ).scalar() or 0
-    
-    # Get withdrawn earnings (from payouts)
-    withdrawn_earnings = db.session.query(func.sum(PartnerPayout.amount)).filter(
-        PartnerPayout.partner_id == current_partner.id,
-        PartnerPayout.status == 'approved'
-    ).scalar() or 0
-    
-    # Pending earnings = total - withdrawn
-    pending_earnings = float(actual_total_earnings) - float(withdrawn_earnings)
+    # Earnings are kept on the partner row by the ledger (app/utils/partner_ledger.py)
+    earnings = partner_ledger.balances(current_partner)
     
     # Get recent bookings
     recent_bookings = Booking.query.join(Event).filter(
@@ -73,9 +64,9 @@ def get_dashboard(current_partner):
             'upcoming_events': upcoming_events,
             'past_events': past_events,
             'total_attendees': int(total_attendees),
-            'total_earnings': float(actual_total_earnings),
-            'pending_earnings': float(pending_earnings),
-            'withdrawn_earnings': float(withdrawn_earnings)
+            'total_earnings': earnings['total_earnings'],
+            'pending_earnings': earnings['pending_earnings'],
+            'withdrawn_earnings': earnings['withdrawn_earnings']
         },
         'recent_bookings': [booking.to_dict() for booking in recent_bookings]
     }), 200
@@ -88,13 +79,15 @@ def get_partner_analytics(current_partner):
     try:
         from datetime import timedelta
         days = request.args.get('days', 30, type=int)
+        granularity = request.args.get('granularity', 'day')
+        if granularity not in partner_analytics.GRANULARITIES:
+            return jsonify({'error': f"granularity must be one of: {', '.join(partner_analytics.GRANULARITIES)}"}), 400
         now = datetime.utcnow()
         start_period = now - timedelta(days=days)
         start_7d = now - timedelta(days=7)
         start_1d = now - timedelta(days=1)
         
-        # Base confirmed bookings query for this partner (only bookings with COMPLETED payments count for revenue)
-        # Join with Payment to ensure we only count bookings with completed payments
+        # Confirmed bookings with COMPLETED payments, for the chart
         base_bookings = Booking.query.join(Event).join(Payment).filter(
             Event.partner_id == current_partner.id,
             Booking.status == 'confirmed',
@@ -102,44 +95,14 @@ def get_partner_analytics(current_partner):
             Booking.payment_id == Payment.id
         )
         
-        # All-time stats
-        total_bookings = base_bookings.count()
-        total_revenue = db.session.query(func.sum(Booking.partner_amount)).join(Event).join(Payment).filter(
-            Event.partner_id == current_partner.id,
-            Booking.status == 'confirmed',
-            Payment.status == 'completed',
-            Booking.payment_id == Payment.id
-        ).scalar() or 0
-        
-        # Period stats (last N days)
-        period_bookings = base_bookings.filter(Booking.created_at >= start_period).count()
-        period_revenue = db.session.query(func.sum(Booking.partner_amount)).join(Event).join(Payment).filter(
-            Event.partner_id == current_partner.id,
-            Booking.status == 'confirmed',
-            Payment.status == 'completed',
-            Booking.payment_id == Payment.id,
-            Booking.created_at >= start_period
-        ).scalar() or 0
-        
-        # Last 7 days
-        last_7d_bookings = base_bookings.filter(Booking.created_at >= start_7d).count()
-        last_7d_revenue = db.session.query(func.sum(Booking.partner_amount)).join(Event).join(Payment).filter(
-            Event.partner_id == current_partner.id,
-            Booking.status == 'confirmed',
-            Payment.status == 'completed',
-            Booking.payment_id == Payment.id,
-            Booking.created_at >= start_7d
-        ).scalar() or 0
-        
-        # Last 24 hours
-        last_1d_bookings = base_bookings.filter(Booking.created_at >= start_1d).count()
-        last_1d_revenue = db.session.query(func.sum(Booking.partner_amount)).join(Event).join(Payment).filter(
-            Event.partner_id == current_partner.id,
-            Booking.status == 'confirmed',
-            Payment.status == 'completed',
-            Booking.payment_id == Payment.id,
-            Booking.created_at >= start_1d
-        ).scalar() or 0
+        # All-time, period, 7-day and 24-hour sales from the partner ledger, in one query
+        sales = partner_ledger.sales_summary(
+            current_partner.id, period=start_period, last_7_days=start_7d, last_24_hours=start_1d
+        )
+        total_bookings, total_revenue = sales['all_time']
+        period_bookings, period_revenue = sales['period']
+        last_7d_bookings, last_7d_revenue = sales['last_7_days']
+        last_1d_bookings, last_1d_revenue = sales['last_24_hours']
         
         # Event stats
         total_events = Event.query.filter_by(partner_id=current_partner.id).count()
@@ -149,50 +112,14 @@ def get_partner_analytics(current_partner):
             Event.status == 'approved'
         ).count()
         
-        # Generate daily time-series data for line chart
-        # Pre-fetch all events and bookings to avoid N+1 queries
-        all_events = Event.query.filter_by(partner_id=current_partner.id).all()
-        all_bookings = base_bookings.all()
-        
-        chart_data = []
-        cumulative_bookings_count = 0
-        cumulative_revenue_total = 0.0
-        
-        for i in range(days):
-            day_start = start_period + timedelta(days=i)
-            day_end = day_start + timedelta(days=1)
-            
-            # Active events on this day (events that were active/upcoming on this date)
-            active_on_day = sum(1 for event in all_events 
-                               if event.start_date > day_start and event.status == 'approved')
-            
-            # Total events created up to this day
-            total_events_by_day = sum(1 for event in all_events 
-                                     if event.created_at <= day_end)
-            
-            # Bookings created on this day
-            bookings_on_day = sum(1 for booking in all_bookings 
-                                if day_start <= booking.created_at < day_end)
-            
-            # Revenue from bookings created on this day
-            revenue_on_day = sum(float(booking.partner_amount) for booking in all_bookings 
-                               if day_start <= booking.created_at < day_end)
-            
-            # Update cumulative values
-            cumulative_bookings_count = sum(1 for booking in all_bookings 
-                                           if booking.created_at <= day_end)
-            cumulative_revenue_total = sum(float(booking.partner_amount) for booking in all_bookings 
-                                          if booking.created_at <= day_end)
-            
-            chart_data.append({
-                'date': day_start.strftime('%Y-%m-%d'),
-                'active_events': active_on_day,
-                'total_events': total_events_by_day,
-                'bookings': bookings_on_day,
-                'cumulative_bookings': cumulative_bookings_count,
-                'revenue': float(revenue_on_day),
-                'cumulative_revenue': float(cumulative_revenue_total)
-            })
+        # Time-series data for line chart (day, week or month buckets)
+        chart_data = partner_analytics.time_series(
+            base_bookings,
+            Event.query.filter_by(partner_id=current_partner.id),
+            days=days,
+            granularity=granularity,
+            now=now
+        )
         
         return jsonify({
             'summary': {
@@ -203,6 +130,7 @@ def get_partner_analytics(current_partner):
             },
             'period': {
                 'days': days,
+                'granularity': granularity,
                 'bookings': period_bookings,
                 'revenue': float(period_revenue),
             },
@@ -501,7 +429,7 @@ def get_partner_events(current_partner):
     )
     
     return jsonify({
-        'events': [event.to_dict(include_stats=True) for event in events.items],
+        'events': serialize_events(events.items, include_stats=True),
         'total': events.total,
         'page': events.page,
         'pages': events.pages
@@ -716,6 +644,9 @@ def create_event(current_partner):
     
     db.session.commit()
     
+    # Keep the search index in sync
+    index_event(event)
+    
     return jsonify({
         'message': 'Event created successfully. Awaiting admin approval.',
         'event': event.to_dict()
@@ -1172,6 +1103,10 @@ def update_event(current_partner, event_id):
     
     db.session.commit()
     
+    # Keep the search index in sync (title, description, interests or category may have changed)
+    index_event(event)
+    invalidate_event_listings()
+    
     return jsonify({
         'message': 'Event updated successfully',
         'event': event.to_dict(include_stats=True)
@@ -1197,6 +1132,9 @@ def delete_event(current_partner, event_id):
     db.session.delete(event)
     db.session.commit()
     
+    remove_event_from_search(event_id)
+    invalidate_event_listings()
+    
     return jsonify({'message': 'Event deleted successfully'}), 200
 
 
@@ -1440,6 +1378,7 @@ def upload_event_poster(current_partner, event_id):
         
         event.poster_image = file_path
         db.session.commit()
+        invalidate_event_listings()
         
         return jsonify({
             'message': 'Poster uploaded successfully',
@@ -1505,6 +1444,8 @@ def create_ticket_type(current_partner, event_id):
     db.session.add(ticket_type)
     db.session.commit()
     
+    invalidate_event_listings()
+    
     return jsonify({
         'message': 'Ticket type created successfully',
         'ticket_type': ticket_type.to_dict()
@@ -1532,6 +1473,8 @@ def toggle_ticket_type(current_partner, ticket_type_id):
     
     db.session.commit()
     
+    invalidate_event_listings()
+    
     return jsonify({
         'message': f'Ticket type {"enabled" if ticket_type.is_active else "disabled"} successfully',
         'ticket_type': ticket_type.to_dict()
@@ -1588,6 +1531,8 @@ def create_promo_code(current_partner, event_id):
     db.session.add(promo_code)
     db.session.commit()
     
+    invalidate_event_listings()
+    
     return jsonify({
         'message': 'Promo code created successfully',
         'promo_code': promo_code.to_dict()
@@ -1660,6 +1605,8 @@ def update_promo_code(current_partner, event_id, promo_code_id):
     
     db.session.commit()
     
+    invalidate_event_listings()
+    
     return jsonify({
         'message': 'Promo code updated successfully',
         'promo_code': promo_code.to_dict()
@@ -1689,6 +1636,8 @@ def delete_promo_code(current_partner, event_id, promo_code_id):
     db.session.delete(promo_code)
     db.session.commit()
     
+    invalidate_event_listings()
+    
     return jsonify({
         'message': 'Promo code deleted successfully'
     }), 200
@@ -1699,94 +1648,30 @@ def delete_promo_code(current_partner, event_id, promo_code_id):
 @bp.route('/attendees', methods=['GET'])
 @partner_required
 def get_all_attendees(current_partner):
-    """Get all attendees across all partner events"""
-    page = request.args.get('page', 1, type=int)
+    """
+    Get attendees across all partner events, newest booking first
+
+    Cursor-paginated: pass next_cursor from the previous response as
+    ?cursor= to get the next page.
+    """
+    if 'page' in request.args:
+        # Page numbers would silently return the first page every time
+        return jsonify({'error': 'page is not supported, pass next_cursor as cursor instead'}), 400
+
     per_page = request.args.get('per_page', 50, type=int)
     event_id = request.args.get('event_id', type=int)
     
-    # Get all bookings for partner's events
-    query = Booking.query.join(Event).filter(
-        Event.partner_id == current_partner.id,
-        Booking.status == 'confirmed'
-    )
-    
-    if event_id:
-        query = query.filter(Booking.event_id == event_id)
-    
-    bookings = query.order_by(Booking.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
-    
-    # Format attendees data
-    attendees = []
-    for booking in bookings.items:
-        user = booking.user
-        event = booking.event
-        
-        # Calculate age from date_of_birth
-        age = None
-        if user.date_of_birth:
-            today = datetime.utcnow().date()
-            age = today.year - user.date_of_birth.year - ((today.month, today.day) < (user.date_of_birth.month, user.date_of_birth.day))
-        
-        # Determine gender (we don't have this field, so we'll use a placeholder or derive from name)
-        gender = 'Other'  # Default since we don't have gender field
-        
-        # Get ticket type name
-        ticket_type_name = 'Free'
-        if booking.tickets.first():
-            ticket = booking.tickets.first()
-            if ticket.ticket_type:
-                ticket_type_name = ticket.ticket_type.name
-        
-        # Determine if current event (upcoming or ongoing)
-        # Past = (end_date < now) OR (end_date is None AND start_date < now)
-        now = datetime.utcnow()
-        is_current = False
-        
-        # Check if event is past
-        is_past = False
-        if event.end_date and event.end_date < now:
-            is_past = True  # Past event (has ended)
-        elif not event.end_date and event.start_date < now:
-            is_past = True  # Past event (no end_date but start_date is past)
-        
-        # If not past, it's current (upcoming or ongoing)
-        if not is_past:
-            if event.start_date > now:
-                is_current = True  # Upcoming
-            elif event.start_date <= now and (not event.end_date or event.end_date >= now):
-                is_current = True  # Ongoing
-        
-        attendees.append({
-            'id': booking.id,
-            'name': f"{user.first_name} {user.last_name}",
-            'email': user.email,
-            'phone': user.phone_number or '',
-            'age': age or 0,
-            'gender': gender,
-            'location': user.location or '',
-            'ticketType': ticket_type_name,
-            'event': event.title,
-            'eventDate': event.start_date.isoformat(),
-            'bookingDate': booking.created_at.isoformat(),
-            'status': booking.status.capitalize(),
-            'isCurrentEvent': is_current,
-            'booking': booking.to_dict()
-        })
-    
-    # Count past and current events from attendees
-    past_events_count = sum(1 for a in attendees if not a['isCurrentEvent'])
-    current_events_count = sum(1 for a in attendees if a['isCurrentEvent'])
+    try:
+        result = attendee_listing.list_attendees(
+            current_partner.id,
+            event_id=event_id,
+            cursor=request.args.get('cursor'),
+            per_page=per_page
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    return jsonify({
-        'attendees': attendees,
-        'total': bookings.total,
-        'page': bookings.page,
-        'pages': bookings.pages,
-        'past_events_count': past_events_count,
-        'current_events_count': current_events_count
-    }), 200
+    return jsonify(result), 200
 
 
 @bp.route('/events/<int:event_id>/attendees', methods=['GET'])
@@ -1822,7 +1707,13 @@ def get_event_attendees(current_partner, event_id):
 @bp.route('/events/<int:event_id>/attendees/export', methods=['GET'])
 @partner_required
 def export_attendees(current_partner, event_id):
-    """Export attendee list as CSV"""
+    """
+    Export the attendee list as CSV or XLSX, streamed
+
+    Query params: format (csv or xlsx), rows (booking or ticket, one row per
+    ticket with its scan time), columns (comma-separated keys, see
+    attendee_export.COLUMNS)
+    """
     event = Event.query.filter_by(
         id=event_id,
         partner_id=current_partner.id
@@ -1831,44 +1722,93 @@ def export_attendees(current_partner, event_id):
     if not event:
         return jsonify({'error': 'Event not found'}), 404
     
-    import csv
-    from io import StringIO
+    export_format = request.args.get('format', 'csv').lower()
+    if export_format not in attendee_export.FORMATS:
+        return jsonify({'error': f"format must be one of: {', '.join(attendee_export.FORMATS)}"}), 400
+    if export_format == 'xlsx' and not attendee_export.xlsx_available():
+        return jsonify({'error': 'XLSX export is not available'}), 501
     
-    # Get all bookings
-    bookings = Booking.query.filter_by(
-        event_id=event_id,
-        status='confirmed'
-    ).all()
+    row_type = request.args.get('rows', 'booking').lower()
+    if row_type not in attendee_export.ROW_TYPES:
+        return jsonify({'error': f"rows must be one of: {', '.join(attendee_export.ROW_TYPES)}"}), 400
     
-    # Create CSV
-    si = StringIO()
-    writer = csv.writer(si)
+    columns, error = attendee_export.parse_columns(request.args.get('columns'), row_type)
+    if error:
+        return jsonify({'error': error}), 400
     
-    # Header
-    writer.writerow(['Booking Number', 'Name', 'Email', 'Phone', 'Quantity', 'Total Amount', 'Checked In', 'Booking Date'])
+    rows = attendee_export.iter_rows(event_id, row_type)
+    if export_format == 'xlsx':
+        body = attendee_export.xlsx_stream(rows, columns)
+    else:
+        body = attendee_export.csv_stream(rows, columns)
     
-    # Data
-    for booking in bookings:
-        user = booking.user
-        writer.writerow([
-            booking.booking_number,
-            f"{user.first_name} {user.last_name}",
-            user.email,
-            user.phone_number or '',
-            booking.quantity,
-            f"KES {booking.total_amount}",
-            'Yes' if booking.is_checked_in else 'No',
-            booking.created_at.strftime('%Y-%m-%d %H:%M')
-        ])
+    return Response(
+        stream_with_context(body),
+        mimetype=attendee_export.FORMATS[export_format],
+        headers={'Content-Disposition': f'attachment; filename=attendees_{event_id}.{export_format}'}
+    )
+
+
+@bp.route('/events/<int:event_id>/tickets/bulk-pdf', methods=['POST'])
+@partner_required
+def create_ticket_pdf_job(current_partner, event_id):
+    """
+    Start a job rendering the tickets of every confirmed booking of an event
+    
+    Body (or query) param: format, pdf (one merged document, the default) or
+    zip (one PDF per booking). Poll GET /ticket-pdf-jobs/<id> for progress.
+    """
+    event = Event.query.filter_by(
+        id=event_id,
+        partner_id=current_partner.id
+    ).first()
     
-    output = si.getvalue()
+    if not event:
+        return jsonify({'error': 'Event not found'}), 404
     
-    from flask import make_response
-    response = make_response(output)
-    response.headers["Content-Disposition"] = f"attachment; filename=attendees_{event_id}.csv"
-    response.headers["Content-type"] = "text/csv"
+    data = request.get_json(silent=True) or {}
+    output_format = str(data.get('format') or request.args.get('format', 'pdf')).lower()
+    if output_format not in TICKET_PDF_FORMATS:
+        return jsonify({'error': f"format must be one of: {', '.join(TICKET_PDF_FORMATS)}"}), 400
+    if output_format == 'pdf' and not pdf_merge_available():
+        return jsonify({'error': 'Merged PDF output is not available, use format=zip'}), 501
     
-    return response
+    job = ticket_pdf_jobs.create_job(current_partner.id, event_id, output_format)
+    return jsonify({'job': job.to_dict()}), 202
+
+
+@bp.route('/ticket-pdf-jobs/<int:job_id>', methods=['GET'])
+@partner_required
+def get_ticket_pdf_job(current_partner, job_id):
+    """Status and progress of a bulk ticket PDF job"""
+    job = TicketPDFJob.query.filter_by(id=job_id, partner_id=current_partner.id).first()
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify({'job': job.to_dict()}), 200
+
+
+@bp.route('/ticket-pdf-jobs/<int:job_id>/download', methods=['GET'])
+@partner_required
+def download_ticket_pdf_job(current_partner, job_id):
+    """Download the result of a completed bulk ticket PDF job"""
+    job = TicketPDFJob.query.filter_by(id=job_id, partner_id=current_partner.id).first()
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    if job.status != 'completed':
+        return jsonify({'error': f'Job is {job.status}', 'job': job.to_dict()}), 409
+    
+    if job.file_location.startswith('http'):
+        return redirect(job.file_location)
+    
+    path = local_file_path(JOB_FOLDER, os.path.basename(job.file_location))
+    if not os.path.exists(path):
+        return jsonify({'error': 'Job file not found'}), 404
+    return send_file(
+        path,
+        mimetype=TICKET_PDF_FORMATS[job.output_format],
+        as_attachment=True,
+        download_name=f'tickets_{job.event_id}.{job.output_format}'
+    )
 
 
 # ============ VERIFICATION ============
@@ -1929,7 +1869,7 @@ def get_verification_status(current_partner):
             'events_progress': min((completed_events / events_required) * 100, 100),
             'bookings_progress': min((total_bookings / bookings_required) * 100, 100)
         },
-        'events': [event.to_dict(include_stats=True) for event in all_events],
+        'events': serialize_events(all_events, include_stats=True),
         'recent_bookings': [booking.to_dict() for booking in recent_bookings]
     }), 200
 
@@ -1979,22 +1919,37 @@ def claim_verification_badge(current_partner):
 @partner_required
 def get_earnings(current_partner):
     """Get earnings breakdown"""
-    # Get all completed bookings
-    bookings = db.session.query(
-        func.sum(Booking.partner_amount).label('total'),
-        func.count(Booking.id).label('count')
-    ).join(Event).filter(
-        Event.partner_id == current_partner.id,
-        Booking.status == 'confirmed',
-        Booking.payment_status == 'paid'
-    ).first()
+    earnings = partner_ledger.balances(current_partner)
+    total_bookings, _ = partner_ledger.sales_summary(current_partner.id)['all_time']
     
     return jsonify({
-        'total_earnings': float(current_partner.total_earnings),
-        'pending_earnings': float(current_partner.pending_earnings),
-        'withdrawn_earnings': float(current_partner.withdrawn_earnings),
-        'available_for_withdrawal': float(current_partner.pending_earnings),
-        'total_bookings': bookings.count if bookings else 0
+        'total_earnings': earnings['total_earnings'],
+        'pending_earnings': earnings['pending_earnings'],
+        'withdrawn_earnings': earnings['withdrawn_earnings'],
+        'available_for_withdrawal': earnings['pending_earnings'],
+        'total_bookings': total_bookings
+    }), 200
+
+
+@bp.route('/ledger', methods=['GET'])
+@partner_required
+def get_ledger(current_partner):
+    """Get earnings ledger entries (sales, refunds, payouts, fees) with running balances"""
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', 20, type=int)
+    
+    entries = PartnerLedgerEntry.query.filter_by(
+        partner_id=current_partner.id
+    ).order_by(PartnerLedgerEntry.created_at.desc(), PartnerLedgerEntry.id.desc()).paginate(
+        page=page, per_page=per_page, error_out=False
+    )
+    
+    return jsonify({
+        'entries': [entry.to_dict() for entry in entries.items],
+        'balances': partner_ledger.balances(current_partner),
+        'total': entries.total,
+        'page': entries.page,
+        'pages': entries.pages
     }), 200
 
 
@@ -2064,6 +2019,15 @@ def request_payout(current_partner):
     else:
         return jsonify({'error': 'Invalid payout method'}), 400
     
+    formatted_phone = None
+    if payout_method == 'mpesa':
+        from app.utils.sms import format_phone_for_sms
+        
+        # Format phone number for MPesa
+        formatted_phone = format_phone_for_sms(account_number)
+        if not formatted_phone:
+            return jsonify({'error': 'Invalid phone number format'}), 400
+    
     # Create payout request
     import uuid
     payout = PartnerPayout(
@@ -2074,25 +2038,23 @@ def request_payout(current_partner):
         payout_method=payout_method,
         account_number=account_number,
         account_name=current_partner.bank_account_name or current_partner.business_name,
-        status='processing'  # Start as processing since we'll attempt B2C immediately
+        # MPesa payouts are sent right away; bank transfers wait for admin approval
+        status='processing' if payout_method == 'mpesa' else 'pending'
     )
     
     db.session.add(payout)
     db.session.flush()  # Get payout ID
     
-    # For MPesa, automatically process B2C payment
+    # For MPesa, debit the balance before sending, then automatically process B2C payment
     if payout_method == 'mpesa':
+        # Conditional debit: fails if a concurrent payout already used the balance
+        if not partner_ledger.record_payout(payout):
+            db.session.rollback()
+            return jsonify({'error': 'Insufficient balance'}), 400
+        db.session.commit()
+        
         try:
             from app.utils.mpesa import MPesaClient
-            from app.utils.sms import format_phone_for_sms
-            
-            # Format phone number for MPesa
-            formatted_phone = format_phone_for_sms(account_number)
-            if not formatted_phone:
-                payout.status = 'failed'
-                payout.rejection_reason = 'Invalid phone number format'
-                db.session.commit()
-                return jsonify({'error': 'Invalid phone number format'}), 400
             
             # Calculate amount to send (subtract withdrawal fee)
             amount_to_send = amount - withdrawal_fee
@@ -2111,35 +2073,28 @@ def request_payout(current_partner):
             # Check if B2C was successful
             if b2c_response.get('ResponseCode') == '0' or b2c_response.get('error') is None:
                 # B2C initiated successfully
-                payout.status = 'processing'
                 payout.transaction_reference = b2c_response.get('ConversationID') or b2c_response.get('OriginatorConversationID')
                 current_app.logger.info(f'B2C payment initiated for payout {payout.id}: {b2c_response}')
             else:
-                # B2C failed
+                # B2C failed: give the balance back
                 payout.status = 'failed'
                 payout.rejection_reason = b2c_response.get('ResponseDescription') or b2c_response.get('error') or 'B2C payment failed'
                 current_app.logger.error(f'B2C payment failed for payout {payout.id}: {b2c_response}')
-                # Don't update balance if payment failed
+                partner_ledger.reverse_payout(payout)
                 db.session.commit()
                 return jsonify({
                     'error': payout.rejection_reason or 'Failed to process payment. Please try again.'
                 }), 400
         except Exception as e:
             current_app.logger.error(f'Error processing B2C payment for payout {payout.id}: {str(e)}', exc_info=True)
+            db.session.rollback()
             payout.status = 'failed'
             payout.rejection_reason = f'Payment processing error: {str(e)}'
+            partner_ledger.reverse_payout(payout)
             db.session.commit()
             return jsonify({
                 'error': 'Failed to process payment. Please try again later.'
             }), 500
-    else:
-        # Bank transfer - keep as pending for admin approval
-        payout.status = 'pending'
-    
-    # Update partner balance only if payment is processing/completed
-    if payout.status in ['processing', 'completed']:
-        current_partner.pending_earnings -= amount
-        current_partner.withdrawn_earnings += amount
     
     db.session.commit()
     
@@ -2294,6 +2249,7 @@ def promote_event(current_partner, event_id):
         
         if response.get('ResponseCode') == '0':
             # Success - STK push sent
+            payment.checkout_request_id = response.get('CheckoutRequestID')
             payment.payment_metadata = {
                 'CheckoutRequestID': response.get('CheckoutRequestID'),
                 'MerchantRequestID': response.get('MerchantRequestID')
@@ -2324,6 +2280,7 @@ def promote_event(current_partner, event_id):
         promotion.is_paid = False
         promotion.is_active = True
         db.session.commit()
+        invalidate_event_listings()
         
         return jsonify({
             'message': 'Event promoted successfully (free promotion)',
@@ -1,24 +1,14 @@
 from flask import Blueprint, request, jsonify, current_app
 from datetime import datetime
 import re
-from sqlalchemy import func, or_, cast, String
 from app import db
 from app.models.payment import Payment
 from app.models.ticket import Booking
-from app.models.ticket import Ticket
 from app.models.event import EventPromotion
-from app.models.partner import Partner
 from app.utils.decorators import user_required
 from app.utils.mpesa import MPesaClient, format_phone_number
-from app.utils.qrcode_generator import generate_qr_code
-from app.utils.email import send_booking_confirmation_email, send_payment_confirmation_email, send_payment_failed_email, send_promotion_payment_success_email, send_payment_failed_email
-from app.utils.sms import (
-    send_payment_confirmation_sms, 
-    send_booking_confirmation_sms,
-    send_payment_failed_sms,
-    send_promotion_payment_success_sms
-)
-from app.routes.notifications import notify_new_booking, notify_payment_completed, create_notification
+from app.utils.payment_processing import complete_ticket_payment, send_ticket_payment_notifications
+from app.utils.mpesa_inbox import record_callback, callback_workers
 
 bp = Blueprint('payments', __name__)
 
@@ -106,6 +96,7 @@ def initiate_payment(current_user):
     
     if response.get('ResponseCode') == '0':
         # Success - STK push sent
+        payment.checkout_request_id = response.get('CheckoutRequestID')
         payment.payment_metadata = {
             'CheckoutRequestID': response.get('CheckoutRequestID'),
             'MerchantRequestID': response.get('MerchantRequestID')
@@ -159,12 +150,13 @@ def mpesa_callback():
     The callback is called automatically when:
     - User completes STK push payment
     - Payment is cancelled or fails
+    
+    The callback is only stored in the mpesa_callbacks inbox and acknowledged;
+    callback workers confirm the booking, issue tickets and send notifications
+    (see app/utils/mpesa_inbox.py). Repeated callbacks are acknowledged and ignored.
     """
     try:
-        data = request.get_json()
-        
-        # Log callback for debugging
-        current_app.logger.info(f'MPesa callback received: {data}')
+        data = request.get_json(silent=True)
         
         if not data:
             current_app.logger.error('MPesa callback: No data received')
@@ -176,252 +168,23 @@ def mpesa_callback():
             current_app.logger.error(f'MPesa callback: Invalid callback structure: {data}')
             return jsonify({'error': 'Invalid callback structure'}), 400
         
-        result_code = callback_data.get('ResultCode')
         checkout_request_id = callback_data.get('CheckoutRequestID')
-        
         if not checkout_request_id:
             current_app.logger.error(f'MPesa callback: No CheckoutRequestID in callback: {callback_data}')
             return jsonify({'error': 'CheckoutRequestID missing'}), 400
         
-        # Find payment by CheckoutRequestID
-        # Use a database-agnostic approach that works with SQLite and PostgreSQL
-        # SQLite stores JSON as TEXT, so we can use json_extract or filter in Python
-        payment = None
-        try:
-            # Try SQLite JSON1 extension (most efficient for SQLite)
-            payment = Payment.query.filter(
-                func.json_extract(Payment.payment_metadata, '$.CheckoutRequestID') == checkout_request_id
-            ).first()
-        except Exception as e:
-            current_app.logger.debug(f'JSON1 query failed, using Python filter: {str(e)}')
+        entry = record_callback(callback_data)
+        if entry is None:
+            current_app.logger.info(f'MPesa callback: duplicate callback for {checkout_request_id}')
+            return jsonify({'message': 'Callback already received'}), 200
         
-        # Fallback: if JSON1 didn't work or returned None, filter in Python
-        if not payment:
-            all_payments = Payment.query.filter(
-                Payment.payment_metadata.isnot(None)
-            ).all()
-            payment = next(
-                (p for p in all_payments 
-                 if p.payment_metadata and p.payment_metadata.get('CheckoutRequestID') == checkout_request_id),
-                None
-            )
-        
-        if not payment:
-            current_app.logger.error(f'MPesa callback: Payment not found for CheckoutRequestID: {checkout_request_id}')
-            return jsonify({'error': 'Payment not found'}), 404
-        
-        if result_code == 0:
-            # Payment successful
-            callback_metadata = callback_data.get('CallbackMetadata', {}).get('Item', [])
-            
-            # Extract details
-            mpesa_receipt = None
-            phone_number = None
-            
-            for item in callback_metadata:
-                if item.get('Name') == 'MpesaReceiptNumber':
-                    mpesa_receipt = item.get('Value')
-                elif item.get('Name') == 'PhoneNumber':
-                    phone_number = item.get('Value')
-            
-            # Update payment
-            payment.status = 'completed'
-            payment.completed_at = datetime.utcnow()
-            payment.mpesa_receipt_number = mpesa_receipt
-            
-            # Handle promotion payments
-            if payment.payment_type == 'promotion':
-                promotion = EventPromotion.query.filter_by(payment_id=payment.id).first()
-                if promotion:
-                    promotion.is_paid = True
-                    promotion.is_active = True
-                    db.session.commit()
-                    
-                    # Notify partner
-                    partner = Partner.query.get(payment.partner_id)
-                    if partner:
-                        create_notification(
-                            partner_id=partner.id,
-                            title='Promotion Payment Successful!',
-                            message=f'Your event "{promotion.event.title}" is now promoted in the Can\'t Miss section.',
-                            notification_type='promotion',
-                            event_id=promotion.event_id,
-                            action_url=f'/events/{promotion.event_id}',
-                            action_text='View Event'
-                        )
-                        # Send promotion success SMS and email
-                        try:
-                            send_promotion_payment_success_sms(partner, promotion.event)
-                        except Exception as sms_error:
-                            current_app.logger.warning(f'Failed to send promotion success SMS: {str(sms_error)}')
-                        
-                        try:
-                            send_promotion_payment_success_email(partner, promotion.event)
-                        except Exception as email_error:
-                            current_app.logger.warning(f'Failed to send promotion success email: {str(email_error)}')
-                    
-                    return jsonify({'message': 'Payment processed'}), 200
-            
-            # Update booking - find booking by payment_id
-            booking = None
-            if payment.payment_type == 'ticket':
-                booking = Booking.query.filter_by(payment_id=payment.id).first()
-            
-            if booking:
-                booking.payment_status = 'paid'
-                booking.status = 'confirmed'
-                booking.confirmed_at = datetime.utcnow()
-                booking.reserved_until = None  # Clear reservation timer on payment
-                
-                # Create tickets
-                tickets = []
-                for i in range(booking.quantity):
-                    ticket = Ticket(
-                        booking_id=booking.id,
-                        ticket_type_id=booking.event.ticket_types.first().id  # TODO: Handle multiple ticket types
-                    )
-                    db.session.add(ticket)
-                    db.session.flush()
-                    
-                    # Generate QR code
-                    qr_data = ticket.ticket_number
-                    qr_path = generate_qr_code(qr_data, ticket.ticket_number)
-                    ticket.qr_code = qr_path
-                    
-                    tickets.append(ticket)
-                
-                # Update event stats
-                event = booking.event
-                event.attendee_count += booking.quantity
-                event.total_tickets_sold += booking.quantity
-                event.revenue += booking.total_amount
-                
-                # Update partner earnings
-                partner = event.organizer
-                partner.pending_earnings += booking.partner_amount
-                partner.total_earnings += booking.partner_amount
-                
-                # Update ticket type availability
-                ticket_type = booking.event.ticket_types.first()
-                if ticket_type and ticket_type.quantity_available is not None:
-                    ticket_type.quantity_available -= booking.quantity
-                    ticket_type.quantity_sold += booking.quantity
-                
-                # Update promo code usage
-                if booking.promo_code:
-                    booking.promo_code.current_uses += 1
-                
-                db.session.commit()
-                
-                # Send payment confirmation email to user
-                send_payment_confirmation_email(booking, payment, tickets)
-                
-                # Send booking confirmation email (includes tickets)
-                send_booking_confirmation_email(booking, tickets)
-                
-                # Send payment confirmation SMS
-                send_payment_confirmation_sms(booking, payment)
-                
-                # Send booking confirmation SMS
-                # Use phone number from payment (most reliable for paid events)
-                phone_for_sms = payment.phone_number or booking.user.phone_number
-                send_booking_confirmation_sms(booking, tickets, phone_number_override=phone_for_sms)
-                
-                # Notify user of successful payment
-                create_notification(
-                    user_id=booking.user_id,
-                    title='Payment Successful!',
-                    message=f'Your payment of KES {payment.amount:,.2f} for "{event.title}" has been confirmed.',
-                    notification_type='payment',
-                    event_id=event.id,
-                    booking_id=booking.id,
-                    action_url=f'/bookings/{booking.id}',
-                    action_text='View Booking',
-                    send_email=False  # Already sent email above
-                )
-                
-                # Notify partner of new booking and payment
-                notify_new_booking(event, booking)
-                notify_payment_completed(booking, payment)
-        else:
-            # Payment failed or cancelled
-            result_desc = callback_data.get('ResultDesc', 'Payment failed')
-            result_code_int = int(result_code) if result_code is not None else None
-            
-            # Map MPesa result codes:
-            # ResultCode 0 = Success (handled above)
-            # ResultCode 2001 = Initiator information invalid (STK push never sent - phone/amount validation failed)
-            # ResultCode 1032 = User cancelled the STK push (user saw prompt and cancelled)
-            # ResultCode 2002 = Insufficient balance (user tried to pay but no funds)
-            # ResultCode 2003 = Transaction cancelled by user (user cancelled)
-            # ResultCode 2004 = Transaction timeout (user didn't respond in time - wait longer before marking failed)
-            # ResultCode 2005 = Duplicate transaction
-            
-            # ResultCode 2001 means the STK push was never sent to the user's phone
-            # This happens when MPesa validates the request and finds issues before sending
-            # Common causes: phone not registered for M-Pesa, invalid amount, etc.
-            # Since the user never got a prompt, we should mark as failed immediately
-            
-            # For ResultCode 2004 (timeout), the user might still be processing the payment
-            # Give them more time - don't mark as failed immediately, keep as pending for a bit longer
-            # Only mark as failed if it's been pending for more than 2 minutes after timeout callback
-            
-            # Check if payment was created recently (within last 2 minutes)
-            time_since_creation = (datetime.utcnow() - payment.created_at).total_seconds()
-            
-            # For timeout (2004), wait at least 2 minutes before marking as failed
-            # This gives the user time to complete the payment even if MPesa sends timeout callback early
-            if result_code_int == 2004 and time_since_creation < 120:
-                # Keep as pending - user might still complete payment
-                current_app.logger.info(
-                    f'Payment {payment.id} timeout callback received but payment created recently '
-                    f'({time_since_creation:.1f}s ago). Keeping as pending to allow user to complete payment.'
-                )
-                # Don't mark as failed yet - let the status check endpoint handle it after timeout period
-                return jsonify({'message': 'Callback received, payment still pending'}), 200
-            
-            # For other failure codes, mark as failed immediately
-            # But for codes where user had interaction (1032, 2002, 2003), they attempted payment
-            payment.status = 'failed'
-            payment.failed_at = datetime.utcnow()
-            payment.error_message = result_desc
-            
-            # Log the failure reason with more context
-            current_app.logger.warning(
-                f'Payment {payment.id} failed: ResultCode={result_code}, '
-                f'ResultDesc={result_desc}, Phone={payment.phone_number}, Amount={payment.amount}'
-            )
-            
-            # Find booking for failed payment
-            booking = None
-            if payment.payment_type == 'ticket':
-                booking = Booking.query.filter_by(payment_id=payment.id).first()
-            
-            if booking:
-                booking.payment_status = 'failed'
-                # Send payment failed SMS for ResultCode 2001 (validation failed - STK push never sent)
-                # ResultCode 2001 means the phone number/amount validation failed at MPesa's end
-                # The user never received the STK push prompt, so we should inform them
-                user = booking.user
-                event = booking.event
-                if user and event:
-                    try:
-                        # Send SMS notification for failed payment
-                        send_payment_failed_sms(user, payment, event)
-                    except Exception as sms_error:
-                        current_app.logger.warning(f'Failed to send payment failed SMS: {str(sms_error)}')
-                    
-                    try:
-                        send_payment_failed_email(user, payment, event)
-                    except Exception as email_error:
-                        current_app.logger.warning(f'Failed to send payment failed email: {str(email_error)}')
-            
-            db.session.commit()
-        
-        current_app.logger.info(f'MPesa callback processed for payment {payment.id}, result_code: {result_code}')
-        return jsonify({'message': 'Callback processed'}), 200
+        callback_workers.wake()
+        current_app.logger.info(
+            f'MPesa callback queued for {checkout_request_id}, result_code: {callback_data.get("ResultCode")}'
+        )
+        return jsonify({'message': 'Callback received'}), 200
     except Exception as e:
-        current_app.logger.error(f'Error processing MPesa callback: {str(e)}', exc_info=True)
+        current_app.logger.error(f'Error recording MPesa callback: {str(e)}', exc_info=True)
         return jsonify({'error': 'Internal server error processing callback'}), 500
 
 
@@ -442,9 +205,9 @@ def check_payment_status(current_user, payment_id):
     # This prevents querying too early before MPesa has processed the request
     time_since_creation = (datetime.utcnow() - payment.created_at).total_seconds()
     
-    if payment.status == 'pending' and payment.payment_metadata and time_since_creation > 30:
-        checkout_request_id = payment.payment_metadata.get('CheckoutRequestID')
-        
+    checkout_request_id = payment.checkout_request_id or (payment.payment_metadata or {}).get('CheckoutRequestID')
+    
+    if payment.status == 'pending' and time_since_creation > 30:
         if checkout_request_id:
             current_app.logger.info(f'Querying MPesa for payment {payment.id} with CheckoutRequestID: {checkout_request_id}')
             mpesa = MPesaClient()
@@ -491,77 +254,10 @@ def check_payment_status(current_user, payment_id):
                     booking = Booking.query.filter_by(payment_id=payment.id).first()
                 
                 if booking:
-                    booking.payment_status = 'paid'
-                    booking.status = 'confirmed'
-                    booking.confirmed_at = datetime.utcnow()
-                    
-                    # Create tickets if they don't exist
-                    if booking.tickets.count() == 0:
-                        tickets = []
-                        for i in range(booking.quantity):
-                            ticket = Ticket(
-                                booking_id=booking.id,
-                                ticket_type_id=booking.event.ticket_types.first().id
-                            )
-                            db.session.add(ticket)
-                            db.session.flush()
-                            
-                            # Generate QR code
-                            qr_data = ticket.ticket_number
-                            qr_path = generate_qr_code(qr_data, ticket.ticket_number)
-                            ticket.qr_code = qr_path
-                            
-                            tickets.append(ticket)
-                        
-                        # Update event stats
-                        event = booking.event
-                        event.attendee_count += booking.quantity
-                        event.total_tickets_sold += booking.quantity
-                        event.revenue += booking.total_amount
-                        
-                        # Update partner earnings
-                        partner = event.organizer
-                        if partner:
-                            partner.pending_earnings += booking.partner_amount
-                            partner.total_earnings += booking.partner_amount
-                        
-                        # Update ticket type availability
-                        ticket_type = booking.event.ticket_types.first()
-                        if ticket_type and ticket_type.quantity_available is not None:
-                            ticket_type.quantity_available -= booking.quantity
-                            ticket_type.quantity_sold += booking.quantity
-                        
-                        # Update promo code usage
-                        if booking.promo_code:
-                            booking.promo_code.current_uses += 1
-                        
-                        db.session.commit()
-                        
-                        # Send notifications
-                        send_payment_confirmation_email(booking, payment, tickets)
-                        send_booking_confirmation_email(booking, tickets)
-                        send_payment_confirmation_sms(booking, payment)
-                        phone_for_sms = payment.phone_number or booking.user.phone_number
-                        send_booking_confirmation_sms(booking, tickets, phone_number_override=phone_for_sms)
-                        
-                        # Create notifications
-                        create_notification(
-                            user_id=booking.user_id,
-                            title='Payment Successful!',
-                            message=f'Your payment of KES {payment.amount:,.2f} for "{event.title}" has been confirmed.',
-                            notification_type='payment',
-                            event_id=event.id,
-                            booking_id=booking.id,
-                            action_url=f'/bookings/{booking.id}',
-                            action_text='View Booking',
-                            send_email=False
-                        )
-                        
-                        notify_new_booking(event, booking)
-                        notify_payment_completed(booking, payment)
-                    else:
-                        # Tickets already exist, just commit payment status
-                        db.session.commit()
+                    # Confirm unless the callback already did (creates tickets once)
+                    tickets = complete_ticket_payment(payment, booking)
+                    if tickets is not None:
+                        send_ticket_payment_notifications(booking, payment, tickets)
                 else:
                     db.session.commit()
                     
@@ -693,6 +389,7 @@ def initiate_promotion_payment():
     payment.provider_response = response
     
     if response.get('ResponseCode') == '0':
+        payment.checkout_request_id = response.get('CheckoutRequestID')
         payment.payment_metadata = {
             'CheckoutRequestID': response.get('CheckoutRequestID'),
             'MerchantRequestID': response.get('MerchantRequestID')
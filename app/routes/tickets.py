@@ -1,14 +1,24 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, make_response
 from datetime import datetime, timedelta
-from sqlalchemy import func
+from io import BytesIO
 from app import db
 from app.models.event import Event
 from app.models.ticket import TicketType, Booking, Ticket, PromoCode
 from app.models.payment import Payment
 from app.utils.decorators import user_required, partner_required
-from app.utils.qrcode_generator import generate_qr_code
+from app.utils.qrcode_generator import QR_FORMATS, qr_code_url, qr_image, qr_image_cache, qr_settings
+from app.utils.qr_pipeline import qr_pipeline
 from app.utils.email import send_booking_confirmation_email, send_booking_cancellation_email
-from app.utils.ticket_pdf import generate_ticket_pdf
+from app.utils.ticket_pdf import ticket_pdf
+from app.utils.partner_ledger import record_refund
+from app.utils.inventory import (
+    available_quantity,
+    reserve_tickets,
+    sell_tickets,
+    claim_promo_code,
+    release_booking
+)
+from app.utils.reservation_sweeper import reservation_sweeper
 from app.utils.sms import (
     send_booking_confirmation_sms,
     send_booking_cancellation_sms
@@ -189,22 +199,10 @@ def book_event(current_user):
     if quantity > ticket_type.max_per_order:
         return jsonify({'error': f'Maximum {ticket_type.max_per_order} tickets allowed'}), 400
     
-    # Check availability (accounting for reserved but not expired tickets)
-    if ticket_type.quantity_available is not None:
-        # Count tickets reserved by pending bookings that haven't expired
-        reserved_count = db.session.query(func.sum(Booking.quantity)).filter(
-            Booking.event_id == event.id,
-            Booking.status == 'pending',
-            Booking.payment_status == 'unpaid',
-            Booking.reserved_until.isnot(None),
-            Booking.reserved_until >= datetime.utcnow()
-        ).scalar() or 0
-        
-        # Available tickets = total available - reserved (non-expired) tickets
-        actually_available = ticket_type.quantity_available - reserved_count
-        
-        if quantity > actually_available:
-            return jsonify({'error': 'Not enough tickets available'}), 400
+    # Quick availability check (the reservation below is the authoritative one)
+    available = available_quantity(ticket_type)
+    if available is not None and quantity > available:
+        return jsonify({'error': 'Not enough tickets available'}), 400
     
     # Check sales period
     now = datetime.utcnow()
@@ -263,6 +261,22 @@ def book_event(current_user):
                 # Commit phone number update immediately so it's available for SMS
                 db.session.commit()
     
+    # Take the tickets atomically: free events sell straight away, paid
+    # events hold them until payment or until the reservation expires
+    if event.is_free:
+        secured = sell_tickets(ticket_type.id, quantity)
+    else:
+        secured = reserve_tickets(ticket_type.id, quantity)
+    
+    if not secured:
+        db.session.rollback()
+        return jsonify({'error': 'Not enough tickets available'}), 400
+    
+    # Claim a promo code use with the tickets; given back if the booking expires
+    if promo_code and not claim_promo_code(promo_code.id):
+        db.session.rollback()
+        return jsonify({'error': 'Promo code usage limit reached'}), 400
+    
     # Create booking with 5-minute reservation timer for paid events
     reserved_until = None
     if not event.is_free:
@@ -271,6 +285,7 @@ def book_event(current_user):
     booking = Booking(
         user_id=current_user.id,
         event_id=event.id,
+        ticket_type_id=ticket_type.id,
         quantity=quantity,
         total_amount=final_amount,
         platform_fee=platform_fee,
@@ -298,28 +313,16 @@ def book_event(current_user):
                 ticket_type_id=ticket_type.id
             )
             db.session.add(ticket)
-            db.session.flush()
-            
-            # Generate QR code
-            qr_data = ticket.ticket_number
-            qr_path = generate_qr_code(qr_data, ticket.ticket_number)
-            ticket.qr_code = qr_path
-            
             tickets.append(ticket)
+        db.session.flush()
         
-        # Update ticket availability
-        if ticket_type.quantity_available is not None:
-            ticket_type.quantity_available -= quantity
-            ticket_type.quantity_sold += quantity
+        # QR codes are rendered once the booking commits
+        qr_pipeline.schedule(tickets)
         
         # Update event stats
         event.attendee_count += quantity
         event.total_tickets_sold += quantity
         
-        # Update promo code usage
-        if promo_code:
-            promo_code.current_uses += 1
-        
         db.session.commit()
         
         # Send confirmation email
@@ -402,24 +405,20 @@ def cancel_booking(current_user, booking_id):
         # Store original status before cancelling
         was_confirmed = booking.status == 'confirmed'
         
-        # Cancel booking
-        booking.status = 'cancelled'
-        booking.cancelled_at = datetime.utcnow()
+        # Cancel booking and give its tickets back to stock
+        if not release_booking(booking):
+            db.session.rollback()
+            return jsonify({'msg': 'Booking was updated by another request, please try again'}), 409
         
-        # Restore ticket availability if booking was confirmed
         if was_confirmed:
             for ticket in booking.tickets:
                 ticket.is_valid = False
             
-            ticket_type = booking.tickets.first().ticket_type if booking.tickets.first() else None
-            if ticket_type and ticket_type.quantity_available is not None:
-                ticket_type.quantity_available += booking.quantity
-                ticket_type.quantity_sold -= booking.quantity
-            
-            # Update event stats
+            # Update event stats and take the partner's share back (no-op for free bookings)
             if booking.event:
                 booking.event.attendee_count -= booking.quantity
                 booking.event.total_tickets_sold -= booking.quantity
+                record_refund(booking, booking.event.partner_id)
         
         # TODO: Process refund if paid
         
@@ -603,26 +602,13 @@ def get_ticket(current_user, booking_id):
     if not tickets:
         return jsonify({'error': 'No tickets found for this booking'}), 404
     
-    # Ensure QR codes are generated for all tickets
     from flask import current_app
     base_url = current_app.config.get('BASE_URL', 'https://niko-free.com')
     
     ticket_data = []
     for ticket in tickets:
-        # Generate QR code if it doesn't exist
-        if not ticket.qr_code:
-            qr_data = ticket.ticket_number
-            qr_path = generate_qr_code(qr_data, ticket.ticket_number)
-            ticket.qr_code = qr_path
-            db.session.commit()
-        
-        # Build QR code URL
-        if ticket.qr_code.startswith('http'):
-            qr_url = ticket.qr_code
-        elif ticket.qr_code.startswith('/'):
-            qr_url = f"{base_url}{ticket.qr_code}"
-        else:
-            qr_url = f"{base_url}/uploads/{ticket.qr_code}"
+        # Rendered on demand by get_ticket_qr_image
+        qr_url = qr_code_url(ticket.ticket_number)
         
         ticket_data.append({
             'id': ticket.id,
@@ -659,23 +645,7 @@ def get_ticket_qr(current_user, booking_id):
     if not ticket:
         return jsonify({'error': 'No tickets found for this booking'}), 404
     
-    # Generate QR code if it doesn't exist
-    if not ticket.qr_code:
-        qr_data = ticket.ticket_number
-        qr_path = generate_qr_code(qr_data, ticket.ticket_number)
-        ticket.qr_code = qr_path
-        db.session.commit()
-    
-    # Return QR code URL
-    from flask import current_app
-    base_url = current_app.config.get('BASE_URL', 'https://niko-free.com')
-    # Handle both relative paths and full URLs
-    if ticket.qr_code.startswith('http'):
-        qr_url = ticket.qr_code
-    elif ticket.qr_code.startswith('/'):
-        qr_url = f"{base_url}{ticket.qr_code}"
-    else:
-        qr_url = f"{base_url}/uploads/{ticket.qr_code}"
+    qr_url = qr_code_url(ticket.ticket_number)
     
     return jsonify({
         'qr_code_url': qr_url,
@@ -684,6 +654,32 @@ def get_ticket_qr(current_user, booking_id):
     }), 200
 
 
+@bp.route('/<ticket_number>/qr.<fmt>', methods=['GET'])
+def get_ticket_qr_image(ticket_number, fmt):
+    """
+    QR code image of a ticket (qr.png or qr.svg)
+    
+    Public, so it can be embedded in emails: the image only encodes the
+    ticket number in the URL. Served from the QR image cache with a strong
+    ETag; the image of a ticket number never changes.
+    """
+    if fmt not in QR_FORMATS:
+        return jsonify({'error': 'Not found'}), 404
+    
+    box_size = qr_settings()[1]
+    # Only a cache miss needs to check that the ticket exists
+    if qr_image_cache.get((ticket_number, fmt, box_size)) is None:
+        if not db.session.query(Ticket.id).filter_by(ticket_number=ticket_number).first():
+            return jsonify({'error': 'Ticket not found'}), 404
+    
+    content, etag = qr_image(ticket_number, fmt, box_size)
+    response = make_response(content)
+    response.mimetype = QR_FORMATS[fmt]
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response.make_conditional(request)
+
+
 @bp.route('/<int:booking_id>/download', methods=['GET'])
 @user_required
 def download_ticket(current_user, booking_id):
@@ -707,34 +703,22 @@ def download_ticket(current_user, booking_id):
         
         print(f"📄 [TICKET DOWNLOAD] Generating PDF for booking {booking_id}, {len(tickets)} tickets")
         
-        # Ensure QR codes are generated for all tickets
-        for ticket in tickets:
-            if not ticket.qr_code:
-                print(f"📄 [TICKET DOWNLOAD] Generating QR code for ticket {ticket.ticket_number}")
-                qr_data = ticket.ticket_number
-                qr_path = generate_qr_code(qr_data, ticket.ticket_number)
-                ticket.qr_code = qr_path
-                db.session.commit()
-                print(f"📄 [TICKET DOWNLOAD] QR code generated: {qr_path}")
-        
-        # Generate PDF
+        # Generate PDF (or reuse the cached one if the tickets haven't changed)
         print(f"📄 [TICKET DOWNLOAD] Creating PDF buffer...")
-        pdf_buffer = generate_ticket_pdf(booking, tickets)
+        pdf_bytes, etag = ticket_pdf(booking, tickets)
         
         # Create filename
         filename = f"ticket-{booking.booking_number}.pdf"
         
         print(f"📄 [TICKET DOWNLOAD] PDF generated successfully, sending file: {filename}")
         
-        # Reset buffer position
-        pdf_buffer.seek(0)
-        
-        # Return PDF as download
+        # Return PDF as download; the ETag lets clients revalidate an unchanged ticket
         return send_file(
-            pdf_buffer,
+            BytesIO(pdf_bytes),
             mimetype='application/pdf',
             as_attachment=True,
-            download_name=filename
+            download_name=filename,
+            etag=etag
         )
     except Exception as e:
         print(f"❌ [TICKET DOWNLOAD] Error generating PDF: {e}")
@@ -767,34 +751,22 @@ def download_ticket_public(booking_number):
         
         print(f"📄 [TICKET DOWNLOAD PUBLIC] Generating PDF for booking {booking_number}, {len(tickets)} tickets")
         
-        # Ensure QR codes are generated for all tickets
-        for ticket in tickets:
-            if not ticket.qr_code:
-                print(f"📄 [TICKET DOWNLOAD PUBLIC] Generating QR code for ticket {ticket.ticket_number}")
-                qr_data = ticket.ticket_number
-                qr_path = generate_qr_code(qr_data, ticket.ticket_number)
-                ticket.qr_code = qr_path
-                db.session.commit()
-                print(f"📄 [TICKET DOWNLOAD PUBLIC] QR code generated: {qr_path}")
-        
-        # Generate PDF
+        # Generate PDF (or reuse the cached one if the tickets haven't changed)
         print(f"📄 [TICKET DOWNLOAD PUBLIC] Creating PDF buffer...")
-        pdf_buffer = generate_ticket_pdf(booking, tickets)
+        pdf_bytes, etag = ticket_pdf(booking, tickets)
         
         # Create filename
         filename = f"ticket-{booking.booking_number}.pdf"
         
         print(f"📄 [TICKET DOWNLOAD PUBLIC] PDF generated successfully, sending file: {filename}")
         
-        # Reset buffer position
-        pdf_buffer.seek(0)
-        
-        # Return PDF as download
+        # Return PDF as download; the ETag lets clients revalidate an unchanged ticket
         return send_file(
-            pdf_buffer,
+            BytesIO(pdf_bytes),
             mimetype='application/pdf',
             as_attachment=True,
-            download_name=filename
+            download_name=filename,
+            etag=etag
         )
     except Exception as e:
         print(f"❌ [TICKET DOWNLOAD PUBLIC] Error generating PDF: {e}")
@@ -809,31 +781,13 @@ def download_ticket_public(booking_number):
 
 @bp.route('/release-expired', methods=['POST'])
 def release_expired_bookings():
-    """Release expired pending bookings (called by background task or frontend)"""
+    """Release expired pending bookings now
+    
+    The reservation sweeper (in-process or `flask reservation_sweeper`)
+    normally does this at each deadline; this endpoint runs one sweep on demand.
+    """
     try:
-        # Find all pending bookings that have expired (reserved_until < now)
-        expired_bookings = Booking.query.filter(
-            Booking.status == 'pending',
-            Booking.payment_status == 'unpaid',
-            Booking.reserved_until.isnot(None),
-            Booking.reserved_until < datetime.utcnow()
-        ).all()
-        
-        released_count = 0
-        for booking in expired_bookings:
-            # Cancel the expired booking
-            booking.status = 'cancelled'
-            booking.cancelled_at = datetime.utcnow()
-            
-            # Restore promo code usage if applicable
-            if booking.promo_code:
-                booking.promo_code.current_uses = max(0, booking.promo_code.current_uses - 1)
-            
-            released_count += 1
-        
-        if released_count > 0:
-            db.session.commit()
-            current_app.logger.info(f'Released {released_count} expired bookings')
+        released_count = reservation_sweeper.sweep()
         
         return jsonify({
             'message': f'Released {released_count} expired booking(s)',
@@ -841,7 +795,6 @@ def release_expired_bookings():
         }), 200
         
     except Exception as e:
-        db.session.rollback()
         current_app.logger.error(f'Error releasing expired bookings: {str(e)}')
         return jsonify({'error': 'Failed to release expired bookings'}), 500
 
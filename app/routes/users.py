@@ -9,6 +9,8 @@ from app.models.ticket import Booking
 from app.models.notification import Notification
 from app.utils.decorators import user_required
 from app.utils.file_upload import upload_file
+from app.utils.notification_stream import publish_after_commit, recipient_channels
+from app.utils import notification_counters
 
 bp = Blueprint('users', __name__)
 
@@ -256,10 +258,7 @@ def get_notifications(current_user):
     return jsonify({
         'notifications': [notif.to_dict() for notif in notifications.items],
         'total': notifications.total,
-        'unread_count': Notification.query.filter_by(
-            user_id=current_user.id,
-            is_read=False
-        ).count(),
+        'unread_count': notification_counters.unread_count('user', current_user.id),
         'page': notifications.page,
         'pages': notifications.pages
     }), 200
@@ -269,16 +268,13 @@ def get_notifications(current_user):
 @user_required
 def mark_notification_read(current_user, notification_id):
     """Mark notification as read"""
-    notification = Notification.query.filter_by(
-        id=notification_id,
-        user_id=current_user.id
-    ).first()
+    notification = notification_counters.mark_read(notification_id, user_id=current_user.id)
     
     if not notification:
         return jsonify({'error': 'Notification not found'}), 404
     
-    notification.is_read = True
-    notification.read_at = datetime.utcnow()
+    publish_after_commit(db.session, recipient_channels(user_id=current_user.id),
+                         'read', {'ids': [notification.id]})
     db.session.commit()
     
     return jsonify({'message': 'Notification marked as read'}), 200
@@ -288,13 +284,8 @@ def mark_notification_read(current_user, notification_id):
 @user_required
 def mark_all_notifications_read(current_user):
     """Mark all notifications as read"""
-    Notification.query.filter_by(
-        user_id=current_user.id,
-        is_read=False
-    ).update({
-        'is_read': True,
-        'read_at': datetime.utcnow()
-    })
+    notification_counters.mark_all_read('user', current_user.id)
+    publish_after_commit(db.session, recipient_channels(user_id=current_user.id), 'read', {'all': True})
     
     db.session.commit()
     
@@ -0,0 +1,285 @@
+"""
+Hourly and daily rollups for the admin analytics charts.
+
+The chart endpoints read analytics_hourly (today) and analytics_daily
+(7 days, 30 days, all time by month) instead of loading every user,
+partner, event and payment. refresh() keeps them current without
+rescanning history:
+
+- hours in the last ANALYTICS_ROLLUP_LOOKBACK_HOURS are always
+  recomputed, which picks up new rows and recent status changes
+  (a payment completing, a booking being cancelled)
+- older hours are recomputed only if a row in them was created,
+  completed, confirmed or cancelled since the previous refresh
+- daily rows are summed from the hourly rows of the days that changed
+
+Charts call refresh_if_stale() so they are never more than
+ANALYTICS_ROLLUP_MAX_AGE seconds behind; `flask refresh_analytics` can
+also run from cron, and `--full` rebuilds everything (e.g. after deleting
+users or refunding old payments).
+"""
+import threading
+from datetime import datetime, timedelta
+from decimal import Decimal
+from flask import current_app
+from sqlalchemy import or_, delete, insert, func
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models.analytics import AnalyticsHourly, AnalyticsDaily, AnalyticsRollupState
+from app.models.user import User
+from app.models.partner import Partner
+from app.models.event import Event
+from app.models.ticket import Booking
+from app.models.payment import Payment, PartnerPayout
+
+STATE_NAME = 'analytics'
+
+# Rows committed a little after the previous refresh started are still picked up
+REFRESH_OVERLAP = timedelta(minutes=5)
+
+# metric: model, summed amount (None = count only), row filter, timestamps of later changes
+METRICS = {
+    'users': {'model': User},
+    'partners': {'model': Partner},
+    'events': {'model': Event},
+    'bookings': {
+        'model': Booking,
+        'amount': Booking.total_amount,
+        'conditions': (Booking.status == 'confirmed',),
+        'changed': (Booking.confirmed_at, Booking.cancelled_at)
+    },
+    'revenue': {
+        'model': Payment,
+        'amount': Payment.amount,
+        'conditions': (Payment.status == 'completed',),
+        'changed': (Payment.completed_at,)
+    },
+    'platform_fees': {
+        'model': Payment,
+        'amount': Payment.platform_fee,
+        'conditions': (Payment.status == 'completed', Payment.payment_type == 'ticket'),
+        'changed': (Payment.completed_at,)
+    },
+    'promotions': {
+        'model': Payment,
+        'amount': Payment.amount,
+        'conditions': (Payment.status == 'completed', Payment.payment_type == 'promotion'),
+        'changed': (Payment.completed_at,)
+    },
+    'withdrawal_fees': {
+        'model': PartnerPayout,
+        'amount': PartnerPayout.withdrawal_fee,
+        'conditions': (PartnerPayout.status == 'completed',),
+        'changed': (PartnerPayout.completed_at,)
+    }
+}
+
+_refresh_lock = threading.Lock()
+
+
+def floor_hour(value):
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def _hour_buckets(metric, start=None, end=None):
+    """
+    Count and amount per hour of a metric's rows created in [start, end)
+
+    Returns:
+        dict: {hour: (count, amount)}
+    """
+    spec = METRICS[metric]
+    created = spec['model'].created_at
+    amount = spec.get('amount')
+    amount_sum = func.coalesce(func.sum(amount), 0) if amount is not None else None
+
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        hour = func.date_trunc('hour', created)
+    elif dialect == 'sqlite':
+        hour = func.strftime('%Y-%m-%d %H:00:00', created)
+    else:
+        hour = None
+
+    if hour is not None:
+        columns = [hour, func.count()] + ([amount_sum] if amount is not None else [])
+        query = db.session.query(*columns).filter(*spec.get('conditions', ()))
+    else:
+        query = db.session.query(created, *([amount] if amount is not None else [])).filter(
+            *spec.get('conditions', ())
+        )
+    query = query.filter(created.isnot(None))
+    if start is not None:
+        query = query.filter(created >= start, created < end)
+
+    buckets = {}
+    if hour is not None:
+        for row in query.group_by(hour).all():
+            bucket = row[0] if isinstance(row[0], datetime) else datetime.strptime(row[0], '%Y-%m-%d %H:%M:%S')
+            buckets[bucket] = (row[1], Decimal(str(row[2] or 0)) if amount is not None else Decimal(0))
+    else:
+        for row in query.yield_per(5000):
+            bucket = floor_hour(row[0])
+            count, total = buckets.get(bucket, (0, Decimal(0)))
+            buckets[bucket] = (count + 1, total + (Decimal(str(row[1] or 0)) if amount is not None else 0))
+    return buckets
+
+
+def _write_hours(metric, start=None, end=None):
+    """Recompute a metric's hourly rows in [start, end) (everything if start is None)"""
+    buckets = _hour_buckets(metric, start, end)
+    stmt = delete(AnalyticsHourly).where(AnalyticsHourly.metric == metric)
+    if start is not None:
+        stmt = stmt.where(AnalyticsHourly.bucket >= start, AnalyticsHourly.bucket < end)
+    db.session.execute(stmt)
+    if buckets:
+        db.session.execute(insert(AnalyticsHourly), [
+            {'metric': metric, 'bucket': bucket, 'count': count, 'amount': amount}
+            for bucket, (count, amount) in buckets.items()
+        ])
+
+
+def _write_days(metric, start=None, end=None):
+    """Re-sum a metric's daily rows for the days overlapping [start, end) from the hourly rows"""
+    query = db.session.query(AnalyticsHourly.bucket, AnalyticsHourly.count, AnalyticsHourly.amount).filter(
+        AnalyticsHourly.metric == metric
+    )
+    stmt = delete(AnalyticsDaily).where(AnalyticsDaily.metric == metric)
+    if start is not None:
+        first_day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+        last_day = floor_hour(end - timedelta(microseconds=1)).replace(hour=0) + timedelta(days=1)
+        query = query.filter(AnalyticsHourly.bucket >= first_day, AnalyticsHourly.bucket < last_day)
+        stmt = stmt.where(AnalyticsDaily.bucket >= first_day.date(), AnalyticsDaily.bucket < last_day.date())
+
+    days = {}
+    for bucket, count, amount in query.all():
+        day_count, day_amount = days.get(bucket.date(), (0, Decimal(0)))
+        days[bucket.date()] = (day_count + count, day_amount + Decimal(str(amount or 0)))
+    db.session.execute(stmt)
+    if days:
+        db.session.execute(insert(AnalyticsDaily), [
+            {'metric': metric, 'bucket': day, 'count': count, 'amount': amount}
+            for day, (count, amount) in days.items()
+        ])
+
+
+def _changed_hours(metric, since, before):
+    """Hours before `before` holding rows created or changed since `since`"""
+    spec = METRICS[metric]
+    created = spec['model'].created_at
+    changed = [created] + list(spec.get('changed', ()))
+    rows = db.session.query(created).filter(
+        created < before,
+        or_(*[column >= since for column in changed])
+    ).all()
+    return sorted({floor_hour(row[0]) for row in rows if row[0] is not None})
+
+
+def _ranges(hours):
+    """Merge sorted hours into contiguous [start, end) ranges"""
+    ranges = []
+    for hour in hours:
+        if ranges and ranges[-1][1] == hour:
+            ranges[-1][1] = hour + timedelta(hours=1)
+        else:
+            ranges.append([hour, hour + timedelta(hours=1)])
+    return ranges
+
+
+def refresh(full=False, now=None):
+    """
+    Bring the rollups up to date
+
+    Args:
+        full: Rebuild every bucket from scratch (also done on the first run)
+        now: Current time, for tests
+
+    Returns:
+        int: Number of hour ranges recomputed
+    """
+    now = now or datetime.utcnow()
+    state = db.session.get(AnalyticsRollupState, STATE_NAME)
+    lookback = current_app.config.get('ANALYTICS_ROLLUP_LOOKBACK_HOURS', 48)
+    recent_start = floor_hour(now - timedelta(hours=lookback))
+    recent_end = floor_hour(now) + timedelta(hours=1)
+
+    ranges_written = 0
+    for metric in METRICS:
+        if full or state is None:
+            ranges = [[None, None]]
+        else:
+            since = state.refreshed_at - REFRESH_OVERLAP
+            ranges = _ranges(_changed_hours(metric, since, recent_start)) + [[recent_start, recent_end]]
+        for start, end in ranges:
+            _write_hours(metric, start, end)
+            _write_days(metric, start, end)
+        ranges_written += len(ranges)
+
+    if state is None:
+        state = AnalyticsRollupState(name=STATE_NAME, refreshed_at=now)
+        db.session.add(state)
+    state.refreshed_at = now
+    db.session.commit()
+    return ranges_written
+
+
+def refresh_if_stale():
+    """Refresh if the last refresh is older than ANALYTICS_ROLLUP_MAX_AGE seconds"""
+    max_age = current_app.config.get('ANALYTICS_ROLLUP_MAX_AGE', 60)
+    refreshed_at = db.session.query(AnalyticsRollupState.refreshed_at).filter_by(name=STATE_NAME).scalar()
+    if refreshed_at is not None and refreshed_at > datetime.utcnow() - timedelta(seconds=max_age):
+        return
+    # One refresh per process at a time; other requests read the current rollups
+    if not _refresh_lock.acquire(blocking=refreshed_at is None):
+        return
+    try:
+        refresh()
+    except IntegrityError:
+        # Another process refreshed the same buckets concurrently
+        db.session.rollback()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'Analytics rollup refresh failed: {str(e)}', exc_info=True)
+    finally:
+        _refresh_lock.release()
+
+
+def _value(metric, count, amount):
+    return float(amount or 0) if METRICS[metric].get('amount') is not None else count
+
+
+def series(metric, group_by, start=None):
+    """
+    Chart values of a metric keyed like the chart endpoints ('%Y-%m-%d %H:00', '%Y-%m-%d' or '%Y-%m')
+
+    Args:
+        metric: Key of METRICS
+        group_by: hour, day or month
+        start: Only buckets from this time on
+    """
+    data = {}
+    if group_by == 'hour':
+        query = db.session.query(AnalyticsHourly.bucket, AnalyticsHourly.count, AnalyticsHourly.amount).filter(
+            AnalyticsHourly.metric == metric
+        )
+        if start is not None:
+            query = query.filter(AnalyticsHourly.bucket >= floor_hour(start))
+        for bucket, count, amount in query.all():
+            data[bucket.strftime('%Y-%m-%d %H:00')] = _value(metric, count, amount)
+        return data
+
+    query = db.session.query(AnalyticsDaily.bucket, AnalyticsDaily.count, AnalyticsDaily.amount).filter(
+        AnalyticsDaily.metric == metric
+    )
+    if start is not None:
+        query = query.filter(AnalyticsDaily.bucket >= start.date())
+    key_format = '%Y-%m' if group_by == 'month' else '%Y-%m-%d'
+    for bucket, count, amount in query.all():
+        key = bucket.strftime(key_format)
+        data[key] = data.get(key, 0) + _value(metric, count, amount)
+    return data
+
+
+def earliest(*metrics):
+    """First day with data for any of the metrics, or None"""
+    return db.session.query(func.min(AnalyticsDaily.bucket)).filter(AnalyticsDaily.metric.in_(metrics)).scalar()
@@ -0,0 +1,274 @@
+"""
+Response cache for public read endpoints.
+
+Caches the JSON body of successful GET responses keyed on the route
+namespace and the normalized query string. Two backends are available:
+
+- memory: a per-process LRU with per-entry TTLs (default without REDIS_URL)
+- redis: shared between workers, uses REDIS_URL (default when it is set)
+
+Invalidation is done per namespace by bumping a generation counter, so a
+write never has to enumerate keys. Call invalidate_event_listings() after
+any change that affects what the public event pages show.
+
+The memory backend's generations are per process too: with several web
+workers an invalidation only reaches the worker that handled the write,
+and the others keep serving their entries until the TTL runs out. Use
+redis whenever more than one worker serves the API.
+"""
+import json
+import time
+import threading
+from collections import OrderedDict
+from functools import wraps
+from flask import request, current_app, make_response, jsonify
+
+
+# Namespaces used by the public event routes
+EVENT_LIST_NAMESPACES = (
+    'events.list',
+    'events.promoted',
+    'events.categories',
+    'events.this_weekend',
+    'events.calendar',
+    'events.category_events'
+)
+
+
+class LRUCacheBackend:
+    """Thread-safe in-process LRU cache with per-entry expiry"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def generation(self, namespace):
+        with self._lock:
+            return self._generations.get(namespace, 0)
+
+    def bump_generation(self, namespace):
+        with self._lock:
+            self._generations[namespace] = self._generations.get(namespace, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generations.clear()
+
+
+class ByteLRUCache:
+    """Thread-safe in-process LRU of (bytes, ETag) pairs, bounded by their total size"""
+
+    def __init__(self, max_bytes=16 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous[0])
+            self._entries[key] = entry
+            self._size += len(entry[0])
+            while self._size > self.max_bytes and self._entries:
+                _, (content, _) = self._entries.popitem(last=False)
+                self._size -= len(content)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+class RedisCacheBackend:
+    """Redis cache shared between workers"""
+
+    def __init__(self, url, prefix='nikofree:cache:'):
+        import redis
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self.prefix = prefix
+
+    def get(self, key):
+        return self.client.get(self.prefix + key)
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, value, ex=max(int(ttl), 1))
+
+    def generation(self, namespace):
+        value = self.client.get(f'{self.prefix}gen:{namespace}')
+        return int(value) if value else 0
+
+    def bump_generation(self, namespace):
+        self.client.incr(f'{self.prefix}gen:{namespace}')
+
+    def clear(self):
+        for key in self.client.scan_iter(match=f'{self.prefix}*'):
+            self.client.delete(key)
+
+
+class ResponseCache:
+    """Flask extension wrapping the configured cache backend"""
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.enabled = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend_name = app.config.get('RESPONSE_CACHE_BACKEND', 'memory')
+        self.enabled = backend_name != 'none' and not app.config.get('TESTING', False)
+        self.backend = LRUCacheBackend(app.config.get('RESPONSE_CACHE_MAX_ENTRIES', 1024))
+
+        if backend_name == 'redis':
+            try:
+                backend = RedisCacheBackend(app.config['REDIS_URL'])
+                backend.client.ping()
+                self.backend = backend
+            except Exception as e:
+                app.logger.warning(f'Redis response cache unavailable, using in-process cache: {str(e)}')
+
+        app.extensions['response_cache'] = self
+
+    def key(self, namespace):
+        """
+        Cache key of the current request in the namespace's current generation
+
+        Read it before building the response: an invalidation that lands while
+        the response is built then moves the namespace past the key, so the
+        stale response is never served.
+
+        Returns:
+            str: The key, or None if the backend is unavailable
+        """
+        try:
+            generation = self.backend.generation(namespace)
+        except Exception as e:
+            current_app.logger.warning(f'Response cache read failed: {str(e)}')
+            return None
+        # Normalize query args: sorted, repeated keys kept, empty values dropped
+        args = sorted(
+            (key, value) for key, values in request.args.lists()
+            for value in values if value != ''
+        )
+        query = '&'.join(f'{key}={value}' for key, value in args)
+        return f'{namespace}:{generation}:{request.path.rstrip("/")}?{query}'
+
+    def get(self, key):
+        try:
+            return self.backend.get(key)
+        except Exception as e:
+            current_app.logger.warning(f'Response cache read failed: {str(e)}')
+            return None
+
+    def set(self, key, body, ttl):
+        try:
+            self.backend.set(key, body, ttl)
+        except Exception as e:
+            current_app.logger.warning(f'Response cache write failed: {str(e)}')
+
+    def invalidate(self, *namespaces):
+        for namespace in namespaces:
+            try:
+                self.backend.bump_generation(namespace)
+            except Exception as e:
+                current_app.logger.warning(f'Response cache invalidation failed for {namespace}: {str(e)}')
+
+
+response_cache = ResponseCache()
+
+
+def cached_response(namespace, ttl=60, user_overlay=None):
+    """
+    Cache successful GET responses of a public route
+
+    Requests made by a logged-in user (current_user passed by optional_user)
+    bypass the cache because their responses may contain per-user fields,
+    unless a user_overlay is given. In that case the shared anonymous
+    response is built (or read from the cache) once and user_overlay(data,
+    current_user) merges the per-user fields into the decoded JSON.
+
+    Args:
+        namespace: Cache namespace used for invalidation
+        ttl: Time to live in seconds
+        user_overlay: Optional callable adding per-user fields to the payload
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            current_user = kwargs.get('current_user')
+            if request.method != 'GET' or (current_user is not None and user_overlay is None):
+                return fn(*args, **kwargs)
+
+            # Shared responses are always built as for an anonymous visitor
+            if 'current_user' in kwargs:
+                kwargs['current_user'] = None
+
+            key = response_cache.key(namespace) if response_cache.enabled else None
+            body = response_cache.get(key) if key else None
+            cache_status = 'HIT'
+            if body is None:
+                cache_status = 'MISS'
+                response = make_response(fn(*args, **kwargs))
+                if response.status_code != 200 or response.mimetype != 'application/json':
+                    return response
+                body = response.get_data()
+                if key:
+                    response_cache.set(key, body, ttl)
+
+            if current_user is not None:
+                data = json.loads(body)
+                user_overlay(data, current_user)
+                response = make_response(jsonify(data), 200)
+            else:
+                response = make_response(body, 200)
+                response.mimetype = 'application/json'
+            response.headers['X-Cache'] = cache_status
+            return response
+        return wrapper
+    return decorator
+
+
+def invalidate_event_listings():
+    """Drop cached public event listings after an event-visible change"""
+    response_cache.invalidate(*EVENT_LIST_NAMESPACES)
+
+
+def invalidate_locations():
+    """Drop cached location listings"""
+    response_cache.invalidate('events.locations')
+
+
+def invalidate_admin_dashboard():
+    """Drop the cached admin dashboard after an approval or other admin action"""
+    response_cache.invalidate('admin.dashboard')
@@ -0,0 +1,202 @@
+"""
+Admin dashboard stats and recent-activity lists.
+
+collect_stats() computes every dashboard counter in a single statement:
+one conditional-aggregation subquery per table (SUM(CASE WHEN ...)),
+cross-joined into one row. The recent_* helpers select only the columns
+the dashboard shows instead of building full to_dict() payloads, which
+load relations one row at a time.
+
+The /api/admin/dashboard response is cached for a short TTL (namespace
+'admin.dashboard'); call invalidate_admin_dashboard() after approvals and
+other admin actions that change the counters.
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import select, func, case, and_, true
+from app import db
+from app.models.user import User
+from app.models.partner import Partner
+from app.models.event import Event
+from app.models.ticket import Booking
+from app.models.payment import Payment, PartnerPayout
+from app.models.category import Category
+
+
+def _count_if(*conditions):
+    return func.coalesce(func.sum(case((and_(*conditions), 1), else_=0)), 0)
+
+
+def _sum_if(value, *conditions):
+    return func.coalesce(func.sum(case((and_(*conditions), value), else_=0)), 0)
+
+
+def _change(this_month, last_month):
+    return ((this_month - last_month) / last_month * 100) if last_month > 0 else 0
+
+
+def collect_stats(now=None):
+    """
+    All dashboard counters in one query
+
+    The month-over-month figures compare the last 30 days with the 30 days before.
+    """
+    now = now or datetime.utcnow()
+    thirty_days_ago = now - timedelta(days=30)
+    sixty_days_ago = now - timedelta(days=60)
+
+    def this_month(model):
+        return model.created_at >= thirty_days_ago
+
+    def last_month(model):
+        return and_(model.created_at >= sixty_days_ago, model.created_at < thirty_days_ago)
+
+    users = select(
+        func.count().label('total_users'),
+        _count_if(this_month(User)).label('users_this_month'),
+        _count_if(last_month(User)).label('users_last_month')
+    ).subquery()
+
+    partner_approved = Partner.status == 'approved'
+    partners = select(
+        _count_if(partner_approved).label('total_partners'),
+        _count_if(Partner.status == 'pending').label('pending_partners'),
+        _count_if(partner_approved, this_month(Partner)).label('partners_this_month'),
+        _count_if(partner_approved, last_month(Partner)).label('partners_last_month')
+    ).subquery()
+
+    event_approved = Event.status == 'approved'
+    events = select(
+        _count_if(event_approved).label('total_events'),
+        _count_if(Event.status == 'pending').label('pending_events'),
+        _count_if(event_approved, this_month(Event)).label('events_this_month'),
+        _count_if(event_approved, last_month(Event)).label('events_last_month')
+    ).subquery()
+
+    bookings = select(func.count().label('total_bookings')).select_from(Booking).subquery()
+
+    payments = select(
+        func.coalesce(func.sum(Payment.amount), 0).label('total_revenue'),
+        # Platform fees (7% commission) only come from ticket sales
+        _sum_if(Payment.platform_fee, Payment.payment_type == 'ticket').label('platform_fees'),
+        _sum_if(Payment.amount, Payment.payment_type == 'promotion').label('promotion_revenue')
+    ).where(Payment.status == 'completed').subquery()
+
+    payouts = select(
+        func.coalesce(func.sum(PartnerPayout.withdrawal_fee), 0).label('withdrawal_fees')
+    ).where(PartnerPayout.status == 'completed').subquery()
+
+    # Each subquery returns exactly one row, so the cross join is one row too
+    row = db.session.execute(
+        select(users, partners, events, bookings, payments, payouts).select_from(
+            users.join(partners, true()).join(events, true()).join(bookings, true())
+            .join(payments, true()).join(payouts, true())
+        )
+    ).mappings().one()
+
+    return {
+        'total_users': row['total_users'],
+        'total_partners': row['total_partners'],
+        'total_events': row['total_events'],
+        'total_bookings': row['total_bookings'],
+        'pending_partners': row['pending_partners'],
+        'pending_events': row['pending_events'],
+        'total_revenue': float(row['total_revenue']),
+        'platform_fees': float(row['platform_fees']),
+        'withdrawal_fees': float(row['withdrawal_fees']),
+        'promotion_revenue': float(row['promotion_revenue']),
+        'users_change': round(_change(row['users_this_month'], row['users_last_month']), 1),
+        'partners_change': round(_change(row['partners_this_month'], row['partners_last_month']), 1),
+        'events_change': row['events_this_month'] - row['events_last_month']
+    }
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+def pending_partners(limit=5):
+    rows = db.session.query(
+        Partner.id, Partner.business_name, Partner.email, Partner.created_at, Partner.status, Category.name
+    ).outerjoin(Category, Partner.category_id == Category.id).filter(
+        Partner.status == 'pending'
+    ).order_by(Partner.created_at.desc()).limit(limit).all()
+    return [{
+        'id': row.id,
+        'name': row.business_name,
+        'email': row.email,
+        'category': row.name or 'N/A',
+        'submittedDate': _isoformat(row.created_at) or '',
+        'status': row.status
+    } for row in rows]
+
+
+def pending_events(limit=5):
+    rows = db.session.query(
+        Event.id, Event.title, Event.start_date, Event.status,
+        Partner.business_name, Category.name
+    ).outerjoin(Partner, Event.partner_id == Partner.id).outerjoin(
+        Category, Event.category_id == Category.id
+    ).filter(Event.status == 'pending').order_by(Event.created_at.desc()).limit(limit).all()
+    return [{
+        'id': row.id,
+        'title': row.title,
+        'partner': row.business_name or 'N/A',
+        'category': row.name or 'N/A',
+        'date': _isoformat(row.start_date),
+        'status': row.status
+    } for row in rows]
+
+
+def recent_users(limit=5):
+    rows = db.session.query(
+        User.id, User.email, User.first_name, User.last_name, User.is_active, User.is_verified, User.created_at
+    ).order_by(User.created_at.desc()).limit(limit).all()
+    return [{
+        'id': row.id,
+        'email': row.email,
+        'first_name': row.first_name,
+        'last_name': row.last_name,
+        'full_name': f"{row.first_name} {row.last_name}",
+        'is_active': row.is_active,
+        'is_verified': row.is_verified,
+        'created_at': _isoformat(row.created_at)
+    } for row in rows]
+
+
+def recent_partners(limit=5):
+    rows = db.session.query(
+        Partner.id, Partner.email, Partner.business_name, Partner.status,
+        Partner.is_verified, Partner.created_at, Category.name
+    ).outerjoin(Category, Partner.category_id == Category.id).order_by(
+        Partner.created_at.desc()
+    ).limit(limit).all()
+    return [{
+        'id': row.id,
+        'email': row.email,
+        'business_name': row.business_name,
+        'category': row.name,
+        'status': row.status,
+        'is_verified': row.is_verified,
+        'created_at': _isoformat(row.created_at)
+    } for row in rows]
+
+
+def recent_events(limit=5):
+    rows = db.session.query(
+        Event.id, Event.title, Event.poster_image, Event.start_date, Event.status,
+        Event.is_free, Event.created_at, Event.partner_id, Partner.business_name, Category.name
+    ).outerjoin(Partner, Event.partner_id == Partner.id).outerjoin(
+        Category, Event.category_id == Category.id
+    ).order_by(Event.created_at.desc()).limit(limit).all()
+    return [{
+        'id': row.id,
+        'title': row.title,
+        'poster_image': row.poster_image,
+        'start_date': _isoformat(row.start_date),
+        'status': row.status,
+        'is_free': row.is_free,
+        'partner_id': row.partner_id,
+        'partner': row.business_name,
+        'category': row.name,
+        'created_at': _isoformat(row.created_at)
+    } for row in rows]
@@ -1,10 +1,8 @@
 from flask import current_app, render_template_string
 from flask_mail import Message
 from app import mail
-from threading import Thread
+from app.utils.email_outbox import email_outbox
 from datetime import datetime
-import socket
-import smtplib
 import base64
 import os
 
@@ -124,52 +122,8 @@ def get_email_footer():
     """
 
 
-def send_async_email(app, msg):
-    """Send email asynchronously"""
-    with app.app_context():
-        try:
-            # Check if email sending is suppressed (for development)
-            if app.config.get('MAIL_SUPPRESS_SEND', False):
-                print(f"📧 [DEV MODE] Email suppressed: {msg.subject} to {msg.recipients}")
-                return
-            
-            # Get SMTP connection with timeout
-            mail_server = app.config.get('MAIL_SERVER')
-            mail_port = app.config.get('MAIL_PORT', 587)
-            mail_timeout = app.config.get('MAIL_TIMEOUT', 30)  # Increased for SendGrid
-            
-            print(f"📧 [EMAIL] Attempting to send email to {msg.recipients}")
-            print(f"📧 [EMAIL] SMTP Server: {mail_server}:{mail_port}, Timeout: {mail_timeout}s")
-            
-            # Send email with explicit timeout handling
-            mail.send(msg)
-            print(f"✅ Email sent successfully: {msg.subject} to {msg.recipients}")
-        except (socket.timeout, TimeoutError) as e:
-            error_msg = f"❌ Email timeout error: {str(e)}. SMTP server {app.config.get('MAIL_SERVER')}:{app.config.get('MAIL_PORT')} is not responding (likely blocked by firewall)."
-            print(error_msg)
-            if hasattr(app, 'logger'):
-                app.logger.error(error_msg)
-        except (ConnectionError, ConnectionRefusedError, OSError) as e:
-            error_msg = f"❌ Email connection error: {str(e)}. Cannot connect to SMTP server {app.config.get('MAIL_SERVER')}:{app.config.get('MAIL_PORT')}."
-            print(error_msg)
-            if hasattr(app, 'logger'):
-                app.logger.error(error_msg)
-        except smtplib.SMTPException as e:
-            error_msg = f"❌ SMTP error: {str(e)} (Type: {type(e).__name__})"
-            print(error_msg)
-            if hasattr(app, 'logger'):
-                app.logger.error(error_msg)
-        except Exception as e:
-            error_msg = f"❌ Error sending email: {str(e)} (Type: {type(e).__name__})"
-            print(error_msg)
-            import traceback
-            traceback.print_exc()
-            if hasattr(app, 'logger'):
-                app.logger.error(error_msg, exc_info=True)
-
-
 def send_email(subject, recipient, html_body, text_body=None, sync=False):
-    """Send email - sync=True for immediate sending, sync=False for async"""
+    """Send email - sync=True for immediate sending, sync=False to queue it in the email outbox"""
     import sys
     from flask import current_app
     
@@ -184,14 +138,14 @@ def send_email(subject, recipient, html_body, text_body=None, sync=False):
         print(f"❌ [EMAIL] {error_msg}", file=sys.stderr, flush=True)
         raise ValueError(error_msg)
     
-    msg = Message(
-        subject=subject,
-        recipients=[recipient] if isinstance(recipient, str) else recipient,
-        html=html_body,
-        body=text_body or html_body
-    )
-    
     if sync:
+        msg = Message(
+            subject=subject,
+            recipients=[recipient] if isinstance(recipient, str) else recipient,
+            html=html_body,
+            body=text_body or html_body
+        )
+        
         # Send synchronously for immediate delivery
         try:
             current_app.logger.info(f"📧 [EMAIL] Sending email synchronously to: {', '.join(msg.recipients)}")
@@ -210,25 +164,18 @@ def send_email(subject, recipient, html_body, text_body=None, sync=False):
             print(traceback.format_exc(), file=sys.stderr, flush=True)
             raise
     else:
-        # Send asynchronously
+        # Queue in the email outbox; the email workers deliver it
         try:
-            app = current_app._get_current_object()
-            
             # Check if email sending is suppressed
-            if app.config.get('MAIL_SUPPRESS_SEND', False):
+            if current_app.config.get('MAIL_SUPPRESS_SEND', False):
                 print(f"📧 [DEV MODE] Email suppressed: {subject} to {recipient}")
                 return
             
-            # Start thread and don't wait for it
-            thread = Thread(target=send_async_email, args=(app, msg))
-            thread.daemon = True  # Daemon thread won't block app shutdown
-            thread.start()
-            
-            # Log that email was queued
+            email_outbox.enqueue(subject, recipient, html_body, text_body or html_body)
             print(f"📧 [EMAIL] Email queued: {subject} to {recipient}")
         except Exception as e:
             # Don't let email errors crash the app
-            error_msg = f"❌ Error creating email: {str(e)}"
+            error_msg = f"❌ Error queueing email: {str(e)}"
             print(error_msg)
             if hasattr(current_app, 'logger'):
                 current_app.logger.error(error_msg, exc_info=True)
@@ -1072,6 +1019,12 @@ def send_payment_failed_email(user, payment, event):
 
 def send_event_reminder_email(user, event):
     """Send event reminder email to user"""
+    subject, html_body = render_event_reminder_email(user.first_name, event)
+    send_email(subject, user.email, html_body)
+
+
+def render_event_reminder_email(first_name, event):
+    """Build the event reminder email, returns (subject, html_body)"""
     subject = f"Reminder: {event.title} is Tomorrow!"
     base_url = current_app.config.get('BASE_URL', 'https://niko-free.com')
     frontend_url = current_app.config.get('FRONTEND_URL', base_url)
@@ -1093,7 +1046,7 @@ def send_event_reminder_email(user, event):
             
             <!-- Content -->
             <div style="padding: 40px 30px;">
-                <p style="font-size: 16px; color: #333; margin: 0 0 20px 0;">Hi <strong>{user.first_name}</strong>,</p>
+                <p style="font-size: 16px; color: #333; margin: 0 0 20px 0;">Hi <strong>{first_name}</strong>,</p>
                 <p style="font-size: 16px; color: #555; margin: 0 0 30px 0;">This is a friendly reminder that <strong>{event.title}</strong> is happening tomorrow!</p>
                 
                 <div style="background: linear-gradient(135deg, #f3e5f5 0%, #e1bee7 100%); padding: 25px; border-radius: 8px; margin: 30px 0;">
@@ -1132,7 +1085,7 @@ def send_event_reminder_email(user, event):
     </body>
     </html>
     """
-    send_email(subject, user.email, html_body)
+    return subject, html_body
 
 
 def send_new_booking_to_partner_email(partner, booking, event):
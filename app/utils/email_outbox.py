@@ -0,0 +1,312 @@
+"""
+Durable outbound email.
+
+send_email() stores messages in the email_outbox table (enqueue) instead of
+starting a thread per message. A bounded pool of worker threads (or
+`flask email_worker`) delivers them; queuing, claiming (batches under a
+lease) and the workers are shared with the SMS outbox (app/utils/outbox.py):
+
+- each worker keeps one SMTP connection open and sends many messages over
+  it, reconnecting when the server drops it or after MAIL_MAX_EMAILS
+- messages to the same recipient domain are paced (MAIL_OUTBOX_DOMAIN_RATE
+  per second with MAIL_OUTBOX_DOMAIN_BURST) so a bulk send doesn't get the
+  platform throttled by one provider; paced messages are deferred, not failed
+- temporary failures are retried with exponential backoff, permanent ones
+  (recipient refused, 55x) and messages that used up MAIL_OUTBOX_MAX_ATTEMPTS
+  attempts go to the dead state (`flask email_worker --requeue-dead`)
+"""
+import time
+import smtplib
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from flask_mail import Message
+from sqlalchemy import insert
+from app import db
+from app.models.notification import OutboundEmail
+from app.utils.outbox import Outbox, retry_delay
+
+# SMTP replies that won't succeed on retry
+PERMANENT_SMTP_CODES = {550, 551, 553, 554}
+
+
+def _recipient_domain(recipients):
+    first = recipients[0] if recipients else ''
+    return first.rsplit('@', 1)[-1].lower() if '@' in first else None
+
+
+def is_permanent_failure(error):
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return True
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        return False
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code in PERMANENT_SMTP_CODES
+
+
+class DomainRateLimiter:
+    """Token bucket per recipient domain, shared by the workers of a process"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, domain):
+        """
+        Take a token for domain
+
+        Returns:
+            float: 0 if the message may be sent now, otherwise seconds to wait
+        """
+        if not self.rate or not domain:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(domain, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                self._buckets[domain] = (tokens - 1, now)
+                return 0
+            self._buckets[domain] = (tokens, now)
+            return (1 - tokens) / self.rate
+
+
+class SMTPConnection:
+    """One persistent SMTP session, reopened when needed"""
+
+    def __init__(self, config):
+        self.server = config.get('MAIL_SERVER')
+        self.port = config.get('MAIL_PORT', 587)
+        self.use_tls = config.get('MAIL_USE_TLS', False)
+        self.use_ssl = config.get('MAIL_USE_SSL', False)
+        self.username = config.get('MAIL_USERNAME')
+        self.password = config.get('MAIL_PASSWORD')
+        self.timeout = config.get('MAIL_TIMEOUT', 30)
+        self.max_emails = config.get('MAIL_MAX_EMAILS')
+        self.host = None
+        self.sent = 0
+
+    def open(self):
+        if self.use_ssl:
+            host = smtplib.SMTP_SSL(self.server, self.port, timeout=self.timeout)
+        else:
+            host = smtplib.SMTP(self.server, self.port, timeout=self.timeout)
+            if self.use_tls:
+                host.starttls()
+        if self.username and self.password:
+            host.login(self.username, self.password)
+        self.host = host
+        self.sent = 0
+
+    def close(self):
+        if self.host is not None:
+            try:
+                self.host.quit()
+            except Exception:
+                pass
+            self.host = None
+
+    def send(self, sender, recipients, data):
+        if self.host is None:
+            self.open()
+        try:
+            self.host.sendmail(sender, recipients, data)
+        except smtplib.SMTPServerDisconnected:
+            # Server closed the idle connection; reconnect and try once more
+            self.close()
+            self.open()
+            self.host.sendmail(sender, recipients, data)
+        self.sent += 1
+        if self.max_emails and self.sent >= self.max_emails:
+            self.close()
+
+
+class EmailOutbox(Outbox):
+    """Flask extension: queues emails and runs the delivery workers"""
+
+    extension_name = 'email_outbox'
+    thread_name = 'email-worker'
+    label = 'Email'
+    model = OutboundEmail
+    pending_key = 'email_outbox_pending'
+    max_attempts = 6
+
+    def __init__(self, app=None):
+        self.limiter = DomainRateLimiter(0, 1)
+        # Each worker thread keeps its own SMTP session
+        self._local = threading.local()
+        super().__init__(app)
+
+    def init_app(self, app):
+        self.workers = app.config.get('MAIL_OUTBOX_WORKERS', 2)
+        self.batch_size = app.config.get('MAIL_OUTBOX_BATCH_SIZE', 50)
+        self.max_attempts = app.config.get('MAIL_OUTBOX_MAX_ATTEMPTS', 6)
+        self.lease_seconds = app.config.get('MAIL_OUTBOX_LEASE', 300)
+        self.poll_interval = app.config.get('MAIL_OUTBOX_POLL_INTERVAL', 5)
+        self.limiter = DomainRateLimiter(
+            app.config.get('MAIL_OUTBOX_DOMAIN_RATE', 10),
+            app.config.get('MAIL_OUTBOX_DOMAIN_BURST', 50)
+        )
+        super().init_app(app)
+
+    def enqueue(self, subject, recipients, html_body, text_body=None, sender=None):
+        """
+        Queue an email for delivery
+
+        Doesn't commit: the message is part of the caller's transaction, so it
+        is only sent if that commits (the workers are woken then). A request
+        that queues messages after its last commit has them committed when it
+        succeeds (see _commit_queued).
+
+        Returns:
+            OutboundEmail: The queued message
+        """
+        recipients = [recipients] if isinstance(recipients, str) else list(recipients)
+        email = OutboundEmail(
+            sender=sender,
+            recipients=recipients,
+            subject=subject,
+            html_body=html_body,
+            text_body=text_body,
+            domain=_recipient_domain(recipients)
+        )
+        db.session.add(email)
+        db.session.flush()
+        self.mark_queued()
+        return email
+
+    def enqueue_many(self, messages, commit=True):
+        """
+        Queue many emails with one bulk insert
+
+        Args:
+            messages: Iterable of (subject, recipient, html_body, text_body) tuples
+            commit: Commit now; pass False to commit with the caller's transaction
+                (the workers are woken when it commits)
+
+        Returns:
+            int: Number of messages queued
+        """
+        now = datetime.utcnow()
+        rows = []
+        for subject, recipients, html_body, text_body in messages:
+            recipients = [recipients] if isinstance(recipients, str) else list(recipients)
+            rows.append({
+                'recipients': recipients, 'subject': subject, 'html_body': html_body,
+                'text_body': text_body, 'domain': _recipient_domain(recipients),
+                'status': 'pending', 'attempts': 0, 'next_attempt_at': now, 'created_at': now
+            })
+        if rows:
+            db.session.execute(insert(OutboundEmail), rows)
+            self.mark_queued()
+            if commit:
+                db.session.commit()
+        return len(rows)
+
+    def _record_failure(self, email, error):
+        email.attempts += 1
+        email.last_error = f'{type(error).__name__}: {str(error)}'[:2000]
+        email.locked_until = None
+        email.claimed_by = None
+        if is_permanent_failure(error) or email.attempts >= self.max_attempts:
+            email.status = 'dead'
+            current_app.logger.error(
+                f'Email {email.id} to {email.recipients} moved to dead letter '
+                f'after {email.attempts} attempt(s): {email.last_error}'
+            )
+        else:
+            email.status = 'failed'
+            email.next_attempt_at = datetime.utcnow() + timedelta(seconds=retry_delay(email.attempts))
+            current_app.logger.warning(
+                f'Email {email.id} to {email.recipients} attempt {email.attempts} failed: {email.last_error}'
+            )
+
+    def send_batch(self, emails, connection):
+        """
+        Send claimed messages over connection and record the results
+
+        Returns:
+            int: Number of messages sent
+        """
+        default_sender = current_app.config.get('MAIL_DEFAULT_SENDER')
+        sent_ids = []
+        for email in emails:
+            wait = self.limiter.acquire(email.domain)
+            if wait:
+                # Over the domain's rate: hand it back without using an attempt
+                email.status = 'pending'
+                email.claimed_by = None
+                email.locked_until = None
+                email.next_attempt_at = datetime.utcnow() + timedelta(seconds=wait)
+                continue
+
+            msg = Message(
+                subject=email.subject,
+                recipients=email.recipients,
+                html=email.html_body,
+                body=email.text_body or email.html_body,
+                sender=email.sender or default_sender
+            )
+            try:
+                connection.send(msg.sender, list(msg.send_to), msg.as_bytes())
+                sent_ids.append(email.id)
+            except Exception as e:
+                if not isinstance(e, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused)):
+                    # Connection is unusable; the next message reconnects
+                    connection.close()
+                self._record_failure(email, e)
+
+        if sent_ids:
+            OutboundEmail.query.filter(OutboundEmail.id.in_(sent_ids)).update({
+                'status': 'sent',
+                'attempts': OutboundEmail.attempts + 1,
+                'sent_at': datetime.utcnow(),
+                'last_error': None,
+                'claimed_by': None,
+                'locked_until': None
+            }, synchronize_session=False)
+        db.session.commit()
+        return len(sent_ids)
+
+    def drain(self, connection=None):
+        """
+        Send due messages until none are left. Must be called inside an app context.
+
+        Returns:
+            int: Number of messages sent
+        """
+        own_connection = connection is None
+        connection = connection or SMTPConnection(current_app.config)
+        sent = 0
+        try:
+            while not self._stop.is_set():
+                emails = self.claim_batch()
+                if not emails:
+                    break
+                sent += self.send_batch(emails, connection)
+        finally:
+            if own_connection:
+                connection.close()
+        return sent
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = SMTPConnection(self.app.config)
+        return connection
+
+    def work(self):
+        connection = self._connection()
+        if not self.drain(connection):
+            # Nothing to send: don't hold the SMTP session while idle
+            connection.close()
+
+    def work_failed(self):
+        self._connection().close()
+
+    def worker_stopped(self):
+        self._connection().close()
+
+
+email_outbox = EmailOutbox()
@@ -1,5 +1,6 @@
 import os
 import uuid
+import shutil
 from werkzeug.utils import secure_filename
 from flask import current_app
 
@@ -10,6 +11,81 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in allowed_extensions
 
 
+def _azure_blob_service():
+    """
+    Blob service client for the configured storage account
+
+    Returns:
+        tuple: (BlobServiceClient, container name, account name, account key)
+
+    Raises:
+        ValueError: Azure Storage credentials not configured
+    """
+    from azure.storage.blob import BlobServiceClient
+    
+    # Get Azure Storage configuration
+    connection_string = current_app.config.get('AZURE_STORAGE_CONNECTION_STRING')
+    account_name = current_app.config.get('AZURE_STORAGE_ACCOUNT_NAME')
+    account_key = current_app.config.get('AZURE_STORAGE_ACCOUNT_KEY')
+    container_name = current_app.config.get('AZURE_STORAGE_CONTAINER', 'uploads')
+    
+    if not connection_string and not (account_name and account_key):
+        raise ValueError('Azure Storage credentials not configured')
+    
+    # Initialize Blob Service Client and extract account name if needed
+    if connection_string:
+        blob_service_client = BlobServiceClient.from_connection_string(connection_string)
+        # Extract account name and key from connection string for SAS token generation
+        if not account_name or not account_key:
+            # Parse connection string to get account name and key
+            for part in connection_string.split(';'):
+                if part.startswith('AccountName='):
+                    account_name = part.split('=')[1]
+                elif part.startswith('AccountKey='):
+                    account_key = part.split('=')[1]
+    else:
+        if not account_name or not account_key:
+            raise ValueError('Azure Storage account name and key are required')
+        account_url = f"https://{account_name}.blob.core.windows.net"
+        blob_service_client = BlobServiceClient(account_url=account_url, credential=account_key)
+    
+    return blob_service_client, container_name, account_name, account_key
+
+
+def _azure_blob_url(blob_client, account_name, account_key):
+    """Blob URL, with a read SAS token (valid for 1 year) when the account key is known"""
+    from azure.storage.blob import generate_account_sas, ResourceTypes, AccountSasPermissions
+    from datetime import datetime, timedelta
+    
+    # This allows access even when public access is disabled
+    if account_name and account_key:
+        sas_token = generate_account_sas(
+            account_name=account_name,
+            account_key=account_key,
+            resource_types=ResourceTypes(object=True),
+            permission=AccountSasPermissions(read=True),
+            expiry=datetime.utcnow() + timedelta(days=365)  # 1 year expiration
+        )
+        return f"{blob_client.url}?{sas_token}"
+    # Fallback to regular URL (will work if public access is enabled)
+    return blob_client.url
+
+
+def _local_upload_folder():
+    """Absolute path of the local uploads folder"""
+    # Create upload directory - ensure it's in parent directory (outside niko-free-new)
+    upload_folder = current_app.config.get('UPLOAD_FOLDER', 'uploads')
+    
+    # If relative path, resolve to absolute path in parent directory
+    if not os.path.isabs(upload_folder):
+        # Get the app root (niko-free-new directory)
+        app_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        # Go up one level to parent directory
+        parent_dir = os.path.dirname(app_root)
+        upload_folder = os.path.join(parent_dir, upload_folder)
+    return upload_folder
+
+
 def upload_to_azure_blob(file, folder='general'):
     """
     Upload file to Azure Blob Storage
@@ -22,9 +98,8 @@ def upload_to_azure_blob(file, folder='general'):
         str: Blob URL with SAS token or None if failed
     """
     try:
-        from azure.storage.blob import BlobServiceClient, BlobClient, ContentSettings, generate_account_sas, ResourceTypes, AccountSasPermissions
+        from azure.storage.blob import ContentSettings
         from azure.core.exceptions import AzureError
-        from datetime import datetime, timedelta
         
         if not file or file.filename == '':
             return None
@@ -32,36 +107,12 @@ def upload_to_azure_blob(file, folder='general'):
         if not allowed_file(file.filename):
             raise ValueError('File type not allowed')
         
-        # Get Azure Storage configuration
-        connection_string = current_app.config.get('AZURE_STORAGE_CONNECTION_STRING')
-        account_name = current_app.config.get('AZURE_STORAGE_ACCOUNT_NAME')
-        account_key = current_app.config.get('AZURE_STORAGE_ACCOUNT_KEY')
-        container_name = current_app.config.get('AZURE_STORAGE_CONTAINER', 'uploads')
-        
-        if not connection_string and not (account_name and account_key):
-            raise ValueError('Azure Storage credentials not configured')
-        
         # Generate unique filename
         filename = secure_filename(file.filename)
         name, ext = os.path.splitext(filename)
         unique_filename = f"{folder}/{name}_{uuid.uuid4().hex[:8]}{ext}"
         
-        # Initialize Blob Service Client and extract account name if needed
-        if connection_string:
-            blob_service_client = BlobServiceClient.from_connection_string(connection_string)
-            # Extract account name and key from connection string for SAS token generation
-            if not account_name or not account_key:
-                # Parse connection string to get account name and key
-                for part in connection_string.split(';'):
-                    if part.startswith('AccountName='):
-                        account_name = part.split('=')[1]
-                    elif part.startswith('AccountKey='):
-                        account_key = part.split('=')[1]
-        else:
-            if not account_name or not account_key:
-                raise ValueError('Azure Storage account name and key are required')
-            account_url = f"https://{account_name}.blob.core.windows.net"
-            blob_service_client = BlobServiceClient(account_url=account_url, credential=account_key)
+        blob_service_client, container_name, account_name, account_key = _azure_blob_service()
         
         # Get blob client
         blob_client = blob_service_client.get_blob_client(container=container_name, blob=unique_filename)
@@ -85,20 +136,7 @@ def upload_to_azure_blob(file, folder='general'):
             content_settings=ContentSettings(content_type=content_type)
         )
         
-        # Generate SAS token for secure access (valid for 1 year)
-        # This allows access even when public access is disabled
-        if account_name and account_key:
-            sas_token = generate_account_sas(
-                account_name=account_name,
-                account_key=account_key,
-                resource_types=ResourceTypes(object=True),
-                permission=AccountSasPermissions(read=True),
-                expiry=datetime.utcnow() + timedelta(days=365)  # 1 year expiration
-            )
-            blob_url = f"{blob_client.url}?{sas_token}"
-        else:
-            # Fallback to regular URL (will work if public access is enabled)
-            blob_url = blob_client.url
+        blob_url = _azure_blob_url(blob_client, account_name, account_key)
         
         return blob_url
         
@@ -165,16 +203,7 @@ def upload_file(file, folder='general'):
     name, ext = os.path.splitext(filename)
     unique_filename = f"{name}_{uuid.uuid4().hex[:8]}{ext}"
     
-    # Create upload directory - ensure it's in parent directory (outside niko-free-new)
-    upload_folder = current_app.config.get('UPLOAD_FOLDER', 'uploads')
-    
-    # If relative path, resolve to absolute path in parent directory
-    if not os.path.isabs(upload_folder):
-        # Get the app root (niko-free-new directory)
-        app_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-        # Go up one level to parent directory
-        parent_dir = os.path.dirname(app_root)
-        upload_folder = os.path.join(parent_dir, upload_folder)
+    upload_folder = _local_upload_folder()
     
     target_folder = os.path.join(upload_folder, folder)
     os.makedirs(target_folder, exist_ok=True)
@@ -187,6 +216,62 @@ def upload_file(file, folder='general'):
     return f"/uploads/{folder}/{unique_filename}"
 
 
+def _use_azure_blob():
+    return current_app.config.get('AZURE_STORAGE_USE_BLOB', False)
+
+
+def local_file_path(folder, filename):
+    """Path of a file saved to local storage under folder"""
+    return os.path.join(_local_upload_folder(), folder, filename)
+
+
+def save_file_bytes(content, folder, filename, content_type):
+    """
+    Save generated content (not a user upload) under a fixed name, replacing
+    any previous version. Uses Azure Blob Storage if enabled, falling back
+    to local storage.
+    
+    Args:
+        content: File content, bytes or a binary file object (read in chunks
+            from its current position, so large files aren't held in memory)
+        folder: Subfolder / blob prefix
+        filename: Name within folder (the caller makes it unique)
+        content_type: MIME type
+        
+    Returns:
+        str: Blob URL or /uploads path
+    """
+    start = content.tell() if hasattr(content, 'read') else None
+    if _use_azure_blob():
+        try:
+            from azure.storage.blob import ContentSettings
+            
+            blob_service_client, container_name, account_name, account_key = _azure_blob_service()
+            blob_client = blob_service_client.get_blob_client(container=container_name, blob=f"{folder}/{filename}")
+            blob_client.upload_blob(
+                content,
+                overwrite=True,
+                content_settings=ContentSettings(content_type=content_type)
+            )
+            return _azure_blob_url(blob_client, account_name, account_key)
+        except Exception as e:
+            print(f"⚠️ [FILE UPLOAD] Azure Blob Storage upload of {folder}/{filename} failed ({str(e)}), falling back to local storage")
+            if start is not None:
+                content.seek(start)
+    
+    filepath = local_file_path(folder, filename)
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    # Write then rename, so readers never see a partial file
+    tmp_path = f"{filepath}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp_path, 'wb') as f:
+        if start is not None:
+            shutil.copyfileobj(content, f)
+        else:
+            f.write(content)
+    os.replace(tmp_path, filepath)
+    return f"/uploads/{folder}/{filename}"
+
+
 def delete_file(filepath):
     """Delete file from filesystem or Azure Blob Storage"""
     try:
@@ -0,0 +1,371 @@
+"""
+Ticket inventory reservations.
+
+Every ticket type keeps three counters:
+
+- quantity_available: unsold tickets (None = unlimited)
+- quantity_reserved: tickets held by pending (unpaid) bookings
+- quantity_sold: tickets sold
+
+A booking can only hold tickets if quantity_available - quantity_reserved
+covers it. All counter changes are single conditional UPDATE statements
+(UPDATE ... SET reserved = reserved + n WHERE available - reserved >= n),
+so the check and the write happen atomically in the database:
+
+- PostgreSQL: the UPDATE takes a row lock and concurrent updates re-check
+  the WHERE clause against the committed row, so two bookings can never
+  both take the last ticket.
+- SQLite: there are no row locks, but writers are serialized on the
+  database write lock (and wait for it up to the busy timeout), which
+  gives the same guarantee.
+
+Booking status changes go through conditional UPDATEs on the booking row as
+well (WHERE status = <expected>), so a payment callback, a status poll and
+the expiry sweep racing on the same booking apply their inventory change
+exactly once.
+
+Promo code uses are held the same way: a booking claims a use when it is
+created and gives it back if its reservation expires or is cancelled
+before payment.
+
+Functions only modify the current session's transaction; callers commit.
+"""
+from collections import defaultdict
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import update, select, case, func
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
+from app import db
+from app.models.ticket import TicketType, Booking, PromoCode
+
+
+def _update_ticket_type(ticket_type_id, values, *conditions):
+    """Run a conditional UPDATE on a ticket type and return True if it applied"""
+    result = db.session.execute(
+        update(TicketType)
+        .where(TicketType.id == ticket_type_id, *conditions)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    # Counters changed behind the ORM's back; reload them on next access
+    instance = db.session.identity_map.get(identity_key(TicketType, ticket_type_id))
+    if instance is not None:
+        db.session.expire(instance, ['quantity_available', 'quantity_reserved', 'quantity_sold'])
+    return result.rowcount == 1
+
+
+def _has_stock(quantity):
+    """WHERE clause: enough unsold, unreserved tickets (or unlimited)"""
+    return (TicketType.quantity_available.is_(None)) | (
+        TicketType.quantity_available - TicketType.quantity_reserved >= quantity
+    )
+
+
+def available_quantity(ticket_type):
+    """Tickets that can still be reserved, or None for unlimited"""
+    if ticket_type.quantity_available is None:
+        return None
+    return max(ticket_type.quantity_available - (ticket_type.quantity_reserved or 0), 0)
+
+
+def reserve_tickets(ticket_type_id, quantity):
+    """Hold tickets for a pending booking. Returns False if not enough are left."""
+    return _update_ticket_type(
+        ticket_type_id,
+        {'quantity_reserved': TicketType.quantity_reserved + quantity},
+        _has_stock(quantity)
+    )
+
+
+def release_tickets(ticket_type_id, quantity):
+    """Give back tickets held by a pending booking"""
+    return _update_ticket_type(
+        ticket_type_id,
+        {'quantity_reserved': case(
+            (TicketType.quantity_reserved > quantity, TicketType.quantity_reserved - quantity),
+            else_=0
+        )}
+    )
+
+
+def confirm_reserved_tickets(ticket_type_id, quantity):
+    """Turn held tickets into sold tickets"""
+    return _update_ticket_type(
+        ticket_type_id,
+        {
+            'quantity_reserved': case(
+                (TicketType.quantity_reserved > quantity, TicketType.quantity_reserved - quantity),
+                else_=0
+            ),
+            # NULL (unlimited) stays NULL
+            'quantity_available': TicketType.quantity_available - quantity,
+            'quantity_sold': func.coalesce(TicketType.quantity_sold, 0) + quantity
+        }
+    )
+
+
+def sell_tickets(ticket_type_id, quantity, force=False):
+    """
+    Sell tickets without a prior reservation (free events, late payments)
+
+    Args:
+        ticket_type_id: Ticket type to sell from
+        quantity: Number of tickets
+        force: Sell even if it exceeds availability (payment already taken)
+
+    Returns:
+        bool: True if the tickets were sold
+    """
+    conditions = [] if force else [_has_stock(quantity)]
+    return _update_ticket_type(
+        ticket_type_id,
+        {
+            'quantity_available': TicketType.quantity_available - quantity,
+            'quantity_sold': func.coalesce(TicketType.quantity_sold, 0) + quantity
+        },
+        *conditions
+    )
+
+
+def restock_tickets(ticket_type_id, quantity):
+    """Return sold tickets to stock (cancelled confirmed booking)"""
+    return _update_ticket_type(
+        ticket_type_id,
+        {
+            'quantity_available': TicketType.quantity_available + quantity,
+            'quantity_sold': case(
+                (TicketType.quantity_sold > quantity, TicketType.quantity_sold - quantity),
+                else_=0
+            )
+        }
+    )
+
+
+def claim_promo_code(promo_code_id, force=False):
+    """Take one use of a promo code. Returns False if its usage limit is reached."""
+    conditions = [] if force else [
+        PromoCode.max_uses.is_(None) | (func.coalesce(PromoCode.current_uses, 0) < PromoCode.max_uses)
+    ]
+    result = db.session.execute(
+        update(PromoCode)
+        .where(PromoCode.id == promo_code_id, *conditions)
+        .values(current_uses=func.coalesce(PromoCode.current_uses, 0) + 1)
+        .execution_options(synchronize_session=False)
+    )
+    instance = db.session.identity_map.get(identity_key(PromoCode, promo_code_id))
+    if instance is not None:
+        db.session.expire(instance, ['current_uses'])
+    return result.rowcount == 1
+
+
+def release_promo_code(promo_code_id, uses=1):
+    """Give back promo code uses claimed by bookings that were never paid"""
+    db.session.execute(
+        update(PromoCode)
+        .where(PromoCode.id == promo_code_id)
+        .values(current_uses=case(
+            (PromoCode.current_uses > uses, PromoCode.current_uses - uses),
+            else_=0
+        ))
+        .execution_options(synchronize_session=False)
+    )
+    instance = db.session.identity_map.get(identity_key(PromoCode, promo_code_id))
+    if instance is not None:
+        db.session.expire(instance, ['current_uses'])
+
+
+def booking_ticket_type_id(booking):
+    """Ticket type of a booking (older bookings did not store it)"""
+    if booking.ticket_type_id:
+        return booking.ticket_type_id
+    ticket = booking.tickets.first()
+    if ticket:
+        return ticket.ticket_type_id
+    ticket_type = booking.event.ticket_types.first() if booking.event else None
+    return ticket_type.id if ticket_type else None
+
+
+def _transition(booking, from_status, *conditions, **values):
+    """Atomically move a booking out of from_status; False if it was not in it"""
+    result = db.session.execute(
+        update(Booking)
+        .where(Booking.id == booking.id, Booking.status == from_status, *conditions)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        return False
+    for key, value in values.items():
+        set_committed_value(booking, key, value)
+    return True
+
+
+def confirm_booking(booking):
+    """
+    Mark a booking as paid and confirmed and move its tickets to sold
+
+    Safe to call from several places for the same payment: only the first
+    caller gets True, so only that caller should create tickets and send
+    confirmations.
+
+    Returns:
+        bool: True if this call confirmed the booking
+    """
+    now = datetime.utcnow()
+    values = {
+        'status': 'confirmed',
+        'payment_status': 'paid',
+        'confirmed_at': now,
+        'reserved_until': None
+    }
+    # Only bookings that recorded their ticket type reserved stock
+    held = booking.ticket_type_id is not None
+    ticket_type_id = booking_ticket_type_id(booking)
+
+    if _transition(booking, 'pending', **values):
+        if held:
+            confirm_reserved_tickets(ticket_type_id, booking.quantity)
+            return True
+        # Bookings made before reservations were tracked hold nothing yet
+        if booking.promo_code_id:
+            claim_promo_code(booking.promo_code_id, force=True)
+        if ticket_type_id is not None and not sell_tickets(ticket_type_id, booking.quantity):
+            sell_tickets(ticket_type_id, booking.quantity, force=True)
+            current_app.logger.warning(
+                f'Booking {booking.id} confirmed beyond availability of ticket type {ticket_type_id}'
+            )
+        return True
+
+    # Payment for a booking whose hold already expired or was cancelled
+    # before paying: the money is taken, so the sale goes through even if
+    # it oversells. Paid bookings cancelled later are left alone.
+    if _transition(booking, 'cancelled', Booking.payment_status != 'paid', cancelled_at=None, **values):
+        if booking.promo_code_id:
+            claim_promo_code(booking.promo_code_id, force=True)
+        if ticket_type_id is not None and not sell_tickets(ticket_type_id, booking.quantity):
+            sell_tickets(ticket_type_id, booking.quantity, force=True)
+            current_app.logger.warning(
+                f'Late payment for booking {booking.id} oversold ticket type {ticket_type_id}'
+            )
+        return True
+
+    return False
+
+
+def release_booking(booking):
+    """
+    Cancel a pending or confirmed booking and give its tickets back
+
+    Returns:
+        bool: False if the booking changed concurrently (nothing was done)
+    """
+    from_status = booking.status
+    if from_status not in ('pending', 'confirmed'):
+        return False
+
+    held = booking.ticket_type_id is not None
+    ticket_type_id = booking_ticket_type_id(booking)
+    if not _transition(booking, from_status, status='cancelled', cancelled_at=datetime.utcnow(),
+                       reserved_until=None):
+        return False
+
+    if ticket_type_id is not None:
+        if from_status == 'confirmed':
+            restock_tickets(ticket_type_id, booking.quantity)
+        elif held:
+            release_tickets(ticket_type_id, booking.quantity)
+            if booking.promo_code_id:
+                release_promo_code(booking.promo_code_id)
+    return True
+
+
+def release_expired_batch(now=None, batch_size=500):
+    """
+    Cancel up to batch_size unpaid bookings whose reservation expired
+
+    Bookings are cancelled with a single UPDATE ... RETURNING; their tickets
+    and promo code uses are then given back with one UPDATE per ticket type
+    and promo code in the batch. On PostgreSQL the rows are picked with
+    SKIP LOCKED so several sweepers can run side by side.
+
+    Args:
+        now: Expiry cutoff (defaults to the current time)
+        batch_size: Maximum number of bookings released
+
+    Returns:
+        list: Released rows (id, ticket_type_id, quantity, promo_code_id, reserved_until)
+    """
+    now = now or datetime.utcnow()
+    expired = (
+        Booking.status == 'pending',
+        Booking.payment_status != 'paid',
+        Booking.reserved_until.isnot(None),
+        Booking.reserved_until < now
+    )
+    due = select(Booking.id).where(*expired).order_by(Booking.reserved_until).limit(batch_size)
+    if db.engine.dialect.name == 'postgresql':
+        due = due.with_for_update(skip_locked=True)
+
+    # The expiry conditions are repeated so a payment landing between the
+    # subquery and the update is never cancelled
+    rows = db.session.execute(
+        update(Booking)
+        .where(Booking.id.in_(due.scalar_subquery()), *expired)
+        .values(status='cancelled', cancelled_at=now)
+        .returning(Booking.id, Booking.ticket_type_id, Booking.quantity,
+                   Booking.promo_code_id, Booking.reserved_until)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+    held_tickets = defaultdict(int)
+    held_promos = defaultdict(int)
+    for row in rows:
+        # Only bookings that recorded their ticket type reserved anything
+        if row.ticket_type_id is None:
+            continue
+        held_tickets[row.ticket_type_id] += row.quantity
+        if row.promo_code_id:
+            held_promos[row.promo_code_id] += 1
+
+    for ticket_type_id, quantity in held_tickets.items():
+        release_tickets(ticket_type_id, quantity)
+    for promo_code_id, uses in held_promos.items():
+        release_promo_code(promo_code_id, uses)
+    return rows
+
+
+def next_reservation_deadline():
+    """Earliest reserved_until among unpaid pending bookings, or None"""
+    return db.session.query(func.min(Booking.reserved_until)).filter(
+        Booking.status == 'pending',
+        Booking.payment_status != 'paid',
+        Booking.reserved_until.isnot(None)
+    ).scalar()
+
+
+def rebuild_reserved_counts():
+    """
+    Recompute quantity_reserved from live pending bookings
+
+    Use after deploying the reserved counter or to repair drift.
+
+    Returns:
+        int: Number of ticket types updated
+    """
+    held = dict(
+        db.session.query(Booking.ticket_type_id, func.sum(Booking.quantity))
+        .filter(
+            Booking.status == 'pending',
+            Booking.ticket_type_id.isnot(None)
+        )
+        .group_by(Booking.ticket_type_id).all()
+    )
+    updated = 0
+    for ticket_type in TicketType.query.all():
+        reserved = int(held.get(ticket_type.id) or 0)
+        if ticket_type.quantity_reserved != reserved:
+            ticket_type.quantity_reserved = reserved
+            updated += 1
+    db.session.commit()
+    return updated
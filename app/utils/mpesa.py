@@ -1,10 +1,145 @@
 import requests
 import base64
+import time
+import threading
 from datetime import datetime
 from flask import current_app
+from requests.adapters import HTTPAdapter
 import json
 
 
+# Refresh tokens this many seconds before Daraja expires them
+TOKEN_EXPIRY_MARGIN = 60
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Process-wide requests.Session so connections to Daraja are reused"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+class TokenCache:
+    """
+    OAuth token cache shared by all MPesaClient instances in the process
+
+    Tokens are kept until shortly before they expire. Only one thread per
+    set of credentials fetches a new token; the others wait for it instead
+    of each calling Daraja (single-flight). With a Redis client the token is
+    also shared between worker processes, and a short Redis lock keeps
+    workers from refreshing it at the same time.
+    """
+
+    def __init__(self):
+        self._tokens = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self._redis = {}
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _cached(self, key):
+        entry = self._tokens.get(key)
+        if entry and entry[1] > time.monotonic():
+            return entry[0]
+        return None
+
+    def redis_client(self, url):
+        """Redis client for url, or None if Redis is unavailable"""
+        if url not in self._redis:
+            try:
+                import redis
+                client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+                client.ping()
+            except Exception as e:
+                current_app.logger.warning(f'Redis token cache unavailable, using in-process cache: {str(e)}')
+                client = None
+            self._redis[url] = client
+        return self._redis[url]
+
+    def get(self, key, fetch, redis_client=None):
+        """
+        Return a valid token for key, calling fetch() only when it expired
+
+        Args:
+            key: Cache key (one per base URL and consumer key)
+            fetch: Callable returning (token, expires_in_seconds) or (None, 0)
+            redis_client: Optional Redis client to share tokens between workers
+
+        Returns:
+            str: Access token, or None if it could not be fetched
+        """
+        token = self._cached(key)
+        if token:
+            return token
+
+        with self._key_lock(key):
+            # Another thread may have refreshed it while we waited
+            token = self._cached(key)
+            if token:
+                return token
+
+            if redis_client is not None:
+                try:
+                    token, ttl = self._get_shared(key, fetch, redis_client)
+                except Exception as e:
+                    current_app.logger.warning(f'Redis token cache error: {str(e)}')
+                    token, ttl = fetch()
+            else:
+                token, ttl = fetch()
+
+            if token:
+                self._tokens[key] = (token, time.monotonic() + max(ttl - TOKEN_EXPIRY_MARGIN, 1))
+            return token
+
+    def _get_shared(self, key, fetch, client, wait=5.0):
+        redis_key = f'nikofree:mpesa_token:{key}'
+        lock_key = f'{redis_key}:lock'
+        deadline = time.monotonic() + wait
+        while True:
+            token = client.get(redis_key)
+            if token:
+                return token.decode(), max(client.ttl(redis_key), 1) + TOKEN_EXPIRY_MARGIN
+            if client.set(lock_key, '1', nx=True, ex=int(wait) + 5):
+                try:
+                    token, ttl = fetch()
+                    if token:
+                        client.set(redis_key, token, ex=max(int(ttl) - TOKEN_EXPIRY_MARGIN, 1))
+                    return token, ttl
+                finally:
+                    client.delete(lock_key)
+            if time.monotonic() > deadline:
+                # The worker holding the lock is slow; fetch our own
+                return fetch()
+            time.sleep(0.05)
+
+    def invalidate(self, key, redis_client=None):
+        self._tokens.pop(key, None)
+        if redis_client is not None:
+            try:
+                redis_client.delete(f'nikofree:mpesa_token:{key}')
+            except Exception:
+                pass
+
+    def clear(self):
+        self._tokens.clear()
+
+
+token_cache = TokenCache()
+
+
 class MPesaClient:
     """MPesa Daraja API Client"""
     
@@ -23,9 +158,25 @@ class MPesaClient:
         else:
             # Fallback to production even if misconfigured
             self.base_url = 'https://api.safaricom.co.ke'
+        # Explicit override, e.g. a local stub server for benchmarks
+        self.base_url = current_app.config.get('MPESA_BASE_URL') or self.base_url
+        
+        self.timeout = (
+            current_app.config.get('MPESA_CONNECT_TIMEOUT', 5),
+            current_app.config.get('MPESA_READ_TIMEOUT', 30)
+        )
+        self.session = get_session()
+        self.token_key = f"{self.base_url}:{self.consumer_key}"
+        self.redis = None
+        if current_app.config.get('MPESA_TOKEN_CACHE_BACKEND') == 'redis':
+            self.redis = token_cache.redis_client(current_app.config['REDIS_URL'])
     
     def get_access_token(self):
-        """Get OAuth access token"""
+        """Get OAuth access token (cached until shortly before it expires)"""
+        return token_cache.get(self.token_key, self._fetch_access_token, self.redis)
+    
+    def _fetch_access_token(self):
+        """Request a new OAuth token from Daraja. Returns (token, expires_in)."""
         url = f"{self.base_url}/oauth/v1/generate?grant_type=client_credentials"
         
         # Create basic auth header
@@ -38,12 +189,29 @@ class MPesaClient:
         }
         
         try:
-            response = requests.get(url, headers=headers)
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
             response.raise_for_status()
-            return response.json().get('access_token')
+            data = response.json()
+            return data.get('access_token'), int(data.get('expires_in') or 3599)
         except Exception as e:
             print(f"Error getting MPesa access token: {str(e)}")
-            return None
+            return None, 0
+    
+    def _post(self, url, payload):
+        """POST to Daraja with the cached token, refreshing it once if it was rejected"""
+        for attempt in range(2):
+            access_token = self.get_access_token()
+            if not access_token:
+                return None
+            headers = {
+                'Authorization': f'Bearer {access_token}',
+                'Content-Type': 'application/json'
+            }
+            response = self.session.post(url, json=payload, headers=headers, timeout=self.timeout)
+            if response.status_code != 401 or attempt:
+                return response
+            # Token revoked or expired early
+            token_cache.invalidate(self.token_key, self.redis)
     
     def stk_push(self, phone_number, amount, account_reference, transaction_desc):
         """
@@ -58,10 +226,6 @@ class MPesaClient:
         Returns:
             dict: API response
         """
-        access_token = self.get_access_token()
-        if not access_token:
-            return {'error': 'Failed to get access token'}
-        
         # Generate timestamp
         timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
         
@@ -73,11 +237,6 @@ class MPesaClient:
         # Prepare request
         url = f"{self.base_url}/mpesa/stkpush/v1/processrequest"
         
-        headers = {
-            'Authorization': f'Bearer {access_token}',
-            'Content-Type': 'application/json'
-        }
-        
         payload = {
             'BusinessShortCode': self.business_shortcode,
             'Password': password,
@@ -93,7 +252,9 @@ class MPesaClient:
         }
         
         try:
-            response = requests.post(url, json=payload, headers=headers)
+            response = self._post(url, payload)
+            if response is None:
+                return {'error': 'Failed to get access token'}
             return response.json()
         except Exception as e:
             print(f"Error initiating STK push: {str(e)}")
@@ -109,10 +270,6 @@ class MPesaClient:
         Returns:
             dict: API response
         """
-        access_token = self.get_access_token()
-        if not access_token:
-            return {'error': 'Failed to get access token'}
-        
         # Generate timestamp
         timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
         
@@ -123,11 +280,6 @@ class MPesaClient:
         
         url = f"{self.base_url}/mpesa/stkpushquery/v1/query"
         
-        headers = {
-            'Authorization': f'Bearer {access_token}',
-            'Content-Type': 'application/json'
-        }
-        
         payload = {
             'BusinessShortCode': self.business_shortcode,
             'Password': password,
@@ -136,7 +288,9 @@ class MPesaClient:
         }
         
         try:
-            response = requests.post(url, json=payload, headers=headers)
+            response = self._post(url, payload)
+            if response is None:
+                return {'error': 'Failed to get access token'}
             return response.json()
         except Exception as e:
             print(f"Error querying STK push: {str(e)}")
@@ -154,17 +308,8 @@ class MPesaClient:
         Returns:
             dict: API response
         """
-        access_token = self.get_access_token()
-        if not access_token:
-            return {'error': 'Failed to get access token'}
-        
         url = f"{self.base_url}/mpesa/b2c/v1/paymentrequest"
         
-        headers = {
-            'Authorization': f'Bearer {access_token}',
-            'Content-Type': 'application/json'
-        }
-        
         # Security credential - for production, must be encrypted with MPesa public key
         # This should be set in environment variables as MPESA_SECURITY_CREDENTIAL
         from flask import current_app
@@ -188,7 +333,9 @@ class MPesaClient:
         }
         
         try:
-            response = requests.post(url, json=payload, headers=headers)
+            response = self._post(url, payload)
+            if response is None:
+                return {'error': 'Failed to get access token'}
             return response.json()
         except Exception as e:
             print(f"Error initiating B2C payment: {str(e)}")
@@ -0,0 +1,175 @@
+"""
+Asynchronous processing of M-Pesa STK callbacks.
+
+The webhook only stores the raw callback in the mpesa_callbacks inbox
+(record_callback) and acknowledges it. Entries are then processed by a pool
+of worker threads (or `flask mpesa_callback_worker`):
+
+- one inbox row per CheckoutRequestID, so duplicate deliveries are dropped
+  at insert time
+- an entry is claimed with a conditional UPDATE and a lease (locked_until),
+  so only one worker processes it at a time; a worker that dies mid-way
+  loses the lease and the entry is picked up again
+- failures are retried with exponential backoff and moved to the dead
+  state after MPESA_CALLBACK_MAX_ATTEMPTS attempts (`--requeue-dead`
+  puts them back in the queue)
+
+Processing itself (payment_processing.process_stk_callback) is idempotent,
+so an entry processed twice never issues tickets twice.
+"""
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import or_, and_
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models.payment import MpesaCallback
+from app.utils.payment_processing import process_stk_callback
+from app.utils.outbox import WorkerPool, retry_delay
+
+
+def record_callback(callback_data):
+    """
+    Store an stkCallback in the inbox
+
+    Args:
+        callback_data: The Body.stkCallback dict
+
+    Returns:
+        MpesaCallback: The new entry, or None if it was already received
+    """
+    result_code = callback_data.get('ResultCode')
+    entry = MpesaCallback(
+        checkout_request_id=callback_data['CheckoutRequestID'],
+        result_code=int(result_code) if result_code is not None else None,
+        payload=callback_data
+    )
+    db.session.add(entry)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return None
+    return entry
+
+
+def _claimable(now):
+    return or_(
+        and_(MpesaCallback.status.in_(['pending', 'failed']), MpesaCallback.next_attempt_at <= now),
+        # Lease of a worker that died while processing it
+        and_(MpesaCallback.status == 'processing', MpesaCallback.locked_until < now)
+    )
+
+
+def claim_next(lease_seconds=300):
+    """
+    Claim the oldest due inbox entry for this worker
+
+    Returns:
+        int: The claimed entry id, or None if nothing is due
+    """
+    now = datetime.utcnow()
+    candidates = db.session.query(MpesaCallback.id).filter(
+        _claimable(now)
+    ).order_by(MpesaCallback.next_attempt_at).limit(10).all()
+
+    for (entry_id,) in candidates:
+        claimed = MpesaCallback.query.filter(
+            MpesaCallback.id == entry_id,
+            _claimable(now)
+        ).update({
+            'status': 'processing',
+            'attempts': MpesaCallback.attempts + 1,
+            'locked_until': now + timedelta(seconds=lease_seconds)
+        }, synchronize_session=False)
+        db.session.commit()
+        if claimed == 1:
+            return entry_id
+    return None
+
+
+def process_entry(entry_id, max_attempts=5):
+    """
+    Process a claimed inbox entry and record the result
+
+    Returns:
+        str: The entry status after processing
+    """
+    entry = MpesaCallback.query.get(entry_id)
+    try:
+        outcome = process_stk_callback(entry.payload)
+    except Exception as e:
+        db.session.rollback()
+        entry = MpesaCallback.query.get(entry_id)
+        entry.last_error = str(e)[:2000]
+        entry.locked_until = None
+        if entry.attempts >= max_attempts:
+            entry.status = 'dead'
+            current_app.logger.error(
+                f'MPesa callback {entry.checkout_request_id} moved to dead letter '
+                f'after {entry.attempts} attempts: {str(e)}'
+            )
+        else:
+            entry.status = 'failed'
+            entry.next_attempt_at = datetime.utcnow() + timedelta(seconds=retry_delay(entry.attempts, base=5))
+            current_app.logger.warning(
+                f'MPesa callback {entry.checkout_request_id} attempt {entry.attempts} failed: {str(e)}'
+            )
+        db.session.commit()
+        return entry.status
+
+    entry = MpesaCallback.query.get(entry_id)
+    entry.status = 'processed'
+    entry.outcome = outcome
+    entry.last_error = None
+    entry.locked_until = None
+    entry.processed_at = datetime.utcnow()
+    db.session.commit()
+    current_app.logger.info(f'MPesa callback {entry.checkout_request_id} processed: {outcome}')
+    return entry.status
+
+
+def requeue_dead():
+    """Put dead-lettered callbacks back in the queue. Returns the number requeued."""
+    count = MpesaCallback.query.filter_by(status='dead').update({
+        'status': 'pending',
+        'attempts': 0,
+        'next_attempt_at': datetime.utcnow()
+    }, synchronize_session=False)
+    db.session.commit()
+    return count
+
+
+class CallbackWorkerPool(WorkerPool):
+    """Threads that drain the M-Pesa callback inbox"""
+
+    extension_name = 'mpesa_callback_workers'
+    thread_name = 'mpesa-callback-worker'
+    label = 'MPesa callback'
+    max_attempts = 5
+    lease_seconds = 300
+
+    def init_app(self, app):
+        self.workers = app.config.get('MPESA_CALLBACK_WORKERS', 2)
+        self.max_attempts = app.config.get('MPESA_CALLBACK_MAX_ATTEMPTS', 5)
+        self.lease_seconds = app.config.get('MPESA_CALLBACK_LEASE', 300)
+        self.poll_interval = app.config.get('MPESA_CALLBACK_POLL_INTERVAL', 5)
+        super().init_app(app)
+
+    def drain(self):
+        """
+        Process due entries until none are left. Must be called inside an app context.
+
+        Returns:
+            int: Number of entries processed
+        """
+        processed = 0
+        while not self._stop.is_set():
+            entry_id = claim_next(self.lease_seconds)
+            if entry_id is None:
+                break
+            process_entry(entry_id, self.max_attempts)
+            processed += 1
+        return processed
+
+
+callback_workers = CallbackWorkerPool()
@@ -0,0 +1,208 @@
+"""
+Materialized unread-notification counters.
+
+The unread badge reads one row of notification_counters per recipient
+instead of counting notifications. Everything that changes read state
+keeps the counters in the same transaction:
+
+- add_unread() after inserting notifications
+- mark_read() marks a notification read and subtracts it if it was unread
+- mark_all_read() marks everything read and subtracts the rows it changed
+- remove() subtracts an unread notification once its delete is flushed
+
+A recipient without a counter row gets one the first time their count is
+read or changed, seeded with a COUNT over their unread notifications (on
+PostgreSQL and SQLite the update is an upsert, so a concurrent first read
+can't lose it; on other databases updates skip recipients without a row).
+`flask recount_notifications` rebuilds every counter from the
+notifications table.
+"""
+from datetime import datetime
+from sqlalchemy import update, select, bindparam, case, func, insert
+from app import db
+from app.models.notification import Notification, NotificationCounter
+
+RECIPIENT_COLUMNS = {
+    'user': Notification.user_id,
+    'partner': Notification.partner_id,
+    'admin': Notification.admin_id
+}
+
+
+def recipients_of(notification):
+    """(recipient_type, recipient_id) pairs a notification row (object or dict) counts towards"""
+    get = notification.get if isinstance(notification, dict) else lambda key: getattr(notification, key)
+    return [(recipient_type, get(f'{recipient_type}_id'))
+            for recipient_type in RECIPIENT_COLUMNS if get(f'{recipient_type}_id')]
+
+
+def _counter_table():
+    return NotificationCounter.__table__
+
+
+def _upsert():
+    """The dialect's INSERT ... ON CONFLICT construct, or None if it has none"""
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as upsert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as upsert
+    else:
+        upsert = None
+    return upsert
+
+
+def _adjust(changes):
+    """
+    Add n to each counter; changes maps (recipient_type, recipient_id) to n
+
+    Call it once the change is written (flushed) to the notifications table.
+    """
+    changes = [{'b_type': recipient_type, 'b_id': recipient_id, 'b_n': n}
+               for (recipient_type, recipient_id), n in changes.items() if n]
+    if not changes:
+        return
+    table = _counter_table()
+    now = datetime.utcnow()
+    new_count = table.c.unread_count + bindparam('b_n')
+    clamped = case((new_count > 0, new_count), else_=0)
+    upsert = _upsert()
+    if upsert is None:
+        db.session.execute(
+            update(table).where(
+                table.c.recipient_type == bindparam('b_type'),
+                table.c.recipient_id == bindparam('b_id')
+            ).values(unread_count=clamped, updated_at=now),
+            changes
+        )
+        return
+
+    for recipient_type, column in RECIPIENT_COLUMNS.items():
+        rows = [change for change in changes if change['b_type'] == recipient_type]
+        if not rows:
+            continue
+        # A missing row is seeded with the unread count as this transaction
+        # sees it, which already includes the change being counted
+        seed = select(func.count()).select_from(Notification).where(
+            column == bindparam('b_id'), Notification.is_read == False
+        ).scalar_subquery()
+        statement = upsert(table).values(
+            recipient_type=bindparam('b_type'),
+            recipient_id=bindparam('b_id'),
+            unread_count=seed,
+            updated_at=now
+        )
+        db.session.execute(
+            statement.on_conflict_do_update(
+                index_elements=[table.c.recipient_type, table.c.recipient_id],
+                set_={'unread_count': clamped, 'updated_at': now}
+            ),
+            rows
+        )
+
+
+def add_unread(notifications):
+    """Count newly inserted unread notifications (objects or row dicts)"""
+    changes = {}
+    for notification in notifications:
+        for recipient in recipients_of(notification):
+            changes[recipient] = changes.get(recipient, 0) + 1
+    _adjust(changes)
+
+
+def remove(notification):
+    """Uncount a notification whose delete has been flushed"""
+    if not notification.is_read:
+        _adjust({recipient: -1 for recipient in recipients_of(notification)})
+
+
+def mark_read(notification_id, **recipient):
+    """
+    Mark a notification read, optionally only if it belongs to a recipient (user_id=...)
+
+    Returns:
+        Notification: The notification, or None if not found
+    """
+    notification = Notification.query.filter_by(id=notification_id, **recipient).first()
+    if notification is None:
+        return None
+    # Conditional update, so two concurrent requests don't both uncount it
+    changed = Notification.query.filter_by(id=notification_id, is_read=False).update(
+        {'is_read': True, 'read_at': datetime.utcnow()}, synchronize_session='fetch'
+    )
+    if changed:
+        _adjust({key: -1 for key in recipients_of(notification)})
+    return notification
+
+
+def mark_all_read(recipient_type, recipient_id):
+    """
+    Mark all of a recipient's notifications read
+
+    Returns:
+        int: Number of notifications that were unread
+    """
+    changed = Notification.query.filter(
+        RECIPIENT_COLUMNS[recipient_type] == recipient_id,
+        Notification.is_read == False
+    ).update({'is_read': True, 'read_at': datetime.utcnow()}, synchronize_session=False)
+    # Subtract rather than zero, so notifications committed meanwhile stay counted
+    _adjust({(recipient_type, recipient_id): -changed})
+    return changed
+
+
+def _count(recipient_type, recipient_id):
+    return Notification.query.filter(
+        RECIPIENT_COLUMNS[recipient_type] == recipient_id,
+        Notification.is_read == False
+    ).count()
+
+
+def unread_count(recipient_type, recipient_id):
+    """
+    Unread notifications of a recipient, from their counter row
+
+    Creates the row (and commits) the first time a recipient is looked up.
+    """
+    count = db.session.query(NotificationCounter.unread_count).filter_by(
+        recipient_type=recipient_type, recipient_id=recipient_id
+    ).scalar()
+    if count is not None:
+        return count
+
+    count = _count(recipient_type, recipient_id)
+    row = {'recipient_type': recipient_type, 'recipient_id': recipient_id,
+           'unread_count': count, 'updated_at': datetime.utcnow()}
+    upsert = _upsert()
+    if upsert is not None:
+        db.session.execute(upsert(_counter_table()).values(row).on_conflict_do_nothing())
+        db.session.commit()
+    else:
+        try:
+            db.session.execute(insert(_counter_table()).values(row))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+    return count
+
+
+def recount_all():
+    """
+    Rebuild every counter from the notifications table
+
+    Returns:
+        int: Number of counters written
+    """
+    db.session.execute(_counter_table().delete())
+    now = datetime.utcnow()
+    rows = []
+    for recipient_type, column in RECIPIENT_COLUMNS.items():
+        counts = db.session.query(column, func.count()).filter(
+            column.isnot(None), Notification.is_read == False
+        ).group_by(column).all()
+        rows += [{'recipient_type': recipient_type, 'recipient_id': recipient_id,
+                  'unread_count': count, 'updated_at': now} for recipient_id, count in counts]
+    if rows:
+        db.session.execute(insert(_counter_table()), rows)
+    db.session.commit()
+    return len(rows)
@@ -0,0 +1,332 @@
+"""
+Live notification stream (Server-Sent Events).
+
+New notifications and read-state changes are published on per-recipient
+channels (user:<id>, partner:<id>, admin:<id>) once the transaction that
+made them commits, and GET /api/notifications/stream pushes them to the
+browser together with the new unread count. Two backends are available:
+
+- memory: in-process pub/sub, reaches streams held by the same process
+  (default)
+- redis: messages go through Redis pub/sub (uses REDIS_URL) and every
+  process relays them to its own streams, so a notification created in
+  one worker reaches a stream held by another
+
+The browser's EventSource can't send an Authorization header, so a
+stream is opened with ?ticket=: a signed list of the recipients it may
+follow, valid for NOTIFICATION_STREAM_TICKET_TTL seconds and issued by the
+stream-ticket endpoints (user, partner or admin authentication). A ticket
+only opens streams, so one left in a URL log can't be used against the
+rest of the API.
+
+Streams last NOTIFICATION_STREAM_MAX_DURATION seconds; the client then
+reconnects with a new ticket. Each open stream holds a gunicorn thread, so run
+gunicorn with the gthread worker class; a process holds at most
+NOTIFICATION_STREAM_MAX_STREAMS streams (answering 503 with Retry-After
+beyond that) so they can't take every thread from the other requests.
+"""
+import json
+import time
+import queue
+import threading
+from flask import Response, stream_with_context, jsonify
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app import db
+
+# Session.info key of the messages to publish when the session commits
+PENDING_KEY = 'notification_stream_pending'
+
+
+class Subscription:
+    """Messages for one open stream"""
+
+    def __init__(self, broker, channels, max_queue):
+        self.broker = broker
+        self.channels = channels
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.overflowed = False
+
+    def put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            # Slow client: drop messages and tell it to reload
+            self.overflowed = True
+
+    def get(self, timeout=None):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class LocalBroker:
+    """Thread-safe in-process pub/sub"""
+
+    def __init__(self):
+        self._subscriptions = {}
+        self._lock = threading.RLock()
+
+    def subscribe(self, channels, max_queue=100, limit=None):
+        """
+        Subscribe to channels
+
+        Returns:
+            Subscription: The subscription, or None if limit subscriptions are
+            already open
+        """
+        subscription = Subscription(self, list(channels), max_queue)
+        with self._lock:
+            if limit and self.subscription_count >= limit:
+                return None
+            for channel in subscription.channels:
+                self._subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscriptions = self._subscriptions.get(channel)
+                if subscriptions is not None:
+                    subscriptions.discard(subscription)
+                    if not subscriptions:
+                        del self._subscriptions[channel]
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.put(message)
+        return len(subscriptions)
+
+    def has_subscribers(self, channel):
+        with self._lock:
+            return channel in self._subscriptions
+
+    @property
+    def subscription_count(self):
+        with self._lock:
+            return len({s for subscriptions in self._subscriptions.values() for s in subscriptions})
+
+
+class RedisRelay:
+    """Publishes through Redis and relays every worker's messages to this process's streams"""
+
+    def __init__(self, url, local, prefix='nikofree:notifications:'):
+        import redis
+        self.client = redis.Redis.from_url(url, socket_connect_timeout=0.5)
+        self.local = local
+        self.prefix = prefix
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        self.client.publish(self.prefix + channel, json.dumps(message))
+
+    def start(self, logger):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._listen, args=(logger,), name='notification-relay', daemon=True
+                )
+                self._thread.start()
+
+    def _listen(self, logger):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(self.prefix + '*')
+                for item in pubsub.listen():
+                    channel = item['channel']
+                    if isinstance(channel, bytes):
+                        channel = channel.decode()
+                    self.local.publish(channel[len(self.prefix):], json.loads(item['data']))
+            except Exception as e:
+                logger.warning(f'Notification relay lost Redis, reconnecting: {str(e)}')
+                time.sleep(1)
+
+
+class NotificationStream:
+    """Flask extension: publishes notification events and serves the event streams"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = False
+        self.local = LocalBroker()
+        self.relay = None
+        self.heartbeat = 15
+        self.max_duration = 300
+        self.max_queue = 100
+        self.ticket_ttl = 60
+        self.max_streams = 16
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        backend_name = app.config.get('NOTIFICATION_STREAM_BACKEND', 'memory')
+        self.enabled = backend_name != 'none'
+        self.heartbeat = app.config.get('NOTIFICATION_STREAM_HEARTBEAT', 15)
+        self.max_duration = app.config.get('NOTIFICATION_STREAM_MAX_DURATION', 300)
+        self.max_queue = app.config.get('NOTIFICATION_STREAM_QUEUE_SIZE', 100)
+        self.ticket_ttl = app.config.get('NOTIFICATION_STREAM_TICKET_TTL', 60)
+        self.max_streams = app.config.get('NOTIFICATION_STREAM_MAX_STREAMS', 16)
+        self.relay = None
+
+        if backend_name == 'redis':
+            try:
+                relay = RedisRelay(app.config['REDIS_URL'], self.local)
+                relay.client.ping()
+                self.relay = relay
+            except Exception as e:
+                app.logger.warning(f'Redis notification stream unavailable, using in-process pub/sub: {str(e)}')
+
+        app.extensions['notification_stream'] = self
+
+    def publish(self, channel, message):
+        """Send a message to every stream subscribed to channel"""
+        if not self.enabled:
+            return
+        if self.relay is not None:
+            try:
+                self.relay.publish(channel, message)
+                return
+            except Exception as e:
+                self.app.logger.warning(f'Notification stream publish failed: {str(e)}')
+        self.local.publish(channel, message)
+
+    def is_listening(self, channel):
+        """Whether a stream may be subscribed to channel (with Redis, in any process)"""
+        return self.enabled and (self.relay is not None or self.local.has_subscribers(channel))
+
+    def _serializer(self):
+        return URLSafeTimedSerializer(self.app.config['SECRET_KEY'], salt='notification-stream')
+
+    def issue_ticket(self, recipients):
+        """Ticket opening a stream for (recipient_type, recipient_id) pairs"""
+        return self._serializer().dumps([[recipient_type, recipient_id] for recipient_type, recipient_id in recipients])
+
+    def read_ticket(self, ticket):
+        """
+        Recipients of a stream ticket
+
+        Returns:
+            list: (recipient_type, recipient_id) pairs, or None if the ticket is
+            invalid or expired
+        """
+        try:
+            recipients = self._serializer().loads(ticket, max_age=self.ticket_ttl)
+        except BadSignature:
+            return None
+        return [(recipient_type, recipient_id) for recipient_type, recipient_id in recipients]
+
+    def subscribe(self, channels):
+        """Subscribe a stream, or return None if this process already holds max_streams"""
+        subscription = self.local.subscribe(channels, self.max_queue, limit=self.max_streams)
+        if subscription is not None and self.relay is not None:
+            # Listen to Redis once a stream is actually opened in this process
+            self.relay.start(self.app.logger)
+        return subscription
+
+    def response(self, channels, unread_count):
+        """
+        Server-Sent Events response for the given channels
+
+        Args:
+            channels: Channels to subscribe to
+            unread_count: Callable returning the subscriber's unread count
+        """
+        def current_count():
+            try:
+                return unread_count()
+            finally:
+                # Don't hold a pooled connection for the life of the stream
+                db.session.close()
+
+        # Subscribe now, so a full process answers 503 before streaming starts
+        subscription = self.subscribe(channels)
+        if subscription is None:
+            response = jsonify({'error': 'Too many open notification streams, try again shortly'})
+            response.status_code = 503
+            response.headers['Retry-After'] = str(self.heartbeat)
+            return response
+
+        def generate():
+            with subscription:
+                yield 'retry: 3000\n\n'
+                yield sse('unread_count', {'unread_count': current_count()})
+                deadline = time.monotonic() + self.max_duration
+                while time.monotonic() < deadline:
+                    message = subscription.get(timeout=self.heartbeat)
+                    if message is None:
+                        yield ': keep-alive\n\n'
+                        continue
+                    # Send a burst in one go, then one unread count for all of it
+                    while message is not None:
+                        yield sse(message['event'], message['data'])
+                        message = subscription.get(timeout=0)
+                    if subscription.overflowed:
+                        subscription.overflowed = False
+                        yield sse('resync', {})
+                    yield sse('unread_count', {'unread_count': current_count()})
+
+        response = Response(
+            stream_with_context(generate()),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+        # Also unsubscribes if the client is gone before the stream starts
+        response.call_on_close(subscription.close)
+        return response
+
+
+notification_stream = NotificationStream()
+
+
+def sse(event_name, data):
+    """Format one Server-Sent Event"""
+    return f'event: {event_name}\ndata: {json.dumps(data)}\n\n'
+
+
+def recipient_channels(user_id=None, partner_id=None, admin_id=None):
+    channels = []
+    if user_id:
+        channels.append(f'user:{user_id}')
+    if partner_id:
+        channels.append(f'partner:{partner_id}')
+    if admin_id:
+        channels.append(f'admin:{admin_id}')
+    return channels
+
+
+def publish_after_commit(session, channels, event_name, data):
+    """Publish to channels when session commits; dropped if it rolls back"""
+    if not notification_stream.enabled:
+        return
+    pending = session.info.setdefault(PENDING_KEY, [])
+    for channel in channels:
+        pending.append((channel, {'event': event_name, 'data': data}))
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_pending(session):
+    for channel, message in session.info.pop(PENDING_KEY, ()):
+        notification_stream.publish(channel, message)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_pending(session):
+    session.info.pop(PENDING_KEY, None)
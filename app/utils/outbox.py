@@ -0,0 +1,229 @@
+"""
+Shared machinery of the background queues.
+
+WorkerPool runs a queue's worker threads: they start with the app's first
+request (so scripts and CLI commands that only import the app don't spawn
+any), drain the queue, then sleep until woken or for the poll interval.
+The M-Pesa callback inbox, the reservation sweeper and the outboxes use it.
+
+Outbox adds what the email and SMS outboxes have in common. Its model needs
+status, attempts, next_attempt_at, locked_until and claimed_by columns.
+
+- messages are queued in the caller's transaction and the workers are woken
+  once it commits; a request that queued messages after its last commit has
+  them committed when it succeeds
+- a worker claims a batch of due messages with a conditional UPDATE and a
+  lease (locked_until), so a message is only sent by one worker at a time
+  and is picked up again if its worker dies
+- dead-lettered messages can be put back in the queue (requeue_dead)
+
+Subclasses read their config keys in init_app and implement the send step
+(send_batch, called from drain).
+"""
+import uuid
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import event, or_, and_, select
+from sqlalchemy.orm import Session
+from app import db
+
+_outboxes = []
+
+
+def retry_delay(attempts, base=30, cap=3600):
+    """Exponential backoff: 30s, 60s, 120s, ... capped at one hour"""
+    return min(base * 2 ** (attempts - 1), cap)
+
+
+class WorkerPool:
+    """Flask extension base: daemon worker threads that drain a queue"""
+
+    # app.extensions key, thread name prefix and name used in logs
+    extension_name = None
+    thread_name = 'worker'
+    label = 'Background'
+    # Defaults until init_app reads the config
+    workers = 2
+    poll_interval = 5
+
+    def __init__(self, app=None):
+        self.app = None
+        self._threads = []
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._start_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Register the extension; subclasses read their config first"""
+        self.app = app
+        app.extensions[self.extension_name] = self
+
+        if self.workers > 0 and not app.config.get('TESTING', False):
+            # Start with the first request, so scripts and CLI commands that
+            # only import the app don't spawn workers
+            app.before_request(self._start_once)
+
+    def _start_once(self):
+        if not self._threads:
+            with self._start_lock:
+                if not self._threads:
+                    self.start()
+
+    def wake(self):
+        """Signal that new work is waiting"""
+        self._wake.set()
+
+    def drain(self):
+        """Process due work until none is left. Must be called inside an app context."""
+        raise NotImplementedError
+
+    def work(self):
+        """One round of the worker loop, inside an app context"""
+        self.drain()
+
+    def work_failed(self):
+        """Called after work() raised, once the session is rolled back"""
+
+    def worker_stopped(self):
+        """Called in each worker thread as it exits"""
+
+    def run_forever(self):
+        """Drain the queue, wait for a wake-up or the poll interval, repeat until stop()"""
+        while not self._stop.is_set():
+            self._wake.clear()
+            with self.app.app_context():
+                try:
+                    self.work()
+                except Exception as e:
+                    db.session.rollback()
+                    self.work_failed()
+                    current_app.logger.error(f'{self.label} worker error: {str(e)}', exc_info=True)
+                finally:
+                    db.session.remove()
+            self._wake.wait(self.poll_interval)
+        self.worker_stopped()
+
+    @property
+    def running(self):
+        return any(thread.is_alive() for thread in self._threads)
+
+    def start(self):
+        """Run the workers in daemon threads (once per process)"""
+        if self.running:
+            return
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self.run_forever, name=f'{self.thread_name}-{i}', daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+        self.app.logger.info(f'Started {self.workers} {self.label} worker(s)')
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+
+
+class Outbox(WorkerPool):
+    """Flask extension base: a table of queued messages and the workers delivering them"""
+
+    # Queued message model
+    model = None
+    # Session.info flag: messages were queued in the session's current transaction
+    pending_key = None
+    batch_size = 50
+    max_attempts = 5
+    lease_seconds = 300
+
+    def __init__(self, app=None):
+        _outboxes.append(self)
+        super().__init__(app)
+
+    def init_app(self, app):
+        app.after_request(self._commit_queued)
+        super().init_app(app)
+
+    def mark_queued(self):
+        """Wake the workers once the current transaction commits"""
+        db.session.info[self.pending_key] = True
+
+    def _commit_queued(self, response):
+        """
+        Commit messages a successful request queued after its last commit (e.g.
+        a welcome email sent once the account is saved). A failed request's
+        messages are rolled back with the rest of its work.
+        """
+        if db.session.info.get(self.pending_key) and response.status_code < 400:
+            try:
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                current_app.logger.error(f'Failed to commit queued {self.label} messages: {str(e)}')
+        return response
+
+    def _claimable(self, now):
+        model = self.model
+        return or_(
+            and_(model.status.in_(['pending', 'failed']), model.next_attempt_at <= now),
+            # Lease of a worker that died while sending
+            and_(model.status == 'sending', model.locked_until < now)
+        )
+
+    def claim_batch(self):
+        """
+        Claim up to batch_size due messages for this worker
+
+        Returns:
+            list: Claimed message rows
+        """
+        model = self.model
+        now = datetime.utcnow()
+        token = str(uuid.uuid4())
+        due = select(model.id).where(self._claimable(now)).order_by(
+            model.next_attempt_at
+        ).limit(self.batch_size)
+        if db.engine.dialect.name == 'postgresql':
+            due = due.with_for_update(skip_locked=True)
+
+        claimed = model.query.filter(
+            model.id.in_(due.scalar_subquery()),
+            self._claimable(now)
+        ).update({
+            'status': 'sending',
+            'claimed_by': token,
+            'locked_until': now + timedelta(seconds=self.lease_seconds)
+        }, synchronize_session=False)
+        db.session.commit()
+        if not claimed:
+            return []
+        return model.query.filter_by(claimed_by=token, status='sending').order_by(model.id).all()
+
+    def requeue_dead(self):
+        """Put dead-lettered messages back in the queue. Returns the number requeued."""
+        count = self.model.query.filter_by(status='dead').update({
+            'status': 'pending',
+            'attempts': 0,
+            'next_attempt_at': datetime.utcnow()
+        }, synchronize_session=False)
+        db.session.commit()
+        return count
+
+
+@event.listens_for(Session, 'after_commit')
+def _wake_workers(session):
+    for outbox in _outboxes:
+        if session.info.pop(outbox.pending_key, False):
+            outbox.wake()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_pending(session):
+    for outbox in _outboxes:
+        session.info.pop(outbox.pending_key, None)
@@ -0,0 +1,123 @@
+"""
+Time series for the partner analytics page.
+
+Bookings and revenue are counted per calendar day by one GROUP BY query;
+events are read as (created_at, start_date, status) tuples. Each chart
+bucket is then filled with bisect lookups over the sorted days and
+timestamps and prefix sums, so the cost is O(buckets x log n) rather than
+rescanning every booking for every day.
+"""
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, timedelta
+from sqlalchemy import func
+from app.models.event import Event
+from app.models.ticket import Booking
+
+GRANULARITIES = ('day', 'week', 'month')
+
+# Upper bound for the caller-supplied number of days
+MAX_DAYS = 3650
+
+
+def _as_date(value):
+    # SQLite returns DATE() as a string
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _next_boundary(day, granularity):
+    if granularity == 'week':
+        return day + timedelta(days=7 - day.weekday())
+    if granularity == 'month':
+        return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+    return day + timedelta(days=1)
+
+
+def bucket_starts(first_day, last_day, granularity='day'):
+    """
+    Start dates of the chart buckets covering first_day..last_day
+
+    Day buckets are calendar days, week buckets start on Mondays and month
+    buckets on the 1st; the first bucket starts at first_day and may be partial.
+    """
+    starts = [first_day]
+    while True:
+        boundary = _next_boundary(starts[-1], granularity)
+        if boundary > last_day:
+            return starts
+        starts.append(boundary)
+
+
+def _prefix_sums(values):
+    sums = [0]
+    for value in values:
+        sums.append(sums[-1] + value)
+    return sums
+
+
+def build_series(daily_bookings, events, starts, end, bookings_before=(0, 0.0)):
+    """
+    Chart rows from per-day booking totals and event timestamps
+
+    Args:
+        daily_bookings: [(day, bookings, revenue)] sorted by day, days >= starts[0]
+        events: [(created_at, start_date, status)]
+        starts: Bucket start dates (see bucket_starts)
+        end: Day after the last bucket
+        bookings_before: (bookings, revenue) before starts[0], for the cumulative columns
+    """
+    days = [row[0] for row in daily_bookings]
+    booking_sums = _prefix_sums(row[1] for row in daily_bookings)
+    revenue_sums = _prefix_sums(float(row[2] or 0) for row in daily_bookings)
+    created = sorted(created_at for created_at, _, _ in events if created_at is not None)
+    approved_starts = sorted(start_date for _, start_date, status in events
+                             if status == 'approved' and start_date is not None)
+
+    rows = []
+    for i, bucket_start in enumerate(starts):
+        bucket_end = starts[i + 1] if i + 1 < len(starts) else end
+        start_at = datetime.combine(bucket_start, datetime.min.time())
+        end_at = datetime.combine(bucket_end, datetime.min.time())
+        first = bisect_left(days, bucket_start)
+        last = bisect_left(days, bucket_end)
+        rows.append({
+            'date': bucket_start.strftime('%Y-%m-%d'),
+            # Approved events still upcoming when the bucket started
+            'active_events': len(approved_starts) - bisect_right(approved_starts, start_at),
+            # Events created before the end of the bucket
+            'total_events': bisect_left(created, end_at),
+            'bookings': booking_sums[last] - booking_sums[first],
+            'cumulative_bookings': bookings_before[0] + booking_sums[last],
+            'revenue': revenue_sums[last] - revenue_sums[first],
+            'cumulative_revenue': float(bookings_before[1]) + revenue_sums[last]
+        })
+    return rows
+
+
+def time_series(bookings, events, days=30, granularity='day', now=None):
+    """
+    Chart rows for the last `days` calendar days, today included
+
+    Args:
+        bookings: Query selecting the bookings to chart (any joins and filters)
+        events: Query selecting the partner's events
+        days: Number of days to cover
+        granularity: day, week or month
+        now: Current time, for tests
+    """
+    now = now or datetime.utcnow()
+    days = max(1, min(days, MAX_DAYS))
+    last_day = now.date()
+    first_day = last_day - timedelta(days=days - 1)
+
+    # One grouped query over all days; days before the window only feed the cumulative columns
+    day = func.date(Booking.created_at)
+    daily = bookings.filter(Booking.created_at.isnot(None)).with_entities(
+        day, func.count(Booking.id), func.sum(Booking.partner_amount)
+    ).group_by(day).all()
+    daily = sorted((_as_date(row[0]), row[1], row[2]) for row in daily)
+    split = bisect_left([row[0] for row in daily], first_day)
+    before = (sum(row[1] for row in daily[:split]), sum(float(row[2] or 0) for row in daily[:split]))
+    event_rows = events.with_entities(Event.created_at, Event.start_date, Event.status).all()
+
+    starts = bucket_starts(first_day, last_day, granularity)
+    return build_series(daily[split:], event_rows, starts, last_day + timedelta(days=1), before)
@@ -0,0 +1,257 @@
+"""
+Partner earnings ledger.
+
+Every change to a partner's earnings is appended to partner_ledger in the
+same transaction as the change itself:
+
+- ticket_sale: a paid booking is confirmed (+partner_amount)
+- refund: a paid booking is cancelled (-partner_amount)
+- payout: money sent to the partner (-amount less the withdrawal fee)
+- fee: the withdrawal fee kept from a payout
+- payout_reversal: a payout that failed after it was debited (+amount and fee)
+
+The running balances live on the partner row (pending_earnings = available
+balance, total_earnings, withdrawn_earnings) and are changed by a single
+UPDATE ... RETURNING per entry, which also gives the snapshot stored on the
+entry. Payout debits are conditional (WHERE pending_earnings >= amount), so
+two concurrent payout requests can't overdraw the balance; the row lock
+(PostgreSQL) or the database write lock (SQLite) serializes them.
+
+Dashboards and payout checks read the partner row instead of summing
+bookings. `flask rebuild_partner_ledger` replays existing bookings and
+payouts into the ledger and resets the balances from it.
+
+Functions only modify the current session's transaction; callers commit.
+"""
+from datetime import datetime
+from decimal import Decimal
+from sqlalchemy import update, func, case, delete
+from sqlalchemy.orm.util import identity_key
+from app import db
+from app.models.partner import Partner
+from app.models.event import Event
+from app.models.ticket import Booking
+from app.models.payment import Payment, PartnerPayout, PartnerLedgerEntry
+
+# entry type: (sign of the change to the available balance, partner column also changed)
+ENTRY_TYPES = {
+    'ticket_sale': (1, 'total_earnings'),
+    'refund': (-1, 'total_earnings'),
+    'payout': (-1, 'withdrawn_earnings'),
+    'fee': (-1, 'withdrawn_earnings'),
+    'payout_reversal': (1, 'withdrawn_earnings')
+}
+
+# Payout statuses whose amount has left the partner's balance
+DEBITED_PAYOUT_STATUSES = ('processing', 'completed')
+
+
+def _money(value):
+    return Decimal(str(value or 0)).quantize(Decimal('0.01'))
+
+
+def post(partner_id, entry_type, amount, min_balance=None, **refs):
+    """
+    Apply an entry to the partner's balances and append it to the ledger
+
+    Args:
+        partner_id: Partner whose earnings change
+        entry_type: Key of ENTRY_TYPES
+        amount: Positive amount; the entry type decides the direction
+        min_balance: Only apply if the available balance is at least this
+        refs: booking_id, payment_id, payout_id, description, created_at
+
+    Returns:
+        PartnerLedgerEntry: The entry, or None if min_balance wasn't met
+    """
+    sign, other_column = ENTRY_TYPES[entry_type]
+    change = _money(amount) * sign
+
+    pending = func.coalesce(Partner.pending_earnings, 0)
+    other = func.coalesce(getattr(Partner, other_column), 0)
+    values = {
+        'pending_earnings': pending + change,
+        # Withdrawals grow withdrawn_earnings, sales and refunds move total_earnings with the balance
+        other_column: other - change if other_column == 'withdrawn_earnings' else other + change
+    }
+    stmt = update(Partner).where(Partner.id == partner_id)
+    if min_balance is not None:
+        stmt = stmt.where(pending >= _money(min_balance))
+    row = db.session.execute(
+        stmt.values(**values)
+        .returning(Partner.pending_earnings, Partner.total_earnings, Partner.withdrawn_earnings)
+        .execution_options(synchronize_session=False)
+    ).first()
+
+    # Balances changed behind the ORM's back; reload them on next access
+    instance = db.session.identity_map.get(identity_key(Partner, partner_id))
+    if instance is not None:
+        db.session.expire(instance, ['pending_earnings', 'total_earnings', 'withdrawn_earnings'])
+    if row is None:
+        return None
+
+    entry = PartnerLedgerEntry(
+        partner_id=partner_id,
+        entry_type=entry_type,
+        amount=change,
+        balance_after=row[0],
+        earned_after=row[1] or 0,
+        withdrawn_after=row[2] or 0,
+        **refs
+    )
+    db.session.add(entry)
+    return entry
+
+
+def record_ticket_sale(booking, partner_id):
+    """Credit the partner for a confirmed, paid booking"""
+    return post(
+        partner_id, 'ticket_sale', booking.partner_amount,
+        booking_id=booking.id, payment_id=booking.payment_id,
+        description=f'Booking {booking.booking_number}'
+    )
+
+
+def record_refund(booking, partner_id):
+    """
+    Take back the partner's share of a paid booking that was cancelled
+
+    Returns:
+        PartnerLedgerEntry: The entry, or None if the booking was never credited (e.g. free)
+    """
+    credited = db.session.query(PartnerLedgerEntry.id).filter_by(
+        entry_type='ticket_sale', booking_id=booking.id
+    ).first()
+    if credited is None:
+        return None
+    return post(
+        partner_id, 'refund', booking.partner_amount,
+        booking_id=booking.id, payment_id=booking.payment_id,
+        description=f'Cancelled booking {booking.booking_number}'
+    )
+
+
+def record_payout(payout):
+    """
+    Debit a payout and its withdrawal fee from the partner's balance
+
+    Returns:
+        bool: False (and nothing written) if the balance doesn't cover payout.amount
+    """
+    amount = _money(payout.amount)
+    fee = min(_money(payout.withdrawal_fee), amount)
+    entry = post(
+        payout.partner_id, 'payout', amount - fee, min_balance=amount,
+        payout_id=payout.id, description=f'Payout {payout.reference_number}'
+    )
+    if entry is None:
+        return False
+    if fee:
+        post(payout.partner_id, 'fee', fee, payout_id=payout.id,
+             description=f'Withdrawal fee for {payout.reference_number}')
+    return True
+
+
+def reverse_payout(payout):
+    """
+    Give a failed payout (and its fee) back to the partner's balance
+
+    Returns:
+        PartnerLedgerEntry: The entry, or None if the payout was never debited or already reversed
+    """
+    debited = db.session.query(func.coalesce(func.sum(PartnerLedgerEntry.amount), 0)).filter(
+        PartnerLedgerEntry.payout_id == payout.id
+    ).scalar()
+    if not debited:
+        return None
+    return post(
+        payout.partner_id, 'payout_reversal', -debited,
+        payout_id=payout.id, description=f'Payout {payout.reference_number} failed'
+    )
+
+
+def balances(partner):
+    """Current earnings of a partner, read from the partner row"""
+    return {
+        'total_earnings': float(partner.total_earnings or 0),
+        'pending_earnings': float(partner.pending_earnings or 0),
+        'withdrawn_earnings': float(partner.withdrawn_earnings or 0)
+    }
+
+
+def sales_summary(partner_id, **windows):
+    """
+    Net ticket sales (sales minus refunds) all-time and since each window start, in one query
+
+    Args:
+        windows: name=datetime, e.g. last_7_days=now - timedelta(days=7)
+
+    Returns:
+        dict: {'all_time': (bookings, revenue), name: (bookings, revenue), ...}
+    """
+    is_sale = PartnerLedgerEntry.entry_type == 'ticket_sale'
+    count = case((is_sale, 1), else_=-1)
+    columns = [func.coalesce(func.sum(count), 0), func.coalesce(func.sum(PartnerLedgerEntry.amount), 0)]
+    for since in windows.values():
+        recent = PartnerLedgerEntry.created_at >= since
+        columns += [
+            func.coalesce(func.sum(case((recent, count), else_=0)), 0),
+            func.coalesce(func.sum(case((recent, PartnerLedgerEntry.amount), else_=0)), 0)
+        ]
+    row = db.session.query(*columns).filter(
+        PartnerLedgerEntry.partner_id == partner_id,
+        PartnerLedgerEntry.entry_type.in_(('ticket_sale', 'refund'))
+    ).one()
+
+    names = ['all_time'] + list(windows)
+    return {name: (int(row[2 * i]), float(row[2 * i + 1])) for i, name in enumerate(names)}
+
+
+def rebuild():
+    """
+    Replay existing paid bookings and debited payouts into the ledger
+
+    Clears the ledger, appends one entry per confirmed booking with a
+    completed payment and one payout (and fee) entry per processing or
+    completed payout in time order, with every partner's balances starting
+    from zero. Commits.
+
+    Returns:
+        int: Number of entries written
+    """
+    db.session.execute(delete(PartnerLedgerEntry))
+    db.session.execute(
+        update(Partner).values(pending_earnings=0, total_earnings=0, withdrawn_earnings=0)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.expire_all()
+
+    sales = db.session.query(Booking, Event.partner_id).join(Event, Booking.event_id == Event.id).join(
+        Payment, Booking.payment_id == Payment.id
+    ).filter(Booking.status == 'confirmed', Payment.status == 'completed')
+    payouts = PartnerPayout.query.filter(PartnerPayout.status.in_(DEBITED_PAYOUT_STATUSES))
+
+    history = [(booking.confirmed_at or booking.created_at, 'sale', booking, partner_id)
+               for booking, partner_id in sales.all()]
+    history += [(payout.processed_at or payout.created_at, 'payout', payout, payout.partner_id)
+                for payout in payouts.all()]
+    history.sort(key=lambda item: item[0] or datetime.min)
+
+    written = 0
+    for occurred_at, kind, item, partner_id in history:
+        if kind == 'sale':
+            entries = [record_ticket_sale(item, partner_id)]
+        else:
+            amount = _money(item.amount)
+            fee = min(_money(item.withdrawal_fee), amount)
+            # Replayed as recorded, even if it overdrew the balance at the time
+            entries = [post(partner_id, 'payout', amount - fee, payout_id=item.id,
+                            description=f'Payout {item.reference_number}')]
+            if fee:
+                entries.append(post(partner_id, 'fee', fee, payout_id=item.id,
+                                    description=f'Withdrawal fee for {item.reference_number}'))
+        for entry in entries:
+            entry.created_at = occurred_at or entry.created_at
+        written += len(entries)
+    db.session.commit()
+    return written
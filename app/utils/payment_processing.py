@@ -0,0 +1,250 @@
+"""
+Payment completion logic shared by the M-Pesa callback worker and the
+payment status poll.
+
+Everything here is idempotent: completing a payment that is already
+completed, or confirming a booking that is already confirmed, does nothing,
+so a callback may be processed more than once without issuing tickets twice.
+"""
+from datetime import datetime
+from flask import current_app
+from app import db
+from app.models.payment import Payment
+from app.models.ticket import Booking, Ticket
+from app.models.event import EventPromotion
+from app.models.partner import Partner
+from app.utils.inventory import confirm_booking, booking_ticket_type_id
+from app.utils.partner_ledger import record_ticket_sale
+from app.utils.qr_pipeline import qr_pipeline
+from app.utils.cache import invalidate_event_listings
+
+
+class PaymentNotFound(LookupError):
+    """No payment matches the CheckoutRequestID (yet)"""
+
+
+def _safely(description, fn, *args, **kwargs):
+    """Run a notification step; failures are logged and never undo the payment"""
+    try:
+        fn(*args, **kwargs)
+    except Exception as e:
+        current_app.logger.warning(f'Failed to {description}: {str(e)}')
+
+
+def complete_ticket_payment(payment, booking):
+    """
+    Confirm a paid booking, issue its tickets and update stats and earnings
+
+    Commits on success.
+
+    Returns:
+        list: Issued tickets, or None if the booking was already confirmed
+    """
+    if not confirm_booking(booking):
+        db.session.commit()
+        return None
+
+    ticket_type_id = booking_ticket_type_id(booking)
+    tickets = []
+    for i in range(booking.quantity):
+        ticket = Ticket(
+            booking_id=booking.id,
+            ticket_type_id=ticket_type_id
+        )
+        db.session.add(ticket)
+        tickets.append(ticket)
+    db.session.flush()
+
+    # QR codes are rendered once the booking commits
+    qr_pipeline.schedule(tickets)
+
+    # Update event stats
+    event = booking.event
+    event.attendee_count += booking.quantity
+    event.total_tickets_sold += booking.quantity
+    event.revenue += booking.total_amount
+
+    # Credit the partner's earnings (ledger entry and balances)
+    if event.partner_id:
+        record_ticket_sale(booking, event.partner_id)
+
+    # Promo code usage was claimed with the reservation
+    db.session.commit()
+    return tickets
+
+
+def send_ticket_payment_notifications(booking, payment, tickets):
+    """Email, SMS and in-app notifications for a completed ticket payment"""
+    from app.utils.email import send_booking_confirmation_email, send_payment_confirmation_email
+    from app.utils.sms import send_payment_confirmation_sms, send_booking_confirmation_sms
+    from app.routes.notifications import notify_new_booking, notify_payment_completed, create_notification
+
+    event = booking.event
+    _safely('send payment confirmation email', send_payment_confirmation_email, booking, payment, tickets)
+    _safely('send booking confirmation email', send_booking_confirmation_email, booking, tickets)
+    _safely('send payment confirmation SMS', send_payment_confirmation_sms, booking, payment)
+
+    # Use phone number from payment (most reliable for paid events)
+    phone_for_sms = payment.phone_number or booking.user.phone_number
+    _safely('send booking confirmation SMS', send_booking_confirmation_sms,
+            booking, tickets, phone_number_override=phone_for_sms)
+
+    _safely(
+        'create payment notification', create_notification,
+        user_id=booking.user_id,
+        title='Payment Successful!',
+        message=f'Your payment of KES {payment.amount:,.2f} for "{event.title}" has been confirmed.',
+        notification_type='payment',
+        event_id=event.id,
+        booking_id=booking.id,
+        action_url=f'/bookings/{booking.id}',
+        action_text='View Booking',
+        send_email=False  # Already sent email above
+    )
+
+    # Notify partner of new booking and payment
+    _safely('notify partner of new booking', notify_new_booking, event, booking)
+    _safely('notify partner of payment', notify_payment_completed, booking, payment)
+
+
+def complete_promotion_payment(payment):
+    """Activate the promotion paid for and notify the partner. Commits."""
+    from app.utils.email import send_promotion_payment_success_email
+    from app.utils.sms import send_promotion_payment_success_sms
+    from app.routes.notifications import create_notification
+
+    promotion = EventPromotion.query.filter_by(payment_id=payment.id).first()
+    if not promotion:
+        db.session.commit()
+        return
+
+    promotion.is_paid = True
+    promotion.is_active = True
+    db.session.commit()
+    invalidate_event_listings()
+
+    # Notify partner
+    partner = Partner.query.get(payment.partner_id)
+    if partner:
+        _safely(
+            'create promotion notification', create_notification,
+            partner_id=partner.id,
+            title='Promotion Payment Successful!',
+            message=f'Your event "{promotion.event.title}" is now promoted in the Can\'t Miss section.',
+            notification_type='promotion',
+            event_id=promotion.event_id,
+            action_url=f'/events/{promotion.event_id}',
+            action_text='View Event'
+        )
+        _safely('send promotion success SMS', send_promotion_payment_success_sms, partner, promotion.event)
+        _safely('send promotion success email', send_promotion_payment_success_email, partner, promotion.event)
+
+
+def process_stk_callback(callback_data):
+    """
+    Apply an STK push result (Body.stkCallback of a Daraja callback)
+
+    Args:
+        callback_data: The stkCallback dict
+
+    Returns:
+        str: Outcome - completed, duplicate, pending or failed
+
+    Raises:
+        PaymentNotFound: No payment for the CheckoutRequestID (retry later)
+    """
+    from app.utils.email import send_payment_failed_email
+    from app.utils.sms import send_payment_failed_sms
+
+    result_code = callback_data.get('ResultCode')
+    checkout_request_id = callback_data.get('CheckoutRequestID')
+
+    # Find payment by CheckoutRequestID (indexed column)
+    payment = Payment.find_by_checkout_request_id(checkout_request_id)
+    if not payment:
+        raise PaymentNotFound(f'Payment not found for CheckoutRequestID: {checkout_request_id}')
+
+    if payment.status == 'completed':
+        # Already applied by an earlier callback or by a status poll
+        return 'duplicate'
+
+    if result_code == 0:
+        # Payment successful
+        callback_metadata = callback_data.get('CallbackMetadata', {}).get('Item', [])
+
+        # Extract details
+        mpesa_receipt = None
+        for item in callback_metadata:
+            if item.get('Name') == 'MpesaReceiptNumber':
+                mpesa_receipt = item.get('Value')
+
+        # Update payment
+        payment.status = 'completed'
+        payment.completed_at = datetime.utcnow()
+        payment.mpesa_receipt_number = mpesa_receipt
+
+        # Handle promotion payments
+        if payment.payment_type == 'promotion':
+            complete_promotion_payment(payment)
+            return 'completed'
+
+        booking = None
+        if payment.payment_type == 'ticket':
+            booking = Booking.query.filter_by(payment_id=payment.id).first()
+        if not booking:
+            db.session.commit()
+            return 'completed'
+
+        tickets = complete_ticket_payment(payment, booking)
+        if tickets is None:
+            current_app.logger.info(f'MPesa callback: booking {booking.id} already confirmed')
+            return 'duplicate'
+
+        send_ticket_payment_notifications(booking, payment, tickets)
+        return 'completed'
+
+    # Payment failed or cancelled
+    result_desc = callback_data.get('ResultDesc', 'Payment failed')
+    result_code_int = int(result_code) if result_code is not None else None
+
+    # Map MPesa result codes:
+    # ResultCode 0 = Success (handled above)
+    # ResultCode 2001 = Initiator information invalid (STK push never sent - phone/amount validation failed)
+    # ResultCode 1032 = User cancelled the STK push (user saw prompt and cancelled)
+    # ResultCode 2002 = Insufficient balance (user tried to pay but no funds)
+    # ResultCode 2003 = Transaction cancelled by user (user cancelled)
+    # ResultCode 2004 = Transaction timeout (user didn't respond in time - wait longer before marking failed)
+    # ResultCode 2005 = Duplicate transaction
+
+    # For timeout (2004), wait at least 2 minutes before marking as failed
+    # This gives the user time to complete the payment even if MPesa sends timeout callback early;
+    # the status check endpoint handles it after the timeout period
+    time_since_creation = (datetime.utcnow() - payment.created_at).total_seconds()
+    if result_code_int == 2004 and time_since_creation < 120:
+        current_app.logger.info(
+            f'Payment {payment.id} timeout callback received but payment created recently '
+            f'({time_since_creation:.1f}s ago). Keeping as pending to allow user to complete payment.'
+        )
+        return 'pending'
+
+    payment.status = 'failed'
+    payment.failed_at = datetime.utcnow()
+    payment.error_message = result_desc
+
+    current_app.logger.warning(
+        f'Payment {payment.id} failed: ResultCode={result_code}, '
+        f'ResultDesc={result_desc}, Phone={payment.phone_number}, Amount={payment.amount}'
+    )
+
+    # Find booking for failed payment
+    booking = None
+    if payment.payment_type == 'ticket':
+        booking = Booking.query.filter_by(payment_id=payment.id).first()
+    if booking:
+        booking.payment_status = 'failed'
+    db.session.commit()
+
+    if booking and booking.user and booking.event:
+        _safely('send payment failed SMS', send_payment_failed_sms, booking.user, payment, booking.event)
+        _safely('send payment failed email', send_payment_failed_email, booking.user, payment, booking.event)
+    return 'failed'
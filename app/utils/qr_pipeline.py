@@ -0,0 +1,105 @@
+"""
+QR codes for new tickets.
+
+schedule(tickets) points each ticket at its QR endpoint
+(/api/tickets/<ticket number>/qr.<format>); nothing is rendered or written
+while the booking is confirmed. Once the session commits, the new codes are
+encoded into this process's QR image cache by QR_CODE_WORKERS background
+threads, on a pool of QR_CODE_PROCESSES processes when configured, so the
+first request for them doesn't pay for the encoding. With
+QR_CODE_WORKERS = 0 (and under TESTING) the cache is filled on first
+request instead.
+"""
+import threading
+from itertools import repeat
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app import db
+from app.utils.qrcode_generator import render_qr, cache_qr_image, qr_code_url, qr_settings, qr_image_cache
+
+# Session.info key of the ticket numbers to pre-render when the session commits
+PENDING_KEY = 'qr_pipeline_pending'
+
+
+class QRCodePipeline:
+    """Flask extension: links new tickets to their QR endpoint and pre-renders the codes"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.workers = 0
+        self.processes = 0
+        self._threads = None
+        self._process_pool = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.workers = 0 if app.config.get('TESTING', False) else app.config.get('QR_CODE_WORKERS', 2)
+        self.processes = app.config.get('QR_CODE_PROCESSES', 0)
+        qr_image_cache.max_bytes = app.config.get('QR_CODE_CACHE_BYTES', 16 * 1024 * 1024)
+        app.extensions['qr_pipeline'] = self
+
+    def schedule(self, tickets, session=None):
+        """Point tickets at their QR code and pre-render it once the session commits. Doesn't commit."""
+        fmt = qr_settings()[0]
+        for ticket in tickets:
+            ticket.qr_code = qr_code_url(ticket.ticket_number, fmt)
+        if self.workers:
+            session = session or db.session
+            session.info.setdefault(PENDING_KEY, []).extend(ticket.ticket_number for ticket in tickets)
+
+    def submit(self, ticket_numbers):
+        """Encode the QR codes of ticket_numbers into the image cache in the background"""
+        if not ticket_numbers:
+            return
+        if self._threads is None:
+            with self._lock:
+                if self._threads is None:
+                    self._threads = ThreadPoolExecutor(self.workers, thread_name_prefix='qr-code')
+        fmt, box_size = qr_settings(self.app.config)
+        self._threads.submit(self._prerender, ticket_numbers, fmt, box_size)
+
+    def _render(self, ticket_numbers, fmt, box_size):
+        if self.processes and len(ticket_numbers) > 1:
+            if self._process_pool is None:
+                with self._lock:
+                    if self._process_pool is None:
+                        self._process_pool = ProcessPoolExecutor(self.processes)
+            return list(self._process_pool.map(render_qr, ticket_numbers, repeat(fmt), repeat(box_size)))
+        return [render_qr(ticket_number, fmt, box_size) for ticket_number in ticket_numbers]
+
+    def _prerender(self, ticket_numbers, fmt, box_size):
+        try:
+            images = self._render(ticket_numbers, fmt, box_size)
+            for ticket_number, content in zip(ticket_numbers, images):
+                cache_qr_image(ticket_number, fmt, box_size, content)
+        except Exception as e:
+            # Only a warm-up: the endpoint renders on demand
+            self.app.logger.warning(f'Failed to pre-render QR codes for {len(ticket_numbers)} ticket(s): {str(e)}')
+
+    def stop(self):
+        """Finish queued renders and shut the pools down"""
+        if self._threads is not None:
+            self._threads.shutdown(wait=True)
+            self._threads = None
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=True)
+            self._process_pool = None
+
+
+qr_pipeline = QRCodePipeline()
+
+
+@event.listens_for(Session, 'after_commit')
+def _submit_pending(session):
+    ticket_numbers = session.info.pop(PENDING_KEY, None)
+    if ticket_numbers:
+        qr_pipeline.submit(ticket_numbers)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_pending(session):
+    session.info.pop(PENDING_KEY, None)
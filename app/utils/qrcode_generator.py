@@ -1,50 +1,93 @@
-import qrcode
-import os
+"""
+Ticket QR codes.
+
+A QR code only encodes the ticket number, so nothing is stored: tickets
+point at GET /api/tickets/<ticket number>/qr.png (or .svg), which renders
+on demand. render_qr() encodes in memory, as a 1-bit PNG (a few hundred
+bytes) or an SVG path, and needs no app context, so it can also run on a
+process pool (see qr_pipeline). qr_image() serves encoded images from a
+byte-bounded in-process LRU (QR_CODE_CACHE_BYTES) together with their
+ETag; the endpoint and the PDF generator both read from it.
+"""
+import hashlib
 from io import BytesIO
-from PIL import Image
+import qrcode
+from qrcode.image.svg import SvgPathImage
 from flask import current_app
+from app.utils.cache import ByteLRUCache
 
+QR_FORMATS = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml'
+}
 
-def generate_qr_code(data, ticket_number):
+
+def render_qr(data, fmt='png', box_size=4, border=4):
     """
-    Generate QR code for ticket
+    Encode data as a QR code image
     
     Args:
         data: String data to encode in QR code
-        ticket_number: Ticket number for filename
+        fmt: png or svg
+        box_size: Pixels per module (PNG)
+        border: Quiet zone in modules (4 is the minimum scanners expect)
         
     Returns:
-        str: Path to saved QR code image
+        bytes: The image
     """
-    # Create QR code instance
     qr = qrcode.QRCode(
-        version=1,
+        version=None,
         error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
+        box_size=box_size,
+        border=border,
     )
-    
-    # Add data
     qr.add_data(data)
     qr.make(fit=True)
     
-    # Create image
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    # Save to uploads folder
-    upload_folder = current_app.config.get('UPLOAD_FOLDER', 'uploads')
-    qr_folder = os.path.join(upload_folder, 'qrcodes')
-    
-    # Create directory if it doesn't exist
-    os.makedirs(qr_folder, exist_ok=True)
-    
-    # Save image
-    filename = f"{ticket_number}.png"
-    filepath = os.path.join(qr_folder, filename)
-    img.save(filepath)
+    buffer = BytesIO()
+    if fmt == 'svg':
+        qr.make_image(image_factory=SvgPathImage).save(buffer)
+    else:
+        # Black and white renders a 1-bit image
+        qr.make_image(fill_color="black", back_color="white").save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
+
+
+qr_image_cache = ByteLRUCache()
+
+
+def qr_settings(config=None):
+    """Format and PNG box size from config (QR_CODE_FORMAT, QR_CODE_BOX_SIZE)"""
+    config = config if config is not None else current_app.config
+    fmt = config.get('QR_CODE_FORMAT', 'png')
+    return (fmt if fmt in QR_FORMATS else 'png'), config.get('QR_CODE_BOX_SIZE', 4)
+
+
+def qr_image(ticket_number, fmt='png', box_size=4):
+    """
+    QR code of a ticket number, from the cache or freshly encoded
     
-    # Return relative path
-    return f"/uploads/qrcodes/{filename}"
+    Returns:
+        tuple: (image bytes, strong ETag value)
+    """
+    image = qr_image_cache.get((ticket_number, fmt, box_size))
+    if image is None:
+        image = cache_qr_image(ticket_number, fmt, box_size, render_qr(ticket_number, fmt, box_size))
+    return image
+
+
+def cache_qr_image(ticket_number, fmt, box_size, content):
+    """Add an encoded QR image to the cache; returns (image bytes, ETag value)"""
+    image = (content, hashlib.sha1(content).hexdigest())
+    qr_image_cache.set((ticket_number, fmt, box_size), image)
+    return image
+
+
+def qr_code_url(ticket_number, fmt=None):
+    """Public URL of a ticket's QR code image (what Ticket.qr_code holds)"""
+    fmt = fmt or qr_settings()[0]
+    base_url = current_app.config.get('BASE_URL', 'https://niko-free.com')
+    return f"{base_url}/api/tickets/{ticket_number}/qr.{fmt}"
 
 
 def verify_qr_code(qr_data, expected_ticket_number):
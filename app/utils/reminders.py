@@ -0,0 +1,147 @@
+"""
+Event reminder fan-out.
+
+send_event_reminders() is run by cron (`flask send_event_reminders`) or
+the admin endpoint. For every event starting around `hours_before` hours
+from now it walks the confirmed attendees in chunks:
+
+- attendees are read with keyset pagination on users.id (id, name, email
+  and phone only), never loading every booking at once
+- each chunk claims its users in event_reminders; the unique
+  (event_id, user_id, hours_before) key makes reruns and overlapping runs
+  skip users who were already reminded
+- notifications, SMS and emails for a chunk are written with
+  create_notifications() (bulk inserts), with one commit per chunk
+"""
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import insert, exists, and_
+from app import db
+from app.models.notification import EventReminder
+from app.models.user import User
+from app.models.event import Event
+from app.models.ticket import Booking
+from app.utils.sms import event_reminder_sms_message
+from app.utils.email import render_event_reminder_email
+
+
+def due_events(hours_before, now=None):
+    """Approved, published events starting within an hour either side of now + hours_before"""
+    now = now or datetime.utcnow()
+    return Event.query.filter(
+        Event.start_date >= now + timedelta(hours=hours_before - 1),
+        Event.start_date <= now + timedelta(hours=hours_before + 1),
+        Event.status == 'approved',
+        Event.is_published == True
+    ).order_by(Event.id).all()
+
+
+def _attendee_chunk(event_id, hours_before, after_user_id, limit):
+    """Next confirmed attendees of an event who haven't been reminded, ordered by user id"""
+    already_reminded = exists().where(and_(
+        EventReminder.event_id == event_id,
+        EventReminder.user_id == User.id,
+        EventReminder.hours_before == hours_before
+    ))
+    return db.session.query(
+        User.id, User.first_name, User.email, User.phone_number
+    ).join(Booking, Booking.user_id == User.id).filter(
+        Booking.event_id == event_id,
+        Booking.status == 'confirmed',
+        User.id > after_user_id,
+        ~already_reminded
+    ).distinct().order_by(User.id).limit(limit).all()
+
+
+def _claim(event_id, hours_before, user_ids, now):
+    """
+    Record reminders for these users, skipping ones another run already recorded
+
+    Returns:
+        set: Ids of the users this run should remind
+    """
+    rows = [{'event_id': event_id, 'user_id': user_id, 'hours_before': hours_before, 'sent_at': now}
+            for user_id in user_ids]
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as upsert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as upsert
+    else:
+        db.session.execute(insert(EventReminder), rows)
+        return set(user_ids)
+
+    stmt = upsert(EventReminder).values(rows).on_conflict_do_nothing(
+        index_elements=['event_id', 'user_id', 'hours_before']
+    ).returning(EventReminder.user_id)
+    return set(db.session.execute(stmt).scalars())
+
+
+def remind_event(event, hours_before=24, chunk_size=500):
+    """
+    Send reminders for one event to every confirmed attendee not yet reminded
+
+    Returns:
+        dict: Number of reminders, SMS and emails queued
+    """
+    from app.routes.notifications import create_notifications
+
+    sms_text = event_reminder_sms_message(event)
+    stats = {'reminders': 0, 'sms': 0, 'emails': 0}
+    last_user_id = 0
+    while True:
+        attendees = _attendee_chunk(event.id, hours_before, last_user_id, chunk_size)
+        if not attendees:
+            break
+        last_user_id = attendees[-1].id
+
+        claimed = _claim(event.id, hours_before, [a.id for a in attendees], datetime.utcnow())
+        recipients = []
+        for attendee in attendees:
+            if attendee.id in claimed:
+                subject, html_body = render_event_reminder_email(attendee.first_name, event)
+                recipients.append({
+                    'user_id': attendee.id, 'email': attendee.email, 'phone_number': attendee.phone_number,
+                    'email_subject': subject, 'email_html': html_body
+                })
+        result = create_notifications(
+            recipients,
+            title='Event Reminder',
+            message=f'"{event.title}" is happening in {hours_before} hours!',
+            notification_type='reminder',
+            event_id=event.id,
+            action_url=f'/events/{event.id}',
+            action_text='View Event',
+            sms_message=sms_text,
+            commit=False
+        )
+        db.session.commit()
+        stats['reminders'] += result['notifications']
+        stats['sms'] += result['sms']
+        stats['emails'] += result['emails']
+
+    return stats
+
+
+def send_event_reminders(hours_before=24, now=None, chunk_size=500):
+    """
+    Send reminders for every event due around `hours_before` hours from now
+
+    Returns:
+        dict: events_processed, reminders_sent, sms_queued, emails_queued, failed_events
+    """
+    totals = {'events_processed': 0, 'reminders_sent': 0, 'sms_queued': 0,
+              'emails_queued': 0, 'failed_events': []}
+    for event in due_events(hours_before, now):
+        try:
+            stats = remind_event(event, hours_before, chunk_size)
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f'Error sending reminders for event {event.id}: {str(e)}', exc_info=True)
+            totals['failed_events'].append(event.id)
+            continue
+        totals['events_processed'] += 1
+        totals['reminders_sent'] += stats['reminders']
+        totals['sms_queued'] += stats['sms']
+        totals['emails_queued'] += stats['emails']
+    return totals
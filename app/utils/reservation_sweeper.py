@@ -0,0 +1,184 @@
+"""
+Background release of expired ticket reservations.
+
+The sweeper sleeps until the earliest reserved_until deadline, releases
+expired bookings in bounded batches (one UPDATE per batch, see
+inventory.release_expired_batch) and goes back to sleep. It runs either:
+
+- in-process: a daemon thread started with the first request when
+  RESERVATION_SWEEPER_ENABLED is set
+- standalone: `flask reservation_sweeper`
+
+Several sweepers (e.g. one per web worker) can run at once; a booking is
+only ever released by one of them.
+
+Sweep metrics (release latency, batch sizes, totals) are kept per process
+and served by GET /api/admin/metrics/reservations.
+"""
+import time
+import threading
+from collections import deque
+from datetime import datetime
+from flask import current_app
+from app import db
+from app.utils.inventory import release_expired_batch, next_reservation_deadline
+from app.utils.outbox import WorkerPool
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class SweeperMetrics:
+    """Counters for one sweeper process, safe to read from request threads"""
+
+    def __init__(self, window=1000):
+        self._lock = threading.Lock()
+        self.sweeps = 0
+        self.batches = 0
+        self.released = 0
+        self.errors = 0
+        self.max_batch_size = 0
+        self.last_sweep_at = None
+        self.last_sweep_ms = None
+        self.last_released = 0
+        # Release latency: how long after reserved_until the booking was released
+        self.latencies_ms = deque(maxlen=window)
+        self.batch_sizes = deque(maxlen=window)
+
+    def record_sweep(self, batch_sizes, latencies_ms, duration_ms):
+        with self._lock:
+            self.sweeps += 1
+            self.batches += len(batch_sizes)
+            self.released += sum(batch_sizes)
+            self.max_batch_size = max([self.max_batch_size] + batch_sizes)
+            self.last_sweep_at = datetime.utcnow()
+            self.last_sweep_ms = duration_ms
+            self.last_released = sum(batch_sizes)
+            self.latencies_ms.extend(latencies_ms)
+            self.batch_sizes.extend(batch_sizes)
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def snapshot(self):
+        with self._lock:
+            latencies = list(self.latencies_ms)
+            batch_sizes = list(self.batch_sizes)
+            return {
+                'sweeps': self.sweeps,
+                'batches': self.batches,
+                'released': self.released,
+                'errors': self.errors,
+                'last_sweep_at': self.last_sweep_at.isoformat() if self.last_sweep_at else None,
+                'last_sweep_ms': self.last_sweep_ms,
+                'last_released': self.last_released,
+                'batch_size': {
+                    'max': self.max_batch_size,
+                    'avg': round(sum(batch_sizes) / len(batch_sizes), 1) if batch_sizes else None
+                },
+                'release_latency_ms': {
+                    'p50': _percentile(latencies, 0.5),
+                    'p95': _percentile(latencies, 0.95),
+                    'max': max(latencies) if latencies else None
+                }
+            }
+
+
+class ReservationSweeper(WorkerPool):
+    """Releases expired reservations close to their deadline"""
+
+    extension_name = 'reservation_sweeper'
+    thread_name = 'reservation-sweeper'
+    label = 'Reservation sweeper'
+    # One thread, started with the first request when enabled
+    workers = 0
+
+    def __init__(self, app=None):
+        self.batch_size = 500
+        self.max_idle = 60
+        self.metrics = SweeperMetrics()
+        super().__init__(app)
+
+    def init_app(self, app):
+        self.batch_size = app.config.get('RESERVATION_SWEEP_BATCH_SIZE', 500)
+        self.max_idle = app.config.get('RESERVATION_SWEEP_MAX_IDLE', 60)
+        self.workers = 1 if app.config.get('RESERVATION_SWEEPER_ENABLED') else 0
+        super().init_app(app)
+
+    def sweep(self, now=None):
+        """
+        Release every reservation that expired before now, batch by batch
+
+        Each batch is committed on its own so a large backlog never holds
+        locks for long. Must be called inside an app context.
+
+        Returns:
+            int: Number of bookings released
+        """
+        start = time.perf_counter()
+        now = now or datetime.utcnow()
+        batch_sizes = []
+        latencies_ms = []
+
+        try:
+            while True:
+                rows = release_expired_batch(now, self.batch_size)
+                db.session.commit()
+                if not rows:
+                    break
+
+                released_at = datetime.utcnow()
+                batch_sizes.append(len(rows))
+                latencies_ms.extend(
+                    round((released_at - row.reserved_until).total_seconds() * 1000, 1) for row in rows
+                )
+                if len(rows) < self.batch_size:
+                    break
+        except Exception as e:
+            db.session.rollback()
+            self.metrics.record_error()
+            current_app.logger.error(f'Reservation sweep failed: {str(e)}', exc_info=True)
+            raise
+
+        duration_ms = round((time.perf_counter() - start) * 1000, 1)
+        self.metrics.record_sweep(batch_sizes, latencies_ms, duration_ms)
+
+        released = sum(batch_sizes)
+        if released:
+            current_app.logger.info(
+                f'Released {released} expired booking(s) in {len(batch_sizes)} batch(es), '
+                f'{duration_ms}ms, max release latency {max(latencies_ms)}ms'
+            )
+        return released
+
+    def seconds_until_next_deadline(self):
+        """Sleep time until the next reservation expires, capped at max_idle"""
+        deadline = next_reservation_deadline()
+        if deadline is None:
+            return self.max_idle
+        # Wake just after the deadline so the booking is strictly expired
+        delay = (deadline - datetime.utcnow()).total_seconds() + 0.05
+        return min(max(delay, 0.1), self.max_idle)
+
+    def run_forever(self):
+        """Sweep, sleep until the next deadline, repeat until stop() is called"""
+        while not self._stop.is_set():
+            delay = self.max_idle
+            with self.app.app_context():
+                try:
+                    self.sweep()
+                    delay = self.seconds_until_next_deadline()
+                except Exception:
+                    # Already logged by sweep(); back off and try again
+                    pass
+                finally:
+                    db.session.remove()
+            self._stop.wait(delay)
+
+
+reservation_sweeper = ReservationSweeper()
@@ -0,0 +1,290 @@
+"""
+Full-text search index for events.
+
+Events are indexed into a side table keyed by event id with the title,
+description, interest names and category name:
+
+- SQLite: an FTS5 virtual table ranked with bm25()
+- PostgreSQL: a tsvector column with a GIN index ranked with ts_rank()
+
+Routes call search_subquery() to get (event_id, rank) rows they can join
+against Event. If the index is not available (e.g. SQLite built without
+FTS5, or the index was never created) search_subquery() returns None and
+callers fall back to the old ilike() filters.
+"""
+import re
+from abc import ABC, abstractmethod
+from flask import current_app
+from sqlalchemy import text, Integer, Float
+from app import db
+
+
+SEARCH_TABLE = 'event_search'
+
+# Extract word tokens; everything else (quotes, operators) is dropped so user
+# input can never be interpreted as FTS query syntax.
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(term):
+    """Split a search term into lowercase word tokens"""
+    return _TOKEN_RE.findall((term or '').lower())
+
+
+def _event_document(event):
+    """Collect the indexed fields for an event"""
+    interests = ' '.join(interest.name for interest in event.interests)
+    category = event.category.name if event.category else ''
+    return {
+        'event_id': event.id,
+        'title': event.title or '',
+        'description': event.description or '',
+        'interests': interests,
+        'category': category
+    }
+
+
+class SearchBackend(ABC):
+    """Interface for dialect-specific search indexes"""
+
+    @abstractmethod
+    def create_index(self):
+        """Create the index if it doesn't exist"""
+
+    @abstractmethod
+    def index_events(self, documents):
+        """Add or replace the documents (from _event_document) in the index"""
+
+    @abstractmethod
+    def remove_event(self, event_id):
+        """Drop an event from the index"""
+
+    @abstractmethod
+    def match_query(self, tokens, prefix):
+        """Return a TextClause selecting (event_id, rank), higher rank is better"""
+
+    @abstractmethod
+    def is_available(self):
+        """Whether the index exists and can be queried"""
+
+
+class SQLiteFTSBackend(SearchBackend):
+    """SQLite FTS5 index"""
+
+    def create_index(self):
+        db.session.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+            "title, description, interests, category, "
+            "tokenize='porter unicode61', prefix='2 3')"
+        ))
+
+    def index_events(self, documents):
+        if not documents:
+            return
+        db.session.execute(
+            text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = :event_id"),
+            [{'event_id': doc['event_id']} for doc in documents]
+        )
+        db.session.execute(
+            text(
+                f"INSERT INTO {SEARCH_TABLE} (rowid, title, description, interests, category) "
+                "VALUES (:event_id, :title, :description, :interests, :category)"
+            ),
+            documents
+        )
+
+    def remove_event(self, event_id):
+        db.session.execute(text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = :event_id"), {'event_id': event_id})
+
+    def match_query(self, tokens, prefix):
+        # Quote every token so it is matched literally; '*' on the last token
+        # turns it into a prefix query for autocomplete
+        terms = [f'"{token}"' for token in tokens]
+        if prefix:
+            terms[-1] += '*'
+        # bm25() column weights: title, description, interests, category
+        return text(
+            f"SELECT rowid AS event_id, -bm25({SEARCH_TABLE}, 10.0, 1.0, 4.0, 2.0) AS rank "
+            f"FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH :match"
+        ).bindparams(match=' '.join(terms)).columns(event_id=Integer, rank=Float)
+
+    def is_available(self):
+        return db.session.execute(
+            text("SELECT name FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': SEARCH_TABLE}
+        ).first() is not None
+
+
+class PostgresFTSBackend(SearchBackend):
+    """PostgreSQL tsvector index with a GIN index"""
+
+    def create_index(self):
+        db.session.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ("
+            "event_id INTEGER PRIMARY KEY REFERENCES events(id) ON DELETE CASCADE, "
+            "document tsvector NOT NULL)"
+        ))
+        db.session.execute(text(
+            f"CREATE INDEX IF NOT EXISTS ix_{SEARCH_TABLE}_document ON {SEARCH_TABLE} USING GIN (document)"
+        ))
+
+    def index_events(self, documents):
+        if not documents:
+            return
+        db.session.execute(
+            text(
+                f"INSERT INTO {SEARCH_TABLE} (event_id, document) VALUES (:event_id, "
+                "setweight(to_tsvector('english', :title), 'A') || "
+                "setweight(to_tsvector('english', :interests), 'B') || "
+                "setweight(to_tsvector('english', :category), 'C') || "
+                "setweight(to_tsvector('english', :description), 'D')) "
+                "ON CONFLICT (event_id) DO UPDATE SET document = EXCLUDED.document"
+            ),
+            documents
+        )
+
+    def remove_event(self, event_id):
+        db.session.execute(text(f"DELETE FROM {SEARCH_TABLE} WHERE event_id = :event_id"), {'event_id': event_id})
+
+    def match_query(self, tokens, prefix):
+        terms = list(tokens)
+        if prefix:
+            terms[-1] += ':*'
+        return text(
+            f"SELECT event_id, ts_rank(document, to_tsquery('english', :match)) AS rank "
+            f"FROM {SEARCH_TABLE} WHERE document @@ to_tsquery('english', :match)"
+        ).bindparams(match=' & '.join(terms)).columns(event_id=Integer, rank=Float)
+
+    def is_available(self):
+        return db.session.execute(
+            text("SELECT to_regclass(:name)"), {'name': SEARCH_TABLE}
+        ).scalar() is not None
+
+
+_BACKENDS = {
+    'sqlite': SQLiteFTSBackend,
+    'postgresql': PostgresFTSBackend
+}
+
+# Availability is checked once per engine URL
+_availability = {}
+
+
+def get_backend():
+    """Return the search backend for the current database, or None"""
+    backend_cls = _BACKENDS.get(db.engine.dialect.name)
+    return backend_cls() if backend_cls else None
+
+
+def search_enabled():
+    """Check whether the search index exists for the current database"""
+    key = str(db.engine.url)
+    if key not in _availability:
+        backend = get_backend()
+        try:
+            _availability[key] = bool(backend and backend.is_available())
+        except Exception as e:
+            current_app.logger.warning(f'Search index unavailable: {str(e)}')
+            _availability[key] = False
+    return _availability[key]
+
+
+def search_subquery(term, prefix=False):
+    """
+    Build a subquery of matching events for a search term
+
+    Args:
+        term: Raw user search input
+        prefix: Treat the last token as a prefix (autocomplete)
+
+    Returns:
+        Subquery with event_id and rank columns, or None if the index
+        cannot be used (callers should fall back to ilike filters)
+    """
+    tokens = tokenize(term)
+    if not tokens or not search_enabled():
+        return None
+    return get_backend().match_query(tokens, prefix).subquery('event_search_match')
+
+
+def create_search_index():
+    """Create the search index table (no-op for unsupported databases)"""
+    backend = get_backend()
+    if not backend:
+        return False
+    backend.create_index()
+    db.session.commit()
+    _availability.pop(str(db.engine.url), None)
+    return True
+
+
+def rebuild_search_index(batch_size=1000, category_id=None):
+    """
+    Re-index events in batches
+
+    Args:
+        batch_size: Number of events loaded and written per batch
+        category_id: Only re-index events in this category (e.g. after a rename)
+
+    Returns:
+        int: Number of events indexed
+    """
+    from sqlalchemy.orm import joinedload
+    from app.models.event import Event, EventInterest
+
+    backend = get_backend()
+    if not backend:
+        return 0
+
+    indexed = 0
+    last_id = 0
+    while True:
+        query = Event.query.options(joinedload(Event.category)).filter(Event.id > last_id)
+        if category_id is not None:
+            query = query.filter(Event.category_id == category_id)
+        events = query.order_by(Event.id).limit(batch_size).all()
+        if not events:
+            break
+
+        event_ids = [event.id for event in events]
+        interests = {}
+        for interest in EventInterest.query.filter(EventInterest.event_id.in_(event_ids)).all():
+            interests.setdefault(interest.event_id, []).append(interest.name)
+
+        backend.index_events([{
+            'event_id': event.id,
+            'title': event.title or '',
+            'description': event.description or '',
+            'interests': ' '.join(interests.get(event.id, [])),
+            'category': event.category.name if event.category else ''
+        } for event in events])
+        db.session.commit()
+
+        indexed += len(events)
+        last_id = event_ids[-1]
+
+    return indexed
+
+
+def index_event(event):
+    """Add or refresh a single event in the search index"""
+    if not search_enabled():
+        return
+    try:
+        get_backend().index_events([_event_document(event)])
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'Failed to index event {event.id} for search: {str(e)}')
+
+
+def remove_event(event_id):
+    """Remove an event from the search index"""
+    if not search_enabled():
+        return
+    try:
+        get_backend().remove_event(event_id)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'Failed to remove event {event_id} from search index: {str(e)}')
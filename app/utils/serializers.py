@@ -0,0 +1,147 @@
+"""
+Bulk serializers for list endpoints.
+
+Event.to_dict() lazily loads organizer, category, location and the dynamic
+hosts / interests / ticket_types / promo_codes relations one event at a time.
+serialize_events() loads those relations for a whole page with one IN query
+per relation, so the number of queries stays fixed regardless of page size.
+"""
+from collections import defaultdict
+from sqlalchemy import func
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+from app import db
+from app.models.event import EventHost, EventInterest
+from app.models.ticket import TicketType, PromoCode, Booking
+from app.models.partner import Partner
+from app.models.category import Category, Location
+from app.models.user import bucketlist
+
+
+def _group_by_event(rows):
+    """Group rows that have an event_id column into {event_id: [rows]}"""
+    grouped = defaultdict(list)
+    for row in rows:
+        grouped[row.event_id].append(row)
+    return grouped
+
+
+def _load_by_id(model, ids):
+    """Load rows of model for the given ids with a single IN query"""
+    ids = {i for i in ids if i is not None}
+    if not ids:
+        return {}
+    return {row.id: row for row in model.query.filter(model.id.in_(ids)).all()}
+
+
+def _attach(objects, fk_name, rel_name, rows_by_id):
+    """Populate a many-to-one relation without triggering a lazy load"""
+    for obj in objects:
+        set_committed_value(obj, rel_name, rows_by_id.get(getattr(obj, fk_name)))
+
+
+def serialize_events(events, include_stats=False):
+    """Serialize a list of events with the same output as Event.to_dict()
+
+    Runs a constant number of queries for the whole list:
+    partners, categories, locations, hosts (+ users), interests,
+    ticket types, promo codes and, with include_stats, two grouped counts.
+    """
+    events = [event for event in events if event is not None]
+    if not events:
+        return []
+
+    event_ids = [event.id for event in events]
+
+    # Many-to-one relations: organizer (and its category), category, location
+    partners = _load_by_id(Partner, [event.partner_id for event in events])
+    categories = _load_by_id(
+        Category,
+        [event.category_id for event in events] + [p.category_id for p in partners.values()]
+    )
+    locations = _load_by_id(Location, [event.location_id for event in events])
+
+    _attach(partners.values(), 'category_id', 'category', categories)
+    _attach(events, 'partner_id', 'organizer', partners)
+    _attach(events, 'category_id', 'category', categories)
+    _attach(events, 'location_id', 'location', locations)
+
+    # Dynamic one-to-many relations: one IN query each
+    hosts = _group_by_event(
+        EventHost.query.options(selectinload(EventHost.user))
+        .filter(EventHost.event_id.in_(event_ids))
+        .order_by(EventHost.id).all()
+    )
+    interests = _group_by_event(
+        EventInterest.query.filter(EventInterest.event_id.in_(event_ids))
+        .order_by(EventInterest.id).all()
+    )
+    ticket_types = _group_by_event(
+        TicketType.query.filter(TicketType.event_id.in_(event_ids))
+        .order_by(TicketType.id).all()
+    )
+    promo_codes = _group_by_event(
+        PromoCode.query.filter(PromoCode.event_id.in_(event_ids))
+        .order_by(PromoCode.id).all()
+    )
+
+    stats = {}
+    if include_stats:
+        bucketlist_counts = dict(
+            db.session.query(bucketlist.c.event_id, func.count(bucketlist.c.user_id))
+            .filter(bucketlist.c.event_id.in_(event_ids))
+            .group_by(bucketlist.c.event_id).all()
+        )
+        bookings_counts = dict(
+            db.session.query(Booking.event_id, func.count(Booking.id))
+            .filter(Booking.event_id.in_(event_ids), Booking.status == 'confirmed')
+            .group_by(Booking.event_id).all()
+        )
+        for event_id in event_ids:
+            stats[event_id] = {
+                'bucketlist_count': bucketlist_counts.get(event_id, 0),
+                'bookings_count': bookings_counts.get(event_id, 0)
+            }
+
+    return [
+        event.build_dict(
+            hosts=hosts.get(event.id, []),
+            interests=interests.get(event.id, []),
+            ticket_types=ticket_types.get(event.id, []),
+            promo_codes=promo_codes.get(event.id, []),
+            stats=stats.get(event.id) if include_stats else None
+        )
+        for event in events
+    ]
+
+
+def apply_user_event_flags(event_dicts, user):
+    """Merge per-user flags into serialized events in place
+
+    Shared (cacheable) event dicts are built without knowledge of the viewer;
+    this adds the viewer-specific fields with one bulk query per flag:
+    in_bucketlist and is_booked (a confirmed booking exists).
+    """
+    event_ids = [event_dict['id'] for event_dict in event_dicts]
+    bucketlist_ids = set()
+    booked_ids = set()
+
+    if user is not None and event_ids:
+        bucketlist_ids = {
+            row.event_id for row in db.session.query(bucketlist.c.event_id).filter(
+                bucketlist.c.user_id == user.id,
+                bucketlist.c.event_id.in_(event_ids)
+            )
+        }
+        booked_ids = {
+            row.event_id for row in db.session.query(Booking.event_id).filter(
+                Booking.user_id == user.id,
+                Booking.event_id.in_(event_ids),
+                Booking.status == 'confirmed'
+            ).distinct()
+        }
+
+    for event_dict in event_dicts:
+        event_dict['in_bucketlist'] = event_dict['id'] in bucketlist_ids
+        event_dict['is_booked'] = event_dict['id'] in booked_ids
+    return event_dicts
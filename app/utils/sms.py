@@ -1,111 +1,20 @@
 """
 SMS Utility using Celcom Africa API
 """
-import requests
 from flask import current_app
-from threading import Thread
-import urllib3
-
-# Disable SSL warnings (since we're using verify=False to match PHP example)
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
-
-# Celcom Africa SMS API Configuration
-CELCOM_SMS_URL = "https://isms.celcomafrica.com/api/services/sendsms/"
-CELCOM_API_KEY = "ffbf65bc0649575080064282d3a324f8"
-CELCOM_PARTNER_ID = "946"
-CELCOM_SHORTCODE = "NIKO FREE"
-
-
-def send_sms_async(app, phone_number, message):
-    """Send SMS asynchronously using Celcom Africa API"""
-    print(f"📱 [SMS ASYNC] Starting SMS send to {phone_number}")
-    with app.app_context():
-        try:
-            # Check if SMS sending is suppressed (for development)
-            if app.config.get('SMS_SUPPRESS_SEND', False):
-                print(f"📱 [SMS ASYNC] [DEV MODE] SMS suppressed: {message[:50]}... to {phone_number}")
-                return
-            
-            # Prepare payload (matching PHP example format)
-            payload = {
-                "apikey": CELCOM_API_KEY,
-                "partnerID": CELCOM_PARTNER_ID,
-                "message": message,
-                "shortcode": CELCOM_SHORTCODE,
-                "mobile": phone_number,
-                "pass_type": "plain"  # Optional: 'plain' or 'bm5' (base64)
-            }
-            
-            print(f"📱 [SMS ASYNC] Sending POST request to {CELCOM_SMS_URL}")
-            print(f"📱 [SMS ASYNC] Payload: {payload}")
-            
-            # Send POST request with JSON body (matching PHP example)
-            headers = {
-                'Content-Type': 'application/json'
-            }
-            response = requests.post(
-                CELCOM_SMS_URL, 
-                json=payload, 
-                headers=headers,
-                timeout=30,
-                verify=False  # SSL verification disabled (matching PHP example)
-            )
-            
-            print(f"📱 [SMS ASYNC] Response status: {response.status_code}")
-            print(f"📱 [SMS ASYNC] Response text: {response.text}")
-            
-            if response.status_code == 200:
-                try:
-                    result = response.json()
-                    print(f"📱 [SMS ASYNC] Response JSON: {result}")
-                    
-                    # Check response format: {"responses":[{"response-code":200,...}]}
-                    if 'responses' in result and isinstance(result['responses'], list):
-                        for response_item in result['responses']:
-                            response_code = response_item.get('response-code') or response_item.get('respose-code')  # Handle typo in API
-                            if response_code == 200:
-                                message_id = response_item.get('messageid')
-                                mobile = response_item.get('mobile')
-                                description = response_item.get('response-description', 'Success')
-                                print(f"✅ [SMS ASYNC] SMS sent successfully to {mobile}")
-                                print(f"   Message ID: {message_id}, Description: {description}")
-                            else:
-                                error_code = response_code
-                                error_desc = response_item.get('response-description', 'Unknown error')
-                                print(f"❌ [SMS ASYNC] SMS failed: Code {error_code} - {error_desc}")
-                    else:
-                        # Fallback: check for success indicators
-                        if result.get('success') or result.get('status') == 'success':
-                            print(f"✅ [SMS ASYNC] SMS sent successfully to {phone_number}")
-                        else:
-                            print(f"❌ [SMS ASYNC] SMS failed: {result}")
-                except ValueError as e:
-                    print(f"❌ [SMS ASYNC] Failed to parse JSON response: {response.text}")
-                    print(f"   Error: {e}")
-            else:
-                print(f"❌ [SMS ASYNC] SMS API error: {response.status_code} - {response.text}")
-                
-        except Exception as e:
-            print(f"❌ [SMS ASYNC] Error sending SMS: {str(e)}")
-            import traceback
-            traceback.print_exc()
+from app.utils.sms_outbox import sms_outbox
 
 
 def send_sms(phone_number, message):
-    """Send SMS (async and non-blocking)"""
-    print(f"📱 [SMS] send_sms called for phone: {phone_number}, message length: {len(message)}")
+    """Send SMS (queued in the SMS outbox, delivered by the SMS workers)"""
     try:
-        from flask import current_app
-        app = current_app._get_current_object()
-        
-        print(f"📱 [SMS] Starting async thread for SMS to {phone_number}")
-        # Start thread and don't wait for it
-        thread = Thread(target=send_sms_async, args=(app, phone_number, message))
-        thread.daemon = True  # Daemon thread won't block app shutdown
-        thread.start()
-        print(f"📱 [SMS] Thread started for {phone_number}")
+        # Check if SMS sending is suppressed (for development)
+        if current_app.config.get('SMS_SUPPRESS_SEND', False):
+            print(f"📱 [SMS] [DEV MODE] SMS suppressed: {message[:50]}... to {phone_number}")
+            return
         
+        sms = sms_outbox.enqueue(phone_number, message)
+        print(f"📱 [SMS] SMS {sms.id} queued for {phone_number}, message length: {len(message)}")
     except Exception as e:
         # Don't let SMS errors crash the app
         print(f"❌ [SMS] Error queuing SMS: {str(e)}")
@@ -326,13 +235,7 @@ def send_event_notification_sms(user, event, notification_type='reminder'):
     phone = format_phone_for_sms(user.phone_number)
     
     if notification_type == 'reminder':
-        message = f"""Event Reminder ⏰
-
-{event.title}
-Date: {event.start_date.strftime('%d/%m/%Y %I:%M %p')}
-Venue: {event.venue_name or event.venue_address or 'Online'}
-
-Don't forget! See you there!"""
+        message = event_reminder_sms_message(event)
     elif notification_type == 'approved':
         message = f"""Event Approved! 🎉
 
@@ -350,6 +253,17 @@ Check it out!"""
     send_sms(phone, message)
 
 
+def event_reminder_sms_message(event):
+    """Text of the event reminder SMS"""
+    return f"""Event Reminder ⏰
+
+{event.title}
+Date: {event.start_date.strftime('%d/%m/%Y %I:%M %p')}
+Venue: {event.venue_name or event.venue_address or 'Online'}
+
+Don't forget! See you there!"""
+
+
 def send_partner_approval_sms(partner, temp_password=None):
     """Send partner approval SMS with credentials"""
     if not partner.phone_number:
@@ -0,0 +1,242 @@
+"""
+Queued SMS delivery through the Celcom Africa API.
+
+send_sms() stores messages in the sms_outbox table (enqueue) instead of
+starting a thread per message. A bounded pool of worker threads (or
+`flask sms_worker`) delivers them:
+
+- each worker claims a batch of due messages with a conditional UPDATE and
+  a lease (locked_until); queuing, claiming and the workers are shared with
+  the email outbox (app/utils/outbox.py)
+- messages are sent SMS_BULK_SIZE at a time through Celcom's sendbulk
+  endpoint (one request, one result per message); with SMS_BULK_SIZE=1 each
+  message is its own sendsms request
+- all requests share one keep-alive requests.Session
+- the provider's result (response code, description, message id) is stored
+  on each message; failures are retried with exponential backoff, invalid
+  numbers and messages that used up SMS_OUTBOX_MAX_ATTEMPTS attempts go to
+  the dead state
+"""
+import threading
+from datetime import datetime, timedelta
+import requests
+import urllib3
+from flask import current_app
+from requests.adapters import HTTPAdapter
+from sqlalchemy import insert
+from app import db
+from app.models.notification import SMSMessage
+from app.utils.outbox import Outbox, retry_delay
+
+# Disable SSL warnings (since we're using verify=False to match PHP example)
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+CELCOM_SMS_URL = "https://isms.celcomafrica.com/api/services/sendsms/"
+CELCOM_BULK_SMS_URL = "https://isms.celcomafrica.com/api/services/sendbulk/"
+
+# Celcom response codes that won't succeed on retry: network not allowed, invalid mobile
+PERMANENT_SMS_CODES = {1002, 1003}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Process-wide requests.Session so connections to Celcom are reused"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                session.mount('https://', HTTPAdapter(pool_connections=2, pool_maxsize=16))
+                session.headers['Content-Type'] = 'application/json'
+                _session = session
+    return _session
+
+
+def _response_code(item):
+    code = item.get('response-code') or item.get('respose-code')  # Handle typo in API
+    try:
+        return int(code)
+    except (TypeError, ValueError):
+        return None
+
+
+class SMSOutbox(Outbox):
+    """Flask extension: queues SMS and runs the delivery workers"""
+
+    extension_name = 'sms_outbox'
+    thread_name = 'sms-worker'
+    label = 'SMS'
+    model = SMSMessage
+    pending_key = 'sms_outbox_pending'
+    workers = 4
+    batch_size = 100
+    bulk_size = 20
+
+    def init_app(self, app):
+        self.workers = app.config.get('SMS_OUTBOX_WORKERS', 4)
+        self.batch_size = app.config.get('SMS_OUTBOX_BATCH_SIZE', 100)
+        self.bulk_size = app.config.get('SMS_BULK_SIZE', 20)
+        self.max_attempts = app.config.get('SMS_OUTBOX_MAX_ATTEMPTS', 5)
+        self.lease_seconds = app.config.get('SMS_OUTBOX_LEASE', 300)
+        self.poll_interval = app.config.get('SMS_OUTBOX_POLL_INTERVAL', 5)
+        super().init_app(app)
+
+    def enqueue(self, phone_number, message):
+        """
+        Queue one SMS for delivery
+
+        Doesn't commit: the message is part of the caller's transaction, so it
+        is only sent if that commits (the workers are woken then). A request
+        that queues messages after its last commit has them committed when it
+        succeeds (see _commit_queued).
+
+        Returns:
+            SMSMessage: The queued message
+        """
+        sms = SMSMessage(phone_number=phone_number, message=message)
+        db.session.add(sms)
+        db.session.flush()
+        self.mark_queued()
+        return sms
+
+    def enqueue_many(self, messages, commit=True):
+        """
+        Queue many SMS with one bulk insert
+
+        Args:
+            messages: Iterable of (phone_number, message) tuples
+            commit: Commit now; pass False to commit with the caller's transaction
+                (the workers are woken when it commits)
+
+        Returns:
+            int: Number of messages queued
+        """
+        now = datetime.utcnow()
+        rows = [
+            {'phone_number': phone, 'message': text, 'status': 'pending',
+             'attempts': 0, 'next_attempt_at': now, 'created_at': now}
+            for phone, text in messages
+        ]
+        if rows:
+            db.session.execute(insert(SMSMessage), rows)
+            self.mark_queued()
+            if commit:
+                db.session.commit()
+        return len(rows)
+
+    def _payload(self, sms):
+        config = current_app.config
+        return {
+            'apikey': config.get('CELCOM_API_KEY'),
+            'partnerID': config.get('CELCOM_PARTNER_ID'),
+            'shortcode': config.get('CELCOM_SHORTCODE'),
+            'pass_type': 'plain',
+            'clientsmsid': sms.id,
+            'mobile': sms.phone_number,
+            'message': sms.message
+        }
+
+    def _post(self, url, payload):
+        response = get_session().post(
+            url,
+            json=payload,
+            timeout=current_app.config.get('SMS_TIMEOUT', 30),
+            verify=False  # SSL verification disabled (matching PHP example)
+        )
+        response.raise_for_status()
+        return response.json().get('responses') or []
+
+    def _send_chunk(self, chunk):
+        """
+        Send messages in one request
+
+        Returns:
+            dict: Provider result item per message id
+        """
+        if len(chunk) == 1:
+            items = self._post(CELCOM_SMS_URL, self._payload(chunk[0]))
+        else:
+            items = self._post(CELCOM_BULK_SMS_URL, {
+                'count': len(chunk),
+                'smslist': [self._payload(sms) for sms in chunk]
+            })
+
+        by_client_id = {str(item.get('clientsmsid')): item for item in items if item.get('clientsmsid') is not None}
+        results = {}
+        for index, sms in enumerate(chunk):
+            item = by_client_id.get(str(sms.id))
+            if item is None and not by_client_id and index < len(items):
+                # Results without clientsmsid come back in request order
+                item = items[index]
+            results[sms.id] = item
+        return results
+
+    def _record(self, sms, item=None, error=None):
+        sms.attempts += 1
+        sms.claimed_by = None
+        sms.locked_until = None
+        code = _response_code(item) if item else None
+        if item is not None:
+            sms.response_code = code
+            sms.response_description = (item.get('response-description') or '')[:255]
+            sms.provider_message_id = str(item.get('messageid') or '') or sms.provider_message_id
+
+        if code == 200:
+            sms.status = 'sent'
+            sms.sent_at = datetime.utcnow()
+            sms.last_error = None
+            return
+
+        sms.last_error = (str(error) if error else
+                          f'Code {code}: {sms.response_description}' if item else 'No result for message')[:2000]
+        if code in PERMANENT_SMS_CODES or sms.attempts >= self.max_attempts:
+            sms.status = 'dead'
+            current_app.logger.error(
+                f'SMS {sms.id} to {sms.phone_number} moved to dead letter '
+                f'after {sms.attempts} attempt(s): {sms.last_error}'
+            )
+        else:
+            sms.status = 'failed'
+            sms.next_attempt_at = datetime.utcnow() + timedelta(seconds=retry_delay(sms.attempts))
+            current_app.logger.warning(f'SMS {sms.id} to {sms.phone_number} failed: {sms.last_error}')
+
+    def send_batch(self, messages):
+        """
+        Send claimed messages and record each result
+
+        Returns:
+            int: Number of messages sent
+        """
+        chunk_size = max(self.bulk_size, 1)
+        for start in range(0, len(messages), chunk_size):
+            chunk = messages[start:start + chunk_size]
+            try:
+                results = self._send_chunk(chunk)
+            except Exception as e:
+                for sms in chunk:
+                    self._record(sms, error=e)
+                continue
+            for sms in chunk:
+                self._record(sms, item=results.get(sms.id))
+        db.session.commit()
+        return sum(1 for sms in messages if sms.status == 'sent')
+
+    def drain(self):
+        """
+        Send due messages until none are left. Must be called inside an app context.
+
+        Returns:
+            int: Number of messages sent
+        """
+        sent = 0
+        while not self._stop.is_set():
+            messages = self.claim_batch()
+            if not messages:
+                break
+            sent += self.send_batch(messages)
+        return sent
+
+
+sms_outbox = SMSOutbox()
@@ -1,6 +1,17 @@
 """
 Ticket PDF Generator with Niko Free branding
+
+Everything that doesn't depend on the booking is prepared once per process:
+the paragraph styles, the logo (read from disk once) and the event posters,
+kept decoded, resized and JPEG-encoded in an LRU keyed by their URL (or
+file and modification time) and size, so a download doesn't fetch the
+poster from Blob Storage again. Finished PDFs are cached per booking in a
+byte-bounded LRU (TICKET_PDF_CACHE_BYTES) under a fingerprint of everything
+printed on them, so a booking is rendered again only when its tickets (or
+the event, purchaser or price shown) change; the fingerprint doubles as the
+download's ETag.
 """
+from reportlab import rl_config
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.lib.units import inch
 from reportlab.pdfgen import canvas
@@ -9,11 +20,15 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, Table, TableStyle, KeepTogether
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
 from io import BytesIO
+from functools import lru_cache
+import hashlib
 import os
 import requests
 from flask import current_app
 from PIL import Image as PILImage
 import io
+from app.utils.cache import ByteLRUCache
+from app.utils.qrcode_generator import qr_image
 
 # Company theme colors
 COMPANY_BLUE = "#27aae2"
@@ -22,6 +37,102 @@ COMPANY_BLACK = "#333333"
 COMPANY_WHITE = "#ffffff"
 COMPANY_BG_LIGHT = "#f5f5f5"
 
+# Store images as binary streams: skips reportlab's pure-Python ASCII85 pass over
+# every QR code and makes the PDFs smaller
+rl_config.useA85 = 0
+
+# Poster box on the ticket (points); posters are resized to fit it
+POSTER_SIZE = (2.5*72, 3.5*72)
+
+# Decoded and resized posters kept per process
+POSTER_CACHE_SIZE = 64
+
+# Finished PDFs by booking id: (PDF bytes, fingerprint)
+ticket_pdf_cache = ByteLRUCache(64 * 1024 * 1024)
+
+
+@lru_cache(maxsize=None)
+def _styles():
+    """Paragraph styles, built once"""
+    styles = getSampleStyleSheet()
+    
+    built = {
+        # Header style with company colors
+        'header': ParagraphStyle(
+            'Header',
+            parent=styles['Normal'],
+            fontSize=10,
+            textColor=colors.HexColor(COMPANY_WHITE),
+            alignment=TA_CENTER,
+            spaceAfter=10,
+            fontName='Helvetica-Bold'
+        ),
+        # Disclaimer style (top of ticket)
+        'disclaimer': ParagraphStyle(
+            'Disclaimer',
+            parent=styles['Normal'],
+            fontSize=9,
+            textColor=colors.HexColor('#666666'),
+            alignment=TA_CENTER,
+            spaceAfter=15,
+            fontName='Helvetica'
+        ),
+        # Event title style
+        'event_title': ParagraphStyle(
+            'EventTitle',
+            parent=styles['Heading1'],
+            fontSize=18,
+            textColor=colors.HexColor(COMPANY_BLACK),
+            spaceAfter=8,
+            alignment=TA_LEFT,
+            fontName='Helvetica-Bold'
+        ),
+        # Label style (for field labels)
+        'label': ParagraphStyle(
+            'Label',
+            parent=styles['Normal'],
+            fontSize=9,
+            textColor=colors.HexColor('#666666'),
+            alignment=TA_LEFT,
+            spaceAfter=2,
+            fontName='Helvetica'
+        ),
+        # Value style (for field values)
+        'value': ParagraphStyle(
+            'Value',
+            parent=styles['Normal'],
+            fontSize=11,
+            textColor=colors.HexColor(COMPANY_BLACK),
+            alignment=TA_LEFT,
+            spaceAfter=10,
+            fontName='Helvetica'
+        ),
+        # Ticket number style
+        'ticket_num': ParagraphStyle(
+            'TicketNumber',
+            parent=styles['Heading2'],
+            fontSize=20,
+            textColor=colors.HexColor(COMPANY_BLUE),
+            alignment=TA_CENTER,
+            spaceAfter=5,
+            fontName='Helvetica-Bold'
+        ),
+        # Footer style with company colors
+        'footer': ParagraphStyle(
+            'Footer',
+            parent=styles['Normal'],
+            fontSize=8,
+            textColor=colors.HexColor(COMPANY_WHITE),
+            alignment=TA_CENTER,
+            spaceBefore=10,
+            fontName='Helvetica'
+        )
+    }
+    # Right-aligned values
+    for name in ('OrderRef', 'Price', 'OrderDate'):
+        built[name] = ParagraphStyle(name, parent=built['value'], alignment=TA_RIGHT)
+    return built
+
 
 def _get_logo_path():
     """Get Niko Free logo path"""
@@ -51,6 +162,16 @@ def _get_logo_path():
     return None
 
 
+@lru_cache(maxsize=1)
+def _logo_bytes():
+    """Niko Free logo file contents, read once (None if it can't be found)"""
+    logo_path = _get_logo_path()
+    if not logo_path:
+        return None
+    with open(logo_path, 'rb') as f:
+        return f.read()
+
+
 def _get_image_path(image_path, upload_folder='uploads'):
     """Helper function to resolve image paths - handles Azure Blob Storage URLs"""
     if not image_path:
@@ -107,45 +228,116 @@ def _get_image_path(image_path, upload_folder='uploads'):
     return None
 
 
-def _download_image_from_url(url, max_size=(2.5*72, 3.5*72)):
-    """Download image from URL (Azure Blob Storage) and return as BytesIO"""
-    try:
-        response = requests.get(url, timeout=10)
+def _poster_source(poster_image):
+    """
+    Where to load an event poster from
+
+    Returns:
+        tuple: (URL or local path, version) with the file's modification time
+            as the version of a local file, or (None, None)
+    """
+    if not poster_image:
+        return None, None
+    if poster_image.startswith('http://') or poster_image.startswith('https://'):
+        # Uploaded posters get a new name, so a URL always holds the same image
+        return poster_image, None
+    poster_path = _get_image_path(poster_image)
+    if poster_path and os.path.exists(poster_path):
+        return poster_path, os.path.getmtime(poster_path)
+    return None, None
+
+
+@lru_cache(maxsize=POSTER_CACHE_SIZE)
+def _poster_jpeg(source, max_size=POSTER_SIZE, version=None):
+    """
+    Load a poster (downloaded from Azure Blob Storage or read from disk), resize it
+    to fit max_size preserving its aspect ratio and encode it as JPEG
+
+    Raises on failure, so failures aren't cached.
+
+    Returns:
+        bytes: The JPEG
+    """
+    if source.startswith('http://') or source.startswith('https://'):
+        response = requests.get(source, timeout=10)
         response.raise_for_status()
-        
-        # Open with PIL to handle resizing while preserving aspect ratio
         img = PILImage.open(io.BytesIO(response.content))
-        
-        # Calculate dimensions preserving aspect ratio
-        img_width, img_height = img.size
-        max_width, max_height = max_size
-        
-        # Calculate scaling factor to fit within max dimensions
-        width_ratio = max_width / img_width
-        height_ratio = max_height / img_height
-        scale_factor = min(width_ratio, height_ratio)
-        
-        # Resize preserving aspect ratio
-        new_width = int(img_width * scale_factor)
-        new_height = int(img_height * scale_factor)
-        
-        img = img.resize((new_width, new_height), PILImage.Resampling.LANCZOS)
-        
-        # Convert to RGB if necessary
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
-        
-        # Save to BytesIO
-        img_bytes = io.BytesIO()
-        img.save(img_bytes, format='JPEG', quality=85)
-        img_bytes.seek(0)
-        
-        return img_bytes
+    else:
+        img = PILImage.open(source)
+    
+    # Calculate dimensions preserving aspect ratio
+    img_width, img_height = img.size
+    max_width, max_height = max_size
+    
+    # Calculate scaling factor to fit within max dimensions
+    width_ratio = max_width / img_width
+    height_ratio = max_height / img_height
+    scale_factor = min(width_ratio, height_ratio)
+    
+    # Resize preserving aspect ratio
+    new_width = int(img_width * scale_factor)
+    new_height = int(img_height * scale_factor)
+    
+    img = img.resize((new_width, new_height), PILImage.Resampling.LANCZOS)
+    
+    # Convert to RGB if necessary
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    
+    img_bytes = io.BytesIO()
+    img.save(img_bytes, format='JPEG', quality=85)
+    return img_bytes.getvalue()
+
+
+def poster_bytes(poster_image):
+    """Resized poster JPEG of an event from the poster cache, None if there is none or it fails to load"""
+    source, version = _poster_source(poster_image)
+    if not source:
+        return None
+    try:
+        return _poster_jpeg(source, POSTER_SIZE, version)
     except Exception as e:
-        print(f"⚠️ [PDF] Error downloading image from URL: {e}")
+        print(f"⚠️ [PDF] Error loading poster image: {e}")
         return None
 
 
+def _fingerprint(booking, event, user, tickets):
+    """Hash of everything printed on a booking's PDF"""
+    parts = [
+        booking.id, booking.booking_number, str(booking.total_amount), booking.created_at,
+        event.title, event.start_date, event.end_date, event.venue_name, event.venue_address,
+        event.poster_image, user.first_name, user.last_name
+    ]
+    parts.extend(
+        (ticket.ticket_number, ticket.ticket_type.name if ticket.ticket_type else None)
+        for ticket in tickets
+    )
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def ticket_pdf(booking, tickets):
+    """
+    PDF of a booking's tickets, from the PDF cache or freshly rendered
+    
+    Args:
+        booking: Booking object
+        tickets: List of Ticket objects
+        
+    Returns:
+        tuple: (PDF bytes, fingerprint to use as its ETag)
+    """
+    event = booking.event
+    user = booking.user
+    fingerprint = _fingerprint(booking, event, user, tickets)
+    cached = ticket_pdf_cache.get(booking.id)
+    if cached is not None and cached[1] == fingerprint:
+        return cached
+    
+    pdf = (render_ticket_pdf(booking, event, user, tickets, poster_bytes(event.poster_image)), fingerprint)
+    ticket_pdf_cache.set(booking.id, pdf)
+    return pdf
+
+
 def generate_ticket_pdf(booking, tickets):
     """
     Generate PDF ticket with QR code in a modern 3-column layout
@@ -159,6 +351,22 @@ def generate_ticket_pdf(booking, tickets):
     Returns:
         BytesIO: PDF file as BytesIO object
     """
+    return BytesIO(ticket_pdf(booking, tickets)[0])
+
+
+def render_ticket_pdf(booking, event, user, tickets, poster_jpeg=None):
+    """
+    Lay out and build the PDF of a booking's tickets
+    
+    Only reads attributes, so the arguments can be plain snapshots instead of
+    models (bulk jobs render on other processes), and needs no app context.
+    
+    Args:
+        poster_jpeg: Event poster from poster_bytes(), None for the placeholder
+        
+    Returns:
+        bytes: The PDF
+    """
     buffer = BytesIO()
     
     # Create PDF document with minimal margins for ticket layout
@@ -174,93 +382,22 @@ def generate_ticket_pdf(booking, tickets):
     # Container for PDF elements
     elements = []
     
-    # Styles
-    styles = getSampleStyleSheet()
-    
-    # Header style with company colors
-    header_style = ParagraphStyle(
-        'Header',
-        parent=styles['Normal'],
-        fontSize=10,
-        textColor=colors.HexColor(COMPANY_WHITE),
-        alignment=TA_CENTER,
-        spaceAfter=10,
-        fontName='Helvetica-Bold'
-    )
-    
-    # Disclaimer style (top of ticket)
-    disclaimer_style = ParagraphStyle(
-        'Disclaimer',
-        parent=styles['Normal'],
-        fontSize=9,
-        textColor=colors.HexColor('#666666'),
-        alignment=TA_CENTER,
-        spaceAfter=15,
-        fontName='Helvetica'
-    )
-    
-    # Event title style
-    event_title_style = ParagraphStyle(
-        'EventTitle',
-        parent=styles['Heading1'],
-        fontSize=18,
-        textColor=colors.HexColor(COMPANY_BLACK),
-        spaceAfter=8,
-        alignment=TA_LEFT,
-        fontName='Helvetica-Bold'
-    )
-    
-    # Label style (for field labels)
-    label_style = ParagraphStyle(
-        'Label',
-        parent=styles['Normal'],
-        fontSize=9,
-        textColor=colors.HexColor('#666666'),
-        alignment=TA_LEFT,
-        spaceAfter=2,
-        fontName='Helvetica'
-    )
-    
-    # Value style (for field values)
-    value_style = ParagraphStyle(
-        'Value',
-        parent=styles['Normal'],
-        fontSize=11,
-        textColor=colors.HexColor(COMPANY_BLACK),
-        alignment=TA_LEFT,
-        spaceAfter=10,
-        fontName='Helvetica'
-    )
-    
-    # Ticket number style
-    ticket_num_style = ParagraphStyle(
-        'TicketNumber',
-        parent=styles['Heading2'],
-        fontSize=20,
-        textColor=colors.HexColor(COMPANY_BLUE),
-        alignment=TA_CENTER,
-        spaceAfter=5,
-        fontName='Helvetica-Bold'
-    )
-    
-    # Footer style with company colors
-    footer_style = ParagraphStyle(
-        'Footer',
-        parent=styles['Normal'],
-        fontSize=8,
-        textColor=colors.HexColor(COMPANY_WHITE),
-        alignment=TA_CENTER,
-        spaceBefore=10,
-        fontName='Helvetica'
-    )
+    styles = _styles()
+    header_style = styles['header']
+    disclaimer_style = styles['disclaimer']
+    event_title_style = styles['event_title']
+    label_style = styles['label']
+    value_style = styles['value']
+    ticket_num_style = styles['ticket_num']
+    footer_style = styles['footer']
     
     # Header with logo and company colors
-    logo_path = _get_logo_path()
+    logo = _logo_bytes()
     header_cell = []
     
-    if logo_path and os.path.exists(logo_path):
+    if logo:
         try:
-            logo_img = Image(logo_path, width=1.5*inch, height=0.5*inch, kind='proportional')
+            logo_img = Image(BytesIO(logo), width=1.5*inch, height=0.5*inch, kind='proportional')
             logo_img.hAlign = 'CENTER'
             header_cell.append(logo_img)
         except Exception as e:
@@ -291,9 +428,6 @@ def generate_ticket_pdf(booking, tickets):
     elements.append(Paragraph("This ticket must be presented for admittance to the event.", disclaimer_style))
     elements.append(Spacer(1, 0.1*inch))
     
-    event = booking.event
-    user = booking.user
-    
     # Process each ticket
     for idx, ticket in enumerate(tickets, 1):
         if idx > 1:
@@ -301,20 +435,6 @@ def generate_ticket_pdf(booking, tickets):
             elements.append(Paragraph("─" * 80, disclaimer_style))
             elements.append(Spacer(1, 0.3*inch))
         
-        # Get event poster image path (handles Azure URLs)
-        poster_path = None
-        poster_url = None
-        if event.poster_image:
-            if event.poster_image.startswith('http://') or event.poster_image.startswith('https://'):
-                poster_url = event.poster_image
-            else:
-                poster_path = _get_image_path(event.poster_image)
-        
-        # Get QR code image path
-        qr_path = None
-        if ticket.qr_code:
-            qr_path = _get_image_path(ticket.qr_code)
-        
         # Prepare ticket data
         start_date = event.start_date
         date_str = start_date.strftime('%B %d, %Y')
@@ -332,24 +452,10 @@ def generate_ticket_pdf(booking, tickets):
         # Build three-column table
         # Column 1: Event Poster (Left) - Don't stretch, preserve aspect ratio
         poster_cell = []
-        if poster_url:
-            # Download from Azure Blob Storage
-            try:
-                img_bytes = _download_image_from_url(poster_url, max_size=(2.5*72, 3.5*72))
-                if img_bytes:
-                    # Use kind='proportional' to preserve aspect ratio and prevent stretching
-                    poster_img = Image(img_bytes, width=2.5*inch, height=3.5*inch, kind='proportional')
-                    poster_img.hAlign = 'CENTER'
-                    poster_cell.append(poster_img)
-                else:
-                    poster_cell.append(Paragraph("<i>Event Image</i>", label_style))
-            except Exception as e:
-                print(f"⚠️ [PDF] Error loading poster from URL: {e}")
-                poster_cell.append(Paragraph("<i>Event Image</i>", label_style))
-        elif poster_path and os.path.exists(poster_path):
+        if poster_jpeg:
             try:
                 # Use kind='proportional' to preserve aspect ratio and prevent stretching
-                poster_img = Image(poster_path, width=2.5*inch, height=3.5*inch, kind='proportional')
+                poster_img = Image(BytesIO(poster_jpeg), width=2.5*inch, height=3.5*inch, kind='proportional')
                 poster_img.hAlign = 'CENTER'
                 poster_cell.append(poster_img)
             except Exception as e:
@@ -371,7 +477,7 @@ def generate_ticket_pdf(booking, tickets):
         info_cell.append(Spacer(1, 0.1*inch))
         order_ref_para = Paragraph(
             f"<b>Ticket Order Ref:</b> {booking.booking_number}",
-            ParagraphStyle('OrderRef', parent=value_style, alignment=TA_RIGHT)
+            styles['OrderRef']
         )
         info_cell.append(order_ref_para)
         info_cell.append(Spacer(1, 0.1*inch))
@@ -379,7 +485,7 @@ def generate_ticket_pdf(booking, tickets):
         info_cell.append(ticket_type_para)
         price_para = Paragraph(
             f"<b>Price:</b> {price_display}",
-            ParagraphStyle('Price', parent=value_style, alignment=TA_RIGHT)
+            styles['Price']
         )
         info_cell.append(price_para)
         info_cell.append(Spacer(1, 0.1*inch))
@@ -387,25 +493,23 @@ def generate_ticket_pdf(booking, tickets):
         info_cell.append(Paragraph(f"<b>Purchased by:</b> {purchaser_name}", value_style))
         order_date_para = Paragraph(
             f"<b>Order Date:</b> {order_date}",
-            ParagraphStyle('OrderDate', parent=value_style, alignment=TA_RIGHT)
+            styles['OrderDate']
         )
         info_cell.append(order_date_para)
         
         # Column 3: QR Code (Right)
         qr_cell = []
-        if qr_path and os.path.exists(qr_path):
-            try:
-                qr_img = Image(qr_path, width=2.2*inch, height=2.2*inch)
-                qr_img.hAlign = 'CENTER'
-                qr_cell.append(qr_img)
-                qr_cell.append(Spacer(1, 0.1*inch))
-                qr_cell.append(Paragraph("<b>Ticket No:</b>", label_style))
-                qr_cell.append(Paragraph(f"<b>#{ticket.ticket_number}</b>", ticket_num_style))
-            except Exception as e:
-                print(f"⚠️ [PDF] Error loading QR code: {e}")
-                qr_cell.append(Paragraph("QR Code", label_style))
-                qr_cell.append(Paragraph(f"<b>#{ticket.ticket_number}</b>", ticket_num_style))
-        else:
+        try:
+            # From the QR image cache (box size 10 prints sharply at this size)
+            qr_png = qr_image(ticket.ticket_number, 'png', 10)[0]
+            qr_img = Image(BytesIO(qr_png), width=2.2*inch, height=2.2*inch)
+            qr_img.hAlign = 'CENTER'
+            qr_cell.append(qr_img)
+            qr_cell.append(Spacer(1, 0.1*inch))
+            qr_cell.append(Paragraph("<b>Ticket No:</b>", label_style))
+            qr_cell.append(Paragraph(f"<b>#{ticket.ticket_number}</b>", ticket_num_style))
+        except Exception as e:
+            print(f"⚠️ [PDF] Error rendering QR code: {e}")
             qr_cell.append(Paragraph("QR Code", label_style))
             qr_cell.append(Paragraph(f"<b>#{ticket.ticket_number}</b>", ticket_num_style))
         
@@ -464,9 +568,7 @@ def generate_ticket_pdf(booking, tickets):
     # Build PDF
     doc.build(elements)
     
-    # Get PDF data
-    buffer.seek(0)
-    return buffer
+    return buffer.getvalue()
 
 
 def generate_ticket_pdf_file(booking, tickets, output_path):
@@ -0,0 +1,329 @@
+"""
+Bulk ticket PDFs for partners: every confirmed booking of an event in one job.
+
+create_job() records a TicketPDFJob and the job runs in the background on
+one of TICKET_PDF_JOB_WORKERS threads of the web process (inside the
+request when 0, and under TESTING). Bookings are read in keyset-paginated
+batches of plain column tuples and turned into snapshots with everything
+printed on their tickets, so they can be rendered with the
+generate_ticket_pdf layout (ticket_pdf.render_ticket_pdf) on a pool of
+TICKET_PDF_PROCESSES processes. The event poster is loaded once per job.
+
+Each job starts its own pool with the spawn start method (forking a web
+process that runs many threads can copy locks held by other threads), and
+hands the event snapshot and poster to every process once, when it starts.
+Bookings then go to the processes in chunks.
+
+- pdf: all bookings merged into one document, in booking order. Needs the
+  pypdf package.
+- zip: one ticket-<booking number>.pdf per booking, added to the archive as
+  the renders come back
+
+The job row's processed_bookings is committed after every batch, so any
+web process can report progress. Jobs only live in the process that runs
+them: after TICKET_PDF_JOB_LEASE seconds a job still queued is taken to be
+lost with a restarted process and run again, and one still running (since
+started_at) is marked failed (recover_stale, on each process's first
+request or `flask recover_ticket_pdf_jobs`). The result is saved through the upload
+layer (Azure Blob Storage or /uploads) under an unguessable name and
+downloaded through the partner's job endpoint.
+"""
+import uuid
+import zipfile
+import tempfile
+import threading
+import multiprocessing
+from io import BytesIO, SEEK_END
+from types import SimpleNamespace
+from functools import partial
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from app import db
+from app.models.event import Event
+from app.models.ticket import Booking, Ticket, TicketType, TicketPDFJob
+from app.models.user import User
+from app.utils.file_upload import save_file_bytes
+from app.utils.ticket_pdf import render_ticket_pdf, poster_bytes
+
+FORMATS = {
+    'pdf': 'application/pdf',
+    'zip': 'application/zip'
+}
+
+# Where job results are saved (Blob Storage prefix / uploads subfolder)
+JOB_FOLDER = 'ticket-pdf-jobs'
+
+
+def pdf_merge_available():
+    try:
+        import pypdf  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def confirmed_booking_count(event_id):
+    return db.session.query(db.func.count(Booking.id)).filter(
+        Booking.event_id == event_id, Booking.status == 'confirmed'
+    ).scalar()
+
+
+def iter_booking_batches(event_id, batch_size=200):
+    """
+    Yield the confirmed bookings of an event in batches of snapshots
+
+    A snapshot has the attributes render_ticket_pdf reads from a booking,
+    its user and its tickets, and pickles, so it can go to another process.
+    """
+    query = db.session.query(
+        Booking.id, Booking.booking_number, Booking.total_amount, Booking.created_at,
+        User.first_name, User.last_name
+    ).join(User, Booking.user_id == User.id).filter(
+        Booking.event_id == event_id, Booking.status == 'confirmed'
+    )
+    last_id = 0
+    while True:
+        rows = query.filter(Booking.id > last_id).order_by(Booking.id).limit(batch_size).all()
+        if not rows:
+            return
+        tickets = {}
+        for booking_id, ticket_number, ticket_type in db.session.query(
+            Ticket.booking_id, Ticket.ticket_number, TicketType.name
+        ).outerjoin(TicketType, Ticket.ticket_type_id == TicketType.id).filter(
+            Ticket.booking_id.in_([row.id for row in rows])
+        ).order_by(Ticket.id):
+            tickets.setdefault(booking_id, []).append(SimpleNamespace(
+                ticket_number=ticket_number,
+                ticket_type=SimpleNamespace(name=ticket_type) if ticket_type else None
+            ))
+        yield [SimpleNamespace(
+            id=row.id, booking_number=row.booking_number, total_amount=row.total_amount,
+            created_at=row.created_at,
+            user=SimpleNamespace(first_name=row.first_name, last_name=row.last_name),
+            tickets=tickets.get(row.id, [])
+        ) for row in rows]
+        last_id = rows[-1].id
+
+
+def event_snapshot(event):
+    return SimpleNamespace(
+        title=event.title, start_date=event.start_date, end_date=event.end_date,
+        venue_name=event.venue_name, venue_address=event.venue_address, poster_image=event.poster_image
+    )
+
+
+def render_booking(event, poster_jpeg, booking):
+    """PDF of one booking snapshot"""
+    return render_ticket_pdf(booking, event, booking.user, booking.tickets, poster_jpeg)
+
+
+# Event snapshot and poster of the job a render process works for
+_process_job = None
+
+
+def _init_render_process(event, poster_jpeg):
+    global _process_job
+    _process_job = (event, poster_jpeg)
+
+
+def _render_in_process(booking):
+    event, poster_jpeg = _process_job
+    return render_booking(event, poster_jpeg, booking)
+
+
+class PDFMerger:
+    """Appends booking PDFs into one document"""
+
+    def __init__(self, output):
+        from pypdf import PdfWriter
+        self.output = output
+        self.writer = PdfWriter()
+
+    def add(self, booking, content):
+        self.writer.append(BytesIO(content))
+
+    def close(self):
+        self.writer.write(self.output)
+        self.writer.close()
+
+
+class ZipBundle:
+    """Adds each booking's PDF to a ZIP archive as it is rendered"""
+
+    def __init__(self, output):
+        # PDFs are already compressed
+        self.archive = zipfile.ZipFile(output, 'w', zipfile.ZIP_STORED)
+
+    def add(self, booking, content):
+        self.archive.writestr(f'ticket-{booking.booking_number}.pdf', content)
+
+    def close(self):
+        self.archive.close()
+
+
+class TicketPDFJobs:
+    """Flask extension: runs bulk ticket PDF jobs in the background"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.workers = 0
+        self.processes = 0
+        self.batch_size = 200
+        self.lease_seconds = 7200
+        self._threads = None
+        self._recovered = False
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.workers = 0 if app.config.get('TESTING', False) else app.config.get('TICKET_PDF_JOB_WORKERS', 1)
+        self.processes = app.config.get('TICKET_PDF_PROCESSES', 2)
+        self.lease_seconds = app.config.get('TICKET_PDF_JOB_LEASE', 7200)
+        app.extensions['ticket_pdf_jobs'] = self
+
+        if self.workers:
+            # Pick up jobs lost with a previous process on the first request
+            app.before_request(self._recover_once)
+
+    def _recover_once(self):
+        if not self._recovered:
+            with self._lock:
+                if self._recovered:
+                    return
+                self._recovered = True
+            try:
+                for job_id in self.recover_stale():
+                    self.submit(job_id)
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.error(f'Failed to recover ticket PDF jobs: {str(e)}')
+
+    def recover_stale(self):
+        """
+        Mark jobs running for longer than the lease failed, and find pending
+        jobs queued longer than that ago (their process is gone). Commits.
+
+        Returns:
+            list: Ids of the stale pending jobs, to be submitted again
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=self.lease_seconds)
+        failed = TicketPDFJob.query.filter(
+            TicketPDFJob.status == 'running',
+            TicketPDFJob.started_at < cutoff
+        ).update({
+            'status': 'failed',
+            'error': 'Interrupted, please start a new job',
+            'completed_at': datetime.utcnow()
+        }, synchronize_session=False)
+        db.session.commit()
+        if failed:
+            self.app.logger.warning(f'Marked {failed} interrupted ticket PDF job(s) failed')
+
+        return [job_id for (job_id,) in db.session.query(TicketPDFJob.id).filter(
+            TicketPDFJob.status == 'pending',
+            TicketPDFJob.created_at < cutoff
+        ).order_by(TicketPDFJob.id)]
+
+    def create_job(self, partner_id, event_id, output_format):
+        """Record a job for the event's confirmed bookings and start it. Commits."""
+        job = TicketPDFJob(
+            partner_id=partner_id,
+            event_id=event_id,
+            output_format=output_format,
+            total_bookings=confirmed_booking_count(event_id)
+        )
+        db.session.add(job)
+        db.session.commit()
+        self.submit(job.id)
+        return job
+
+    def submit(self, job_id):
+        if not self.workers:
+            self.run(job_id)
+            return
+        if self._threads is None:
+            with self._lock:
+                if self._threads is None:
+                    self._threads = ThreadPoolExecutor(self.workers, thread_name_prefix='ticket-pdf-job')
+        self._threads.submit(self._run_in_context, job_id)
+
+    def _run_in_context(self, job_id):
+        with self.app.app_context():
+            self.run(job_id)
+
+    def _render_pool(self, event, poster_jpeg):
+        """Process pool rendering the bookings of one event"""
+        return ProcessPoolExecutor(
+            self.processes,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_render_process,
+            initargs=(event, poster_jpeg)
+        )
+
+    def run(self, job_id):
+        """Render, bundle and save a job's PDFs, recording progress on the job"""
+        # Conditional claim, so a recovered job never runs twice
+        claimed = TicketPDFJob.query.filter_by(id=job_id, status='pending').update({
+            'status': 'running',
+            'started_at': datetime.utcnow()
+        }, synchronize_session=False)
+        db.session.commit()
+        if not claimed:
+            return
+        job = db.session.get(TicketPDFJob, job_id)
+
+        pool = None
+        try:
+            event = db.session.get(Event, job.event_id)
+            snapshot, poster_jpeg = event_snapshot(event), poster_bytes(event.poster_image)
+            if self.processes:
+                pool = self._render_pool(snapshot, poster_jpeg)
+                # A few chunks per process keeps them all busy without a round trip per booking
+                chunksize = max(1, self.batch_size // (self.processes * 4))
+            else:
+                render = partial(render_booking, snapshot, poster_jpeg)
+            with tempfile.TemporaryFile() as output:
+                bundle = PDFMerger(output) if job.output_format == 'pdf' else ZipBundle(output)
+                processed = 0
+                for batch in iter_booking_batches(job.event_id, self.batch_size):
+                    if pool is not None:
+                        pdfs = pool.map(_render_in_process, batch, chunksize=chunksize)
+                    else:
+                        pdfs = map(render, batch)
+                    for booking, content in zip(batch, pdfs):
+                        bundle.add(booking, content)
+                    processed += len(batch)
+                    job.processed_bookings = processed
+                    db.session.commit()
+                bundle.close()
+
+                job.file_size = output.seek(0, SEEK_END)
+                output.seek(0)
+                filename = f'{uuid.uuid4().hex}.{job.output_format}'
+                job.file_location = save_file_bytes(output, JOB_FOLDER, filename, FORMATS[job.output_format])
+            job.total_bookings = processed
+            job.status = 'completed'
+            job.completed_at = datetime.utcnow()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            self.app.logger.error(f'Ticket PDF job {job_id} failed: {str(e)}')
+            job = db.session.get(TicketPDFJob, job_id)
+            job.status = 'failed'
+            job.error = str(e)
+            job.completed_at = datetime.utcnow()
+            db.session.commit()
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+    def stop(self):
+        """Finish running jobs and shut the job threads down"""
+        if self._threads is not None:
+            self._threads.shutdown(wait=True)
+            self._threads = None
+
+
+ticket_pdf_jobs = TicketPDFJobs()
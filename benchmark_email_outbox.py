@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Benchmark outbound email throughput against a local SMTP sink
+Compares the old behaviour (a thread and a new SMTP connection per message)
+with the email outbox workers (persistent SMTP connections, batches).
+
+The sink adds a delay per new connection (standing in for STARTTLS and
+AUTH against a real provider) and per message, and like real providers
+turns away connections beyond MAX_CONNECTIONS with a 421.
+
+Usage: python benchmark_email_outbox.py [messages] [workers]
+"""
+import os
+import sys
+import time
+import tempfile
+import threading
+import socketserver
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Point the app at a scratch database before config is imported
+DB_FILE = os.path.join(tempfile.mkdtemp(), 'email_bench.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_FILE}'
+
+from flask_mail import Message
+from app import create_app, db, mail
+from app.models.notification import OutboundEmail
+from app.utils.email_outbox import email_outbox
+
+HANDSHAKE_DELAY = 0.080  # seconds per new connection
+MESSAGE_DELAY = 0.005    # seconds per message
+MAX_CONNECTIONS = 20     # concurrent connections accepted
+
+
+class SMTPSink(socketserver.StreamRequestHandler):
+    """Accepts and discards every message"""
+    disable_nagle_algorithm = True
+    counts = {'connections': 0, 'messages': 0}
+    open_connections = 0
+    lock = threading.Lock()
+
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        with self.lock:
+            self.counts['connections'] += 1
+            SMTPSink.open_connections += 1
+            busy = SMTPSink.open_connections > MAX_CONNECTIONS
+        try:
+            if busy:
+                self.reply('421 Too many concurrent connections')
+                return
+            time.sleep(HANDSHAKE_DELAY)
+            self.session()
+        finally:
+            with self.lock:
+                SMTPSink.open_connections -= 1
+
+    def session(self):
+        self.reply('220 sink ESMTP')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors='replace').strip().upper()
+            if command.startswith(('EHLO', 'HELO')):
+                self.reply('250 sink')
+            elif command == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                while self.rfile.readline() not in (b'.\r\n', b''):
+                    pass
+                time.sleep(MESSAGE_DELAY)
+                with self.lock:
+                    self.counts['messages'] += 1
+                self.reply('250 Queued')
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                # MAIL, RCPT, RSET, NOOP
+                self.reply('250 OK')
+
+
+class SinkServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 1024
+
+
+def wait_for(count, failures=None, timeout=120):
+    deadline = time.monotonic() + timeout
+    while SMTPSink.counts['messages'] + len(failures or []) < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def report(label, messages, elapsed):
+    delivered = SMTPSink.counts['messages']
+    print(f"{label:<28} {delivered}/{messages} delivered in {elapsed:6.2f}s  "
+          f"{delivered / elapsed:7.1f} msg/s  connections {SMTPSink.counts['connections']:4d}")
+
+
+def reset_counts():
+    SMTPSink.counts.update(connections=0, messages=0)
+
+
+def thread_per_message(app, messages):
+    """What send_email used to do: a daemon thread and mail.send per message"""
+    failures = []
+
+    def send(msg):
+        with app.app_context():
+            try:
+                mail.send(msg)
+            except Exception as e:
+                failures.append(e)
+
+    with app.app_context():
+        msgs = [Message(subject=f'Reminder {i}', recipients=[f'fan{i}@example.com'],
+                        html='<p>See you there</p>', body='See you there') for i in range(messages)]
+    start = time.perf_counter()
+    for msg in msgs:
+        threading.Thread(target=send, args=(msg,), daemon=True).start()
+    wait_for(messages, failures)
+    if failures:
+        print(f"  {len(failures)} messages lost, e.g. {failures[0]!r}")
+    return time.perf_counter() - start
+
+
+def outbox(app, messages):
+    """Queue everything, then let the outbox workers deliver it"""
+    with app.app_context():
+        for i in range(messages):
+            db.session.add(OutboundEmail(
+                recipients=[f'fan{i}@example.com'], subject=f'Reminder {i}',
+                html_body='<p>See you there</p>', text_body='See you there', domain='example.com'
+            ))
+        db.session.commit()
+    start = time.perf_counter()
+    email_outbox.start()
+    wait_for(messages)
+    elapsed = time.perf_counter() - start
+    email_outbox.stop()
+    with app.app_context():
+        sent = OutboundEmail.query.filter_by(status='sent').count()
+    assert sent == messages, f'Only {sent} of {messages} marked sent'
+    return elapsed
+
+
+def main(messages=500, workers=4):
+    server = SinkServer(('127.0.0.1', 0), SMTPSink)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    app = create_app('development')
+    app.config.update(
+        SQLALCHEMY_ECHO=False,
+        MAIL_SERVER='127.0.0.1',
+        MAIL_PORT=server.server_address[1],
+        MAIL_USE_TLS=False,
+        MAIL_USERNAME=None,
+        MAIL_PASSWORD=None,
+        MAIL_OUTBOX_WORKERS=workers,
+        MAIL_OUTBOX_DOMAIN_RATE=0  # no pacing: measure raw throughput
+    )
+    email_outbox.init_app(app)
+    with app.app_context():
+        db.engine.echo = False
+        db.create_all()
+
+    print(f"{messages} emails to SMTP sink on port {server.server_address[1]}\n")
+    reset_counts()
+    report('thread per message', messages, thread_per_message(app, messages))
+    reset_counts()
+    report(f'outbox ({workers} workers)', messages, outbox(app, messages))
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 500,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    )
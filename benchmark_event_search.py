@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Benchmark event search: full-text index vs the ilike('%term%') fallback
+Seeds a scratch SQLite database with synthetic events (default 100k)
+
+Usage: python benchmark_event_search.py [event_count]
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+from datetime import datetime, timedelta
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Point the app at a scratch database before config is imported
+DB_FILE = os.path.join(tempfile.mkdtemp(), 'search_bench.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_FILE}'
+
+from sqlalchemy import or_
+from app import create_app, db
+from app.models.partner import Partner
+from app.models.event import Event, EventInterest
+from app.models.category import Category
+from app.utils.search import create_search_index, rebuild_search_index, search_subquery
+
+WORDS = [
+    'music', 'festival', 'tech', 'startup', 'yoga', 'marathon', 'jazz', 'comedy',
+    'conference', 'workshop', 'safari', 'food', 'wine', 'gaming', 'dance', 'art',
+    'networking', 'charity', 'football', 'coding', 'photography', 'film', 'poetry'
+]
+# Filler vocabulary so that real words are selective, as in production data
+FILLER = [f'word{i}' for i in range(5000)]
+TITLE_VOCABULARY = WORDS + FILLER[:1000]
+TERMS = ['jazz', 'tech conference', 'yoga', 'charity marathon', 'photography workshop']
+RUNS = 20
+
+
+def seed(event_count):
+    """Insert synthetic events in bulk"""
+    categories = [Category(name=name.title(), slug=name) for name in WORDS[:8]]
+    partner = Partner(email='bench@example.com', phone_number='254700000000',
+                      password_hash='x', business_name='Bench Partner')
+    db.session.add_all(categories + [partner])
+    db.session.commit()
+
+    now = datetime.utcnow()
+    rng = random.Random(42)
+    batch = 5000
+    for offset in range(0, event_count, batch):
+        events = []
+        for i in range(offset, min(offset + batch, event_count)):
+            title_words = rng.sample(TITLE_VOCABULARY, 3)
+            events.append({
+                'id': i + 1,
+                'title': f"{' '.join(title_words).title()} #{i}",
+                'description': ' '.join(rng.sample(FILLER, 40)),
+                'partner_id': partner.id,
+                'category_id': rng.choice(categories).id,
+                'start_date': now + timedelta(days=rng.randint(1, 365)),
+                'status': 'approved',
+                'is_published': True,
+                'created_at': now
+            })
+        db.session.execute(Event.__table__.insert(), events)
+        db.session.execute(EventInterest.__table__.insert(), [
+            {'event_id': event['id'], 'name': rng.choice(WORDS)} for event in events
+        ])
+        db.session.commit()
+
+
+def base_query():
+    return Event.query.filter(
+        Event.is_published == True,
+        Event.status == 'approved',
+        Event.start_date > datetime.utcnow()
+    )
+
+
+def run_ilike(term):
+    return base_query().filter(
+        or_(Event.title.ilike(f'%{term}%'), Event.description.ilike(f'%{term}%'))
+    ).order_by(Event.start_date.asc()).limit(20).all()
+
+
+def run_index(term):
+    matches = search_subquery(term)
+    return base_query().join(matches, matches.c.event_id == Event.id).order_by(
+        matches.c.rank.desc(), Event.start_date.asc()
+    ).limit(20).all()
+
+
+def run_autocomplete(term):
+    matches = search_subquery(term[:3], prefix=True)
+    return base_query().join(matches, matches.c.event_id == Event.id).order_by(
+        matches.c.rank.desc()
+    ).limit(5).all()
+
+
+def timed(fn, term):
+    """Median wall time in milliseconds over RUNS calls"""
+    samples = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        fn(term)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def benchmark_event_search(event_count=100000):
+    app = create_app('production')
+
+    with app.app_context():
+        db.create_all()
+        print(f"Seeding {event_count} events...")
+        seed(event_count)
+
+        start = time.perf_counter()
+        create_search_index()
+        indexed = rebuild_search_index(batch_size=5000)
+        print(f"Indexed {indexed} events in {time.perf_counter() - start:.1f}s")
+        print()
+        print(f"{'term':<24}{'ilike (ms)':>12}{'index (ms)':>12}{'prefix (ms)':>13}")
+        for term in TERMS:
+            print(f"{term:<24}{timed(run_ilike, term):>12.2f}"
+                  f"{timed(run_index, term):>12.2f}{timed(run_autocomplete, term):>13.2f}")
+
+    os.remove(DB_FILE)
+
+
+if __name__ == '__main__':
+    benchmark_event_search(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
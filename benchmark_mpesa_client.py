@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Benchmark M-Pesa payment initiation against a local stub Daraja server
+Compares the old client behaviour (new OAuth token and new connection per
+call) with MPesaClient (cached token, pooled session), sequentially and
+with concurrent callers.
+
+The stub adds a delay per new connection (standing in for the TLS
+handshake) and per request (Daraja processing time).
+
+Usage: python benchmark_mpesa_client.py [calls] [threads]
+"""
+import os
+import sys
+import json
+import time
+import base64
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import requests
+from app import create_app
+from app.utils.mpesa import MPesaClient, token_cache
+
+CONNECT_DELAY = 0.030  # seconds per new connection
+OAUTH_DELAY = 0.150    # seconds per token request
+API_DELAY = 0.040      # seconds per STK push
+
+
+class StubDaraja(BaseHTTPRequestHandler):
+    """Just enough of the Daraja API for STK push"""
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    counts = {'connections': 0, 'oauth': 0, 'stkpush': 0}
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with self.lock:
+            self.counts['connections'] += 1
+        time.sleep(CONNECT_DELAY)
+
+    def _reply(self, body):
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        with self.lock:
+            self.counts['oauth'] += 1
+        time.sleep(OAUTH_DELAY)
+        self._reply({'access_token': f'token-{time.time()}', 'expires_in': '3599'})
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with self.lock:
+            self.counts['stkpush'] += 1
+        time.sleep(API_DELAY)
+        self._reply({
+            'MerchantRequestID': '1234-5678',
+            'CheckoutRequestID': f'ws_CO_{time.time_ns()}',
+            'ResponseCode': '0',
+            'ResponseDescription': 'Success. Request accepted for processing'
+        })
+
+    def log_message(self, *args):
+        pass
+
+
+def legacy_stk_push(base_url, phone_number, amount):
+    """STK push as the client used to do it: fresh token, no session, no timeout"""
+    auth = base64.b64encode(b'key:secret').decode('ascii')
+    response = requests.get(f'{base_url}/oauth/v1/generate?grant_type=client_credentials',
+                            headers={'Authorization': f'Basic {auth}'})
+    access_token = response.json().get('access_token')
+    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+    response = requests.post(f'{base_url}/mpesa/stkpush/v1/processrequest', json={
+        'BusinessShortCode': '174379',
+        'Timestamp': timestamp,
+        'Amount': int(amount),
+        'PhoneNumber': phone_number
+    }, headers={'Authorization': f'Bearer {access_token}', 'Content-Type': 'application/json'})
+    return response.json()
+
+
+def run(label, call, calls, threads):
+    for key in StubDaraja.counts:
+        StubDaraja.counts[key] = 0
+    latencies = []
+    lock = threading.Lock()
+    per_thread = calls // threads
+
+    def worker():
+        for _ in range(per_thread):
+            start = time.perf_counter()
+            result = call()
+            elapsed = (time.perf_counter() - start) * 1000
+            assert result.get('ResponseCode') == '0', result
+            with lock:
+                latencies.append(elapsed)
+
+    wall = time.perf_counter()
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    wall = time.perf_counter() - wall
+
+    latencies.sort()
+    counts = StubDaraja.counts
+    print(f"{label:<32} p50 {latencies[len(latencies) // 2]:7.1f}ms  "
+          f"p95 {latencies[int(len(latencies) * 0.95)]:7.1f}ms  "
+          f"{len(latencies) / wall:6.1f} req/s  "
+          f"oauth {counts['oauth']:4d}  connections {counts['connections']:4d}")
+
+
+def main(calls=200, threads=8):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubDaraja)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+
+    app = create_app('testing')
+    app.config['MPESA_BASE_URL'] = base_url
+
+    def cached_stk_push():
+        with app.app_context():
+            return MPesaClient().stk_push('254700000000', 100, 'BENCH', 'Benchmark')
+
+    print(f"{calls} STK pushes against stub Daraja at {base_url}\n")
+    for threads_used in (1, threads):
+        token_cache.clear()
+        suffix = f'{threads_used} thread' + ('s' if threads_used > 1 else '')
+        run(f'before ({suffix})', lambda: legacy_stk_push(base_url, '254700000000', 100), calls, threads_used)
+        run(f'after ({suffix})', cached_stk_push, calls, threads_used)
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 200,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    )
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark notification fan-out
+Compares create_notification (one insert and commit per recipient) with
+create_notifications (one bulk insert, one commit), with and without
+queuing an email and SMS per recipient.
+
+Runs against a scratch SQLite database unless DATABASE_URL is set, e.g. to
+a disposable PostgreSQL database.
+
+Usage: python benchmark_notifications.py [recipients]
+"""
+import os
+import sys
+import time
+import tempfile
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Point the app at a scratch database before config is imported
+if not os.environ.get('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'notifications_bench.db')}"
+
+from sqlalchemy import insert, delete
+from app import create_app, db
+from app.models.user import User
+from app.models.notification import Notification, OutboundEmail, SMSMessage
+from app.routes.notifications import create_notification, create_notifications
+
+
+def reset():
+    for model in (Notification, OutboundEmail, SMSMessage):
+        db.session.execute(delete(model))
+    db.session.commit()
+
+
+def one_by_one(users):
+    for user_id, _, _ in users:
+        create_notification(
+            user_id=user_id, title='Lineup announced', message='The full lineup is out!',
+            notification_type='event', action_url='/events/1', action_text='View Event'
+        )
+
+
+def bulk(users, deliver=False):
+    recipients = [{'user_id': user_id, 'email': email, 'phone_number': phone} for user_id, email, phone in users]
+    extra = {}
+    if deliver:
+        extra = {'email_subject': 'Lineup announced', 'email_html': '<p>The full lineup is out!</p>',
+                 'sms_message': 'The full lineup is out!'}
+    create_notifications(
+        recipients, title='Lineup announced', message='The full lineup is out!',
+        notification_type='event', action_url='/events/1', action_text='View Event', **extra
+    )
+
+
+def run(label, fn, users, **kwargs):
+    reset()
+    start = time.perf_counter()
+    fn(users, **kwargs)
+    elapsed = time.perf_counter() - start
+    counts = (Notification.query.count(), OutboundEmail.query.count(), SMSMessage.query.count())
+    print(f"{label:<34} {elapsed:7.2f}s  {len(users) / elapsed:9.0f} recipients/s  "
+          f"notifications {counts[0]}  emails {counts[1]}  sms {counts[2]}")
+    return elapsed
+
+
+def main(recipients=10000):
+    app = create_app('development')
+    app.config.update(
+        SQLALCHEMY_ECHO=False,
+        MAIL_SERVER='localhost', MAIL_USERNAME='bench', MAIL_PASSWORD='bench',
+        MAIL_SUPPRESS_SEND=False, SMS_SUPPRESS_SEND=False
+    )
+    with app.app_context():
+        db.engine.echo = False
+        db.create_all()
+        start_id = (db.session.query(db.func.max(User.id)).scalar() or 0) + 1
+        db.session.execute(insert(User), [
+            {'email': f'bench{start_id + i}@example.com', 'first_name': 'Bench', 'last_name': 'User',
+             'phone_number': f'07{i:08d}'} for i in range(recipients)
+        ])
+        db.session.commit()
+        users = db.session.query(User.id, User.email, User.phone_number).filter(User.id >= start_id).all()
+
+        print(f"{recipients} recipients on {db.engine.dialect.name}\n")
+        before = run('create_notification per recipient', one_by_one, users)
+        after = run('create_notifications', bulk, users)
+        run('create_notifications + email/SMS', bulk, users, deliver=True)
+        print(f"\nspeedup {before / after:.0f}x")
+
+        reset()
+        User.query.filter(User.id >= start_id).delete()
+        db.session.commit()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
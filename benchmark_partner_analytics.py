@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Benchmark the partner analytics time series
+Compares the previous approach (load every booking, rescan them all for
+each day) with partner_analytics.time_series (one grouped query, bisect
+and prefix sums) at day, week and month granularity, and checks both give
+the same rows.
+
+Runs against a scratch SQLite database unless DATABASE_URL is set, e.g. to
+a disposable PostgreSQL database.
+
+Usage: python benchmark_partner_analytics.py [bookings] [days]
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+from datetime import datetime, timedelta
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Point the app at a scratch database before config is imported
+if not os.environ.get('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'partner_analytics_bench.db')}"
+
+from sqlalchemy import insert
+from app import create_app, db
+from app.models.partner import Partner
+from app.models.category import Category
+from app.models.event import Event
+from app.models.user import User
+from app.models.ticket import Booking
+from app.models.payment import Payment
+from app.utils import partner_analytics
+
+
+def seed(bookings, days, now):
+    category = Category(name='Benchmark', slug=f'benchmark-{time.time_ns()}')
+    db.session.add(category)
+    db.session.flush()
+    partner = Partner(email=f'bench-{time.time_ns()}@example.com', phone_number='0700000000',
+                      password_hash='x', business_name='Benchmark Partner', category_id=category.id,
+                      status='approved')
+    user = User(email=f'bench-{time.time_ns()}@example.com', first_name='Bench', last_name='User')
+    db.session.add_all([partner, user])
+    db.session.flush()
+
+    random_time = lambda: now - timedelta(seconds=random.randint(0, days * 86400))
+    db.session.execute(insert(Event), [
+        {'title': f'Benchmark event {i}', 'description': 'Benchmark', 'partner_id': partner.id,
+         'category_id': category.id, 'start_date': random_time() + timedelta(days=60),
+         'status': random.choice(['approved', 'pending']), 'created_at': random_time()}
+        for i in range(200)
+    ])
+    event_ids = [row[0] for row in db.session.query(Event.id).filter_by(partner_id=partner.id).all()]
+
+    booking_events = [random.choice(event_ids) for _ in range(bookings)]
+    prefix = time.time_ns()
+    db.session.execute(insert(Payment), [
+        {'transaction_id': f'bench-{prefix}-{i}', 'user_id': user.id, 'event_id': booking_events[i],
+         'amount': 500, 'platform_fee': 35, 'partner_amount': 465, 'payment_method': 'mpesa',
+         'status': 'completed'}
+        for i in range(bookings)
+    ])
+    first_payment = db.session.query(db.func.min(Payment.id)).filter(
+        Payment.transaction_id.like(f'bench-{prefix}-%')
+    ).scalar()
+    db.session.execute(insert(Booking), [
+        {'booking_number': f'BENCH-{prefix}-{i}', 'user_id': user.id, 'event_id': booking_events[i],
+         'payment_id': first_payment + i, 'total_amount': 500, 'partner_amount': random.randint(100, 2000),
+         'status': 'confirmed', 'payment_status': 'paid', 'created_at': random_time()}
+        for i in range(bookings)
+    ])
+    db.session.commit()
+    return partner
+
+
+def rescan_per_day(bookings_query, events_query, starts, end):
+    """The previous algorithm: every bucket rescans all events and bookings"""
+    all_events = events_query.all()
+    all_bookings = bookings_query.all()
+    rows = []
+    for i, bucket_start in enumerate(starts):
+        day_start = datetime.combine(bucket_start, datetime.min.time())
+        day_end = datetime.combine(starts[i + 1] if i + 1 < len(starts) else end, datetime.min.time())
+        rows.append({
+            'date': bucket_start.strftime('%Y-%m-%d'),
+            'active_events': sum(1 for event in all_events
+                                 if event.start_date > day_start and event.status == 'approved'),
+            'total_events': sum(1 for event in all_events if event.created_at < day_end),
+            'bookings': sum(1 for booking in all_bookings if day_start <= booking.created_at < day_end),
+            'cumulative_bookings': sum(1 for booking in all_bookings if booking.created_at < day_end),
+            'revenue': sum(float(booking.partner_amount) for booking in all_bookings
+                           if day_start <= booking.created_at < day_end),
+            'cumulative_revenue': sum(float(booking.partner_amount) for booking in all_bookings
+                                      if booking.created_at < day_end)
+        })
+    return rows
+
+
+def same_rows(a, b):
+    if len(a) != len(b):
+        return False
+    for row_a, row_b in zip(a, b):
+        for key, value in row_a.items():
+            if isinstance(value, float) and abs(value - row_b[key]) > 0.01:
+                return False
+            if not isinstance(value, float) and value != row_b[key]:
+                return False
+    return True
+
+
+def main(bookings=100000, days=365):
+    app = create_app('development')
+    app.config.update(SQLALCHEMY_ECHO=False)
+    with app.app_context():
+        db.engine.echo = False
+        db.create_all()
+        now = datetime.utcnow()
+        random.seed(7)
+        partner = seed(bookings, days, now)
+
+        bookings_query = Booking.query.join(Event).join(Payment).filter(
+            Event.partner_id == partner.id,
+            Booking.status == 'confirmed',
+            Payment.status == 'completed',
+            Booking.payment_id == Payment.id
+        )
+        events_query = Event.query.filter_by(partner_id=partner.id)
+
+        print(f"{bookings} bookings over {days} days on {db.engine.dialect.name}\n")
+        for granularity in partner_analytics.GRANULARITIES:
+            start = time.perf_counter()
+            rows = partner_analytics.time_series(bookings_query, events_query, days, granularity, now=now)
+            elapsed = time.perf_counter() - start
+            print(f"time_series {granularity:<6} {elapsed * 1000:8.1f} ms  {len(rows)} rows")
+
+        # Bucketing alone, without the grouped query
+        last_day = now.date()
+        first_day = last_day - timedelta(days=days - 1)
+        day = db.func.date(Booking.created_at)
+        daily = bookings_query.with_entities(
+            day, db.func.count(Booking.id), db.func.sum(Booking.partner_amount)
+        ).group_by(day).all()
+        daily = sorted((partner_analytics._as_date(d), count, amount) for d, count, amount in daily
+                       if partner_analytics._as_date(d) >= first_day)
+        events = events_query.with_entities(Event.created_at, Event.start_date, Event.status).all()
+        starts = partner_analytics.bucket_starts(first_day, last_day, 'day')
+        start = time.perf_counter()
+        partner_analytics.build_series(daily, events, starts, last_day + timedelta(days=1))
+        print(f"build_series day   {(time.perf_counter() - start) * 1000:8.1f} ms  (bucketing only)\n")
+
+        # The old loop is O(days x bookings); time it on the monthly buckets and on daily buckets
+        for granularity in ('month', 'day'):
+            starts = partner_analytics.bucket_starts(first_day, last_day, granularity)
+            start = time.perf_counter()
+            expected = rescan_per_day(bookings_query, events_query, starts, last_day + timedelta(days=1))
+            elapsed = time.perf_counter() - start
+            rows = partner_analytics.time_series(bookings_query, events_query, days, granularity, now=now)
+            print(f"rescan per bucket {granularity:<6} {elapsed * 1000:8.1f} ms  "
+                  f"{'same rows' if same_rows(rows, expected) else 'MISMATCH'}")
+
+
+if __name__ == '__main__':
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 100000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 365
+    )
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Benchmark ticket PDF downloads
+Times ticket_pdf for 1-ticket and 10-ticket bookings in three states:
+
+- cold: no cached styles, logo, poster, QR images or PDFs; the poster is
+  fetched over HTTP (as from Blob Storage) and resized, as every download
+  used to do (once per ticket)
+- new booking: styles, logo and poster cached, the booking's PDF not yet
+- repeat download: the booking's PDF cached and its tickets unchanged
+
+The poster is served from a local HTTP server with --latency ms added per
+request to stand in for Blob Storage.
+
+Runs against a scratch SQLite database unless DATABASE_URL is set, e.g. to
+a disposable PostgreSQL database.
+
+Usage: python benchmark_ticket_pdf.py [runs] [--latency ms]
+"""
+import os
+import sys
+import time
+import tempfile
+import threading
+from io import BytesIO
+from datetime import datetime, timedelta
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Point the app at a scratch database before config is imported
+if not os.environ.get('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'ticket_pdf_bench.db')}"
+
+from PIL import Image as PILImage
+from app import create_app, db
+from app.models.partner import Partner
+from app.models.category import Category
+from app.models.event import Event
+from app.models.user import User
+from app.models.ticket import Booking, Ticket, TicketType
+from app.utils import ticket_pdf as pdf_module
+from app.utils.qrcode_generator import qr_image_cache
+
+
+def poster_server(latency):
+    """Serve a 1200x1800 JPEG poster on localhost; returns its URL"""
+    buffer = BytesIO()
+    PILImage.new('RGB', (1200, 1800), (39, 170, 226)).save(buffer, format='JPEG', quality=90)
+    poster = buffer.getvalue()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency / 1000)
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/jpeg')
+            self.send_header('Content-Length', str(len(poster)))
+            self.end_headers()
+            self.wfile.write(poster)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}/posters/bench.jpg'
+
+
+def seed(poster_url, ticket_counts):
+    category = Category(name='Benchmark', slug=f'benchmark-{time.time_ns()}')
+    db.session.add(category)
+    db.session.flush()
+    partner = Partner(email=f'bench-{time.time_ns()}@example.com', phone_number='0700000000',
+                      password_hash='x', business_name='Benchmark Partner', category_id=category.id,
+                      status='approved')
+    user = User(email=f'bench-{time.time_ns()}@example.com', first_name='Bench', last_name='User')
+    db.session.add_all([partner, user])
+    db.session.flush()
+    event = Event(title='Benchmark Night', description='Benchmark', partner_id=partner.id,
+                  category_id=category.id, start_date=datetime.utcnow() + timedelta(days=30),
+                  venue_name='KICC, Nairobi', poster_image=poster_url, status='approved')
+    db.session.add(event)
+    db.session.flush()
+    ticket_type = TicketType(event_id=event.id, name='Regular', price=1000, quantity_total=1000,
+                             quantity_available=1000)
+    db.session.add(ticket_type)
+    db.session.flush()
+
+    booking_ids = {}
+    for count in ticket_counts:
+        booking = Booking(booking_number=f'BENCH-{time.time_ns()}', user_id=user.id, event_id=event.id,
+                          quantity=count, total_amount=1000 * count, status='confirmed')
+        db.session.add(booking)
+        db.session.flush()
+        for i in range(count):
+            db.session.add(Ticket(ticket_number=f'TKT-BENCH-{booking.id}-{i}', booking_id=booking.id,
+                                  ticket_type_id=ticket_type.id))
+        booking_ids[count] = booking.id
+    db.session.commit()
+    return booking_ids
+
+
+def clear_all():
+    pdf_module._styles.cache_clear()
+    pdf_module._logo_bytes.cache_clear()
+    pdf_module._poster_jpeg.cache_clear()
+    pdf_module.ticket_pdf_cache.clear()
+    qr_image_cache.clear()
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))]
+
+
+def measure(booking_id, runs, before_each):
+    samples = []
+    size = 0
+    for _ in range(runs):
+        before_each()
+        # Loading the booking is part of every download
+        db.session.expire_all()
+        booking = db.session.get(Booking, booking_id)
+        start = time.perf_counter()
+        tickets = list(booking.tickets.all())
+        content, _ = pdf_module.ticket_pdf(booking, tickets)
+        samples.append((time.perf_counter() - start) * 1000)
+        size = len(content)
+    return samples, size
+
+
+def main(runs=20, latency=40):
+    poster_url = poster_server(latency)
+    app = create_app('development')
+    app.config.update(SQLALCHEMY_ECHO=False)
+    with app.app_context():
+        db.engine.echo = False
+        db.create_all()
+        booking_ids = seed(poster_url, (1, 10))
+
+        print(f"{runs} runs per case, poster fetch latency {latency} ms, {db.engine.dialect.name}\n")
+        print(f"{'tickets':>7}  {'case':<17} {'p50 ms':>8} {'p95 ms':>8}  pdf size")
+        for count, booking_id in booking_ids.items():
+            cases = (
+                ('cold', clear_all),
+                ('new booking', pdf_module.ticket_pdf_cache.clear),
+                ('repeat download', lambda: None)
+            )
+            for label, before_each in cases:
+                samples, size = measure(booking_id, runs, before_each)
+                print(f"{count:>7}  {label:<17} {percentile(samples, 50):8.1f} {percentile(samples, 95):8.1f}  "
+                      f"{size / 1024:.0f} KB")
+            print()
+        print("Before this change each ticket in a booking fetched and resized the poster again, "
+              f"so a cold 10-ticket download also paid about 9 x {latency} ms more in poster fetches.")
+
+
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    latency = 40
+    if '--latency' in sys.argv:
+        latency = int(sys.argv[sys.argv.index('--latency') + 1])
+        args = [arg for arg in args if arg != str(latency)]
+    main(int(args[0]) if args else 20, latency)
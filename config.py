@@ -46,6 +46,14 @@ class Config:
     MAIL_USERNAME = os.getenv('MAIL_USERNAME')
     MAIL_PASSWORD = os.getenv('MAIL_PASSWORD')
     MAIL_DEFAULT_SENDER = os.getenv('MAIL_DEFAULT_SENDER', 'noreply@nikofree.com')
+    MAIL_TIMEOUT = int(os.getenv('MAIL_TIMEOUT', '30'))  # seconds
+    
+    # Email outbox: worker threads per web process (0 = run `flask email_worker` instead)
+    MAIL_OUTBOX_WORKERS = int(os.getenv('MAIL_OUTBOX_WORKERS', '2'))
+    MAIL_OUTBOX_BATCH_SIZE = int(os.getenv('MAIL_OUTBOX_BATCH_SIZE', '50'))
+    MAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv('MAIL_OUTBOX_MAX_ATTEMPTS', '6'))
+    MAIL_OUTBOX_DOMAIN_RATE = float(os.getenv('MAIL_OUTBOX_DOMAIN_RATE', '10'))  # messages per second per recipient domain
+    MAIL_OUTBOX_DOMAIN_BURST = int(os.getenv('MAIL_OUTBOX_DOMAIN_BURST', '50'))
     
     # OAuth
     GOOGLE_CLIENT_ID = os.getenv('GOOGLE_CLIENT_ID')
@@ -64,10 +72,84 @@ class Config:
     MPESA_SHORTCODE = os.getenv('MPESA_SHORTCODE', '174379')  # Sandbox shortcode
     MPESA_ENVIRONMENT = os.getenv('MPESA_ENVIRONMENT', 'sandbox')
     MPESA_CALLBACK_URL = os.getenv('MPESA_CALLBACK_URL', 'https://nikofree.onrender.com/api/payments/mpesa/callback')
+    MPESA_BASE_URL = os.getenv('MPESA_BASE_URL')  # Overrides the Daraja API URL (e.g. a local stub)
+    MPESA_CONNECT_TIMEOUT = float(os.getenv('MPESA_CONNECT_TIMEOUT', '5'))  # seconds
+    MPESA_READ_TIMEOUT = float(os.getenv('MPESA_READ_TIMEOUT', '30'))  # seconds
+    # OAuth token cache: memory (per process) or redis (shared between workers, uses REDIS_URL)
+    MPESA_TOKEN_CACHE_BACKEND = os.getenv('MPESA_TOKEN_CACHE_BACKEND', 'memory')
+    
+    # SMS - Celcom Africa
+    CELCOM_API_KEY = os.getenv('CELCOM_API_KEY', 'ffbf65bc0649575080064282d3a324f8')
+    CELCOM_PARTNER_ID = os.getenv('CELCOM_PARTNER_ID', '946')
+    CELCOM_SHORTCODE = os.getenv('CELCOM_SHORTCODE', 'NIKO FREE')
+    SMS_SUPPRESS_SEND = os.getenv('SMS_SUPPRESS_SEND', 'False').lower() == 'true'
+    SMS_TIMEOUT = int(os.getenv('SMS_TIMEOUT', '30'))  # seconds
+    # SMS outbox: worker threads per web process (0 = run `flask sms_worker` instead)
+    SMS_OUTBOX_WORKERS = int(os.getenv('SMS_OUTBOX_WORKERS', '4'))
+    SMS_OUTBOX_BATCH_SIZE = int(os.getenv('SMS_OUTBOX_BATCH_SIZE', '100'))
+    SMS_OUTBOX_MAX_ATTEMPTS = int(os.getenv('SMS_OUTBOX_MAX_ATTEMPTS', '5'))
+    SMS_BULK_SIZE = int(os.getenv('SMS_BULK_SIZE', '20'))  # messages per Celcom sendbulk request, 1 = sendsms
     
     # Redis
     REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
     
+    # Response cache for public listing endpoints and the admin dashboard: memory, redis or none
+    # (redis by default when REDIS_URL is set, so a write invalidates every worker's cache)
+    RESPONSE_CACHE_BACKEND = os.getenv('RESPONSE_CACHE_BACKEND', 'redis' if os.getenv('REDIS_URL') else 'memory')
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '1024'))
+    
+    # Admin chart rollups: refreshed by the chart endpoints when older than MAX_AGE seconds (or `flask refresh_analytics`);
+    # each refresh recomputes the last LOOKBACK_HOURS hours plus older hours with changed rows
+    ANALYTICS_ROLLUP_MAX_AGE = int(os.getenv('ANALYTICS_ROLLUP_MAX_AGE', '60'))
+    ANALYTICS_ROLLUP_LOOKBACK_HOURS = int(os.getenv('ANALYTICS_ROLLUP_LOOKBACK_HOURS', '48'))
+    
+    # Notification stream (Server-Sent Events): memory (per process), redis (between workers, uses REDIS_URL) or none
+    NOTIFICATION_STREAM_BACKEND = os.getenv('NOTIFICATION_STREAM_BACKEND', 'memory')
+    NOTIFICATION_STREAM_HEARTBEAT = int(os.getenv('NOTIFICATION_STREAM_HEARTBEAT', '15'))  # seconds
+    NOTIFICATION_STREAM_MAX_DURATION = int(os.getenv('NOTIFICATION_STREAM_MAX_DURATION', '300'))  # seconds, then the browser reconnects
+    NOTIFICATION_STREAM_TICKET_TTL = int(os.getenv('NOTIFICATION_STREAM_TICKET_TTL', '60'))  # seconds a stream ticket opens a stream
+    # Open streams per web process (each holds a gunicorn thread; keep well below --threads), 0 = no limit
+    NOTIFICATION_STREAM_MAX_STREAMS = int(os.getenv('NOTIFICATION_STREAM_MAX_STREAMS', '16'))
+    
+    # Expired ticket reservations: run the sweeper thread in each web process,
+    # or leave disabled and run `flask reservation_sweeper` as a worker
+    RESERVATION_SWEEPER_ENABLED = os.getenv('RESERVATION_SWEEPER_ENABLED', 'False').lower() == 'true'
+    RESERVATION_SWEEP_BATCH_SIZE = int(os.getenv('RESERVATION_SWEEP_BATCH_SIZE', '500'))
+    RESERVATION_SWEEP_MAX_IDLE = int(os.getenv('RESERVATION_SWEEP_MAX_IDLE', '60'))  # seconds
+    
+    # M-Pesa callback inbox: worker threads per web process (0 = run `flask mpesa_callback_worker` instead)
+    MPESA_CALLBACK_WORKERS = int(os.getenv('MPESA_CALLBACK_WORKERS', '2'))
+    MPESA_CALLBACK_MAX_ATTEMPTS = int(os.getenv('MPESA_CALLBACK_MAX_ATTEMPTS', '5'))
+    MPESA_CALLBACK_LEASE = int(os.getenv('MPESA_CALLBACK_LEASE', '300'))  # seconds
+    MPESA_CALLBACK_POLL_INTERVAL = int(os.getenv('MPESA_CALLBACK_POLL_INTERVAL', '5'))  # seconds
+    # Callbacks for payments from before checkout_request_id was backfilled: pending payments of the last
+    # MPESA_LEGACY_LOOKUP_HOURS hours (0 = off, once `flask backfill_checkout_request_ids` has run) are
+    # searched, at most MPESA_LEGACY_LOOKUP_LIMIT of them
+    MPESA_LEGACY_LOOKUP_HOURS = int(os.getenv('MPESA_LEGACY_LOOKUP_HOURS', '24'))
+    MPESA_LEGACY_LOOKUP_LIMIT = int(os.getenv('MPESA_LEGACY_LOOKUP_LIMIT', '100'))
+    
+    # Ticket QR codes are served on demand from /api/tickets/<ticket number>/qr.png|svg, out of an
+    # in-process cache of up to QR_CODE_CACHE_BYTES of encoded images. Ticket.qr_code links the
+    # QR_CODE_FORMAT image: png (1-bit, QR_CODE_BOX_SIZE pixels per module) or svg. New tickets are
+    # pre-rendered into the cache after the booking commits by QR_CODE_WORKERS threads per web
+    # process (0 = on first request), optionally encoding on a pool of QR_CODE_PROCESSES processes
+    QR_CODE_FORMAT = os.getenv('QR_CODE_FORMAT', 'png')
+    QR_CODE_BOX_SIZE = int(os.getenv('QR_CODE_BOX_SIZE', '4'))
+    QR_CODE_CACHE_BYTES = int(os.getenv('QR_CODE_CACHE_BYTES', str(16 * 1024 * 1024)))
+    QR_CODE_WORKERS = int(os.getenv('QR_CODE_WORKERS', '2'))
+    QR_CODE_PROCESSES = int(os.getenv('QR_CODE_PROCESSES', '0'))
+    
+    # Finished ticket PDFs are cached per booking (in each web process) until what they show changes
+    TICKET_PDF_CACHE_BYTES = int(os.getenv('TICKET_PDF_CACHE_BYTES', str(64 * 1024 * 1024)))
+    # Bulk ticket PDF jobs (partners): TICKET_PDF_JOB_WORKERS jobs run at a time per web process
+    # (0 = inside the request), each rendering its bookings on a pool of TICKET_PDF_PROCESSES processes
+    # (0 = in the job's thread)
+    TICKET_PDF_JOB_WORKERS = int(os.getenv('TICKET_PDF_JOB_WORKERS', '1'))
+    TICKET_PDF_PROCESSES = int(os.getenv('TICKET_PDF_PROCESSES', '2'))
+    # Seconds after which a job still queued is run again and one still running is marked failed
+    # (its process was restarted)
+    TICKET_PDF_JOB_LEASE = int(os.getenv('TICKET_PDF_JOB_LEASE', '7200'))
+    
     # AWS S3
     AWS_ACCESS_KEY_ID = os.getenv('AWS_ACCESS_KEY_ID')
     AWS_SECRET_ACCESS_KEY = os.getenv('AWS_SECRET_ACCESS_KEY')
@@ -1,6 +1,6 @@
 import { Search, Download, Users, Mail, Phone, Calendar, FileSpreadsheet, FileText, X, Ticket } from 'lucide-react';
 import { useState, useEffect, useRef } from 'react';
-import { getPartnerAttendees } from '../../services/partnerService';
+import { getPartnerAttendees, getAllPartnerAttendees } from '../../services/partnerService';
 
 interface Attendee {
   id: number;
@@ -24,6 +24,7 @@ export default function Attendees() {
   const [exportMenuOpen, setExportMenuOpen] = useState(false);
   const [attendees, setAttendees] = useState<Attendee[]>([]);
   const [rawAttendeesData, setRawAttendeesData] = useState<any[]>([]); // Store raw data for export
+  const [hasMoreAttendees, setHasMoreAttendees] = useState(false); // Loaded list is only the first page
   const [isLoading, setIsLoading] = useState(true);
   const [error, setError] = useState('');
   const [pastEventsCount, setPastEventsCount] = useState(0);
@@ -65,6 +66,7 @@ export default function Attendees() {
       
       // Store raw data for export
       setRawAttendeesData(allAttendees);
+      setHasMoreAttendees(Boolean(response.next_cursor));
       
       // Transform API data to component format (masked for display)
       const formattedAttendees: Attendee[] = allAttendees.map((item: any) => ({
@@ -211,18 +213,9 @@ export default function Attendees() {
 
       // Fetch all attendees for export (not just current page)
       let allAttendeesForExport = rawAttendeesData;
-      if (allAttendeesForExport.length === 0) {
-        // Fetch all attendees if we don't have raw data
-        let page = 1;
-        let hasMore = true;
-        allAttendeesForExport = [];
-        while (hasMore) {
-          const response = await getPartnerAttendees(undefined, page, 1000);
-          const pageAttendees = response.attendees || [];
-          allAttendeesForExport = [...allAttendeesForExport, ...pageAttendees];
-          hasMore = pageAttendees.length === 1000;
-          page++;
-        }
+      if (allAttendeesForExport.length === 0 || hasMoreAttendees) {
+        // Follow next_cursor until the last page
+        allAttendeesForExport = await getAllPartnerAttendees();
       }
 
       // Filter attendees based on current filters
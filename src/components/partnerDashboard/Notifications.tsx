@@ -3,7 +3,7 @@ import { useState, useEffect } from 'react';
 import { getPartnerToken } from '../../services/partnerService';
 import { API_BASE_URL, API_ENDPOINTS } from '../../config/api';
 import { useEventUpdates } from '../../contexts/EventUpdateContext';
-import { usePolling } from '../../hooks/usePolling';
+import { useNotificationStream } from '../../hooks/useNotificationStream';
 
 interface Notification {
   id: number;
@@ -76,11 +76,12 @@ export default function Notifications() {
     // eslint-disable-next-line react-hooks/exhaustive-deps
   }, []);
 
-  // Auto-refresh every 15 seconds (notifications are time-sensitive)
-  usePolling({
-    enabled: true,
-    interval: 15000, // 15 seconds
-    onPoll: fetchNotifications
+  // Live updates: reload the list when the server pushes a change
+  useNotificationStream({
+    ticketPath: API_ENDPOINTS.notifications.partnerStreamTicket,
+    getToken: getPartnerToken,
+    onUnreadCount: setUnreadCount,
+    onChange: fetchNotifications
   });
 
   const markAsRead = async (notificationId: number) => {
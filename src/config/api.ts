@@ -133,6 +133,10 @@ export const API_ENDPOINTS = {
     markAllPartnerRead: '/api/notifications/partner/read-all',
     markAllAdminRead: '/api/notifications/admin/read-all',
     delete: (id: number) => `/api/notifications/${id}`,
+    stream: '/api/notifications/stream',
+    streamTicket: '/api/notifications/stream-ticket',
+    partnerStreamTicket: '/api/notifications/partner/stream-ticket',
+    adminStreamTicket: '/api/notifications/admin/stream-ticket',
   },
   
   // Tickets
@@ -0,0 +1,102 @@
+import { useEffect, useRef } from 'react';
+import { API_BASE_URL, API_ENDPOINTS } from '../config/api';
+
+interface UseNotificationStreamOptions {
+  enabled?: boolean;
+  ticketPath: string; // stream-ticket endpoint for the signed-in account
+  getToken: () => string | null;
+  onUnreadCount?: (count: number) => void;
+  onChange?: () => void; // a notification arrived or was read, or the list must be reloaded
+}
+
+/**
+ * Hook for live notifications over Server-Sent Events
+ * Replaces polling: the server pushes new notifications and the unread count.
+ * EventSource can't send an Authorization header, so each connection is
+ * opened with a short-lived ticket; when the stream closes (the server ends
+ * it every few minutes) a new ticket is fetched and the stream reopened.
+ */
+export function useNotificationStream({
+  enabled = true,
+  ticketPath,
+  getToken,
+  onUnreadCount,
+  onChange
+}: UseNotificationStreamOptions) {
+  // Latest callbacks, so re-renders don't reopen the stream
+  const onUnreadCountRef = useRef(onUnreadCount);
+  const onChangeRef = useRef(onChange);
+  const getTokenRef = useRef(getToken);
+  onUnreadCountRef.current = onUnreadCount;
+  onChangeRef.current = onChange;
+  getTokenRef.current = getToken;
+
+  useEffect(() => {
+    if (!enabled) return;
+
+    let source: EventSource | null = null;
+    let retryTimer: ReturnType<typeof setTimeout> | null = null;
+    let closed = false;
+    let failures = 0;
+
+    const reconnect = () => {
+      if (closed) return;
+      failures++;
+      // 3s after a normal close, backing off up to a minute while it keeps failing
+      retryTimer = setTimeout(connect, Math.min(3000 * 2 ** (failures - 1), 60000));
+    };
+
+    const connect = async () => {
+      const token = getTokenRef.current();
+      if (!token || closed) return;
+
+      try {
+        const response = await fetch(`${API_BASE_URL}${ticketPath}`, {
+          method: 'POST',
+          headers: {
+            'Authorization': `Bearer ${token}`,
+          },
+        });
+        if (response.status === 401) {
+          return; // Signed out or token expired: stop until the next mount
+        }
+        if (!response.ok) {
+          throw new Error(`Failed to get notification stream ticket (${response.status})`);
+        }
+        const { ticket } = await response.json();
+        if (closed) return;
+
+        source = new EventSource(
+          `${API_BASE_URL}${API_ENDPOINTS.notifications.stream}?ticket=${encodeURIComponent(ticket)}`
+        );
+        source.addEventListener('open', () => {
+          failures = 0;
+        });
+        source.addEventListener('unread_count', (event) => {
+          const data = JSON.parse((event as MessageEvent).data);
+          onUnreadCountRef.current?.(data.unread_count || 0);
+        });
+        ['notification', 'read', 'resync'].forEach((name) => {
+          source?.addEventListener(name, () => onChangeRef.current?.());
+        });
+        source.onerror = () => {
+          // The ticket has expired by now, so reconnect with a new one
+          source?.close();
+          source = null;
+          reconnect();
+        };
+      } catch (error) {
+        console.error('Notification stream error:', error);
+        reconnect();
+      }
+    };
+
+    connect();
+
+    return () => {
+      closed = true;
+      if (retryTimer) clearTimeout(retryTimer);
+      source?.close();
+    };
+  }, [enabled, ticketPath]);
+}
@@ -619,11 +619,14 @@ export const sendSupportMessage = async (
 };
 
 /**
- * Get partner attendees
+ * Get partner attendees (one page, newest booking first)
+ *
+ * Pass the previous response's next_cursor as `cursor` to get the next page;
+ * next_cursor is null on the last page.
  */
 export const getPartnerAttendees = async (
   eventId?: number,
-  page: number = 1,
+  cursor?: string | null,
   perPage: number = 50
 ): Promise<any> => {
   const token = getPartnerToken();
@@ -632,10 +635,13 @@ export const getPartnerAttendees = async (
     throw new Error('Not authenticated');
   }
 
-  let url = `${API_BASE_URL}/api/partners/attendees?page=${page}&per_page=${perPage}`;
+  let url = `${API_BASE_URL}/api/partners/attendees?per_page=${perPage}`;
   if (eventId) {
     url += `&event_id=${eventId}`;
   }
+  if (cursor) {
+    url += `&cursor=${encodeURIComponent(cursor)}`;
+  }
 
   const response = await fetch(url, {
     headers: {
@@ -653,6 +659,20 @@ export const getPartnerAttendees = async (
   return data;
 };
 
+/**
+ * Get every partner attendee, following next_cursor page by page
+ */
+export const getAllPartnerAttendees = async (eventId?: number): Promise<any[]> => {
+  const attendees: any[] = [];
+  let cursor: string | null = null;
+  do {
+    const response = await getPartnerAttendees(eventId, cursor, 200);
+    attendees.push(...(response.attendees || []));
+    cursor = response.next_cursor || null;
+  } while (cursor);
+  return attendees;
+};
+
 /**
  * Get team members
  */
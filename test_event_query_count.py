@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Test that bulk event serialization runs a constant number of queries per page
+Run this script against the testing config (sqlite:///test.db)
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import event as sa_event
+from app import create_app, db
+from app.models.user import User
+from app.models.partner import Partner
+from app.models.event import Event, EventHost, EventInterest
+from app.models.ticket import TicketType, PromoCode
+from app.models.category import Category, Location
+from app.utils.serializers import serialize_events
+
+
+class QueryCounter:
+    """Count SQL statements executed on the engine while active"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _on_execute(self, *args, **kwargs):
+        self.count += 1
+
+    def __enter__(self):
+        sa_event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        sa_event.remove(self.engine, 'before_cursor_execute', self._on_execute)
+
+
+def seed_events(count):
+    """Create count approved events with every relation populated"""
+    category = Category(name='Technology', slug='technology')
+    location = Location(name='Nairobi', slug='nairobi')
+    partner = Partner(
+        email='partner@example.com',
+        phone_number='254700000000',
+        password_hash='x',
+        business_name='Test Partner',
+        category=category
+    )
+    db.session.add_all([category, location, partner])
+    db.session.flush()
+
+    for i in range(count):
+        host_user = User(email=f'host{i}@example.com', first_name='Host', last_name=str(i))
+        event = Event(
+            title=f'Event {i}',
+            description='Query count test event',
+            partner_id=partner.id,
+            category_id=category.id,
+            location_id=location.id,
+            start_date=datetime.utcnow() + timedelta(days=i + 1),
+            status='approved',
+            is_published=True
+        )
+        db.session.add_all([host_user, event])
+        db.session.flush()
+        db.session.add_all([
+            EventHost(event_id=event.id, user_id=host_user.id),
+            EventInterest(event_id=event.id, name='Tech'),
+            EventInterest(event_id=event.id, name='AI'),
+            TicketType(event_id=event.id, name='Regular', price=100, quantity_available=50),
+            PromoCode(event_id=event.id, code=f'PROMO{i}', discount_type='percentage',
+                      discount_value=10, created_by=partner.id)
+        ])
+    db.session.commit()
+
+
+def count_queries_for_page(per_page, include_stats=False):
+    """Serialize one page from a clean session and return the query count"""
+    db.session.expire_all()
+    with QueryCounter(db.engine) as counter:
+        events = Event.query.order_by(Event.start_date).limit(per_page).all()
+        serialize_events(events, include_stats=include_stats)
+    return counter.count
+
+
+def test_event_query_count_is_constant():
+    """Query count must not grow with the number of events on the page"""
+    app = create_app('testing')
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        try:
+            seed_events(20)
+
+            for include_stats in (False, True):
+                small = count_queries_for_page(2, include_stats)
+                large = count_queries_for_page(20, include_stats)
+                print(f"include_stats={include_stats}: 2 events -> {small} queries, 20 events -> {large} queries")
+                assert small == large, f"Query count grew with page size ({small} -> {large})"
+        finally:
+            db.session.remove()
+            db.drop_all()
+
+    print("✅ Query count per page is constant")
+
+
+if __name__ == '__main__':
+    test_event_query_count_is_constant()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Load test for ticket inventory reservations
+Fires 500 concurrent booking attempts at a ticket type with 50 tickets and
+checks that nothing is oversold, then races payment confirmations against
+the reservation expiry sweep.
+
+Usage: python test_ticket_inventory.py [attempts] [tickets]
+"""
+import os
+import sys
+import random
+import threading
+from datetime import datetime, timedelta
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask_jwt_extended import create_access_token
+from app import create_app, db, limiter
+from app.models.user import User
+from app.models.partner import Partner
+from app.models.event import Event
+from app.models.category import Category
+from app.models.ticket import TicketType, Booking
+from app.utils.inventory import confirm_booking
+from app.utils.reservation_sweeper import reservation_sweeper
+
+
+def seed(attempts, tickets):
+    """Create a paid event with a limited ticket type and one user per attempt"""
+    category = Category(name='Music', slug='music')
+    partner = Partner(email='partner@example.com', phone_number='254700000000',
+                      password_hash='x', business_name='Load Test Partner')
+    db.session.add_all([category, partner])
+    db.session.flush()
+
+    event = Event(
+        title='Sold Out Show',
+        description='Inventory load test event',
+        partner_id=partner.id,
+        category_id=category.id,
+        start_date=datetime.utcnow() + timedelta(days=7),
+        status='approved',
+        is_published=True,
+        is_free=False
+    )
+    db.session.add(event)
+    db.session.flush()
+
+    ticket_type = TicketType(event_id=event.id, name='Regular', price=100,
+                             quantity_total=tickets, quantity_available=tickets, max_per_order=3)
+    db.session.add(ticket_type)
+    db.session.add_all([
+        User(email=f'fan{i}@example.com', first_name='Fan', last_name=str(i))
+        for i in range(attempts)
+    ])
+    db.session.commit()
+    return event.id, ticket_type.id
+
+
+def run_concurrently(targets):
+    """Start one thread per target at the same moment and wait for all of them"""
+    barrier = threading.Barrier(len(targets))
+
+    def runner(target):
+        barrier.wait()
+        target()
+
+    threads = [threading.Thread(target=runner, args=(target,)) for target in targets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def book_concurrently(app, event_id, ticket_type_id, user_ids):
+    """POST /api/tickets/book once per user, all at the same time"""
+    client = app.test_client()
+    rng = random.Random(7)
+    results = []
+    lock = threading.Lock()
+
+    def attempt(user_id, quantity):
+        with app.app_context():
+            token = create_access_token(identity=str(user_id))
+        response = client.post('/api/tickets/book', json={
+            'event_id': event_id,
+            'ticket_type_id': ticket_type_id,
+            'quantity': quantity
+        }, headers={'Authorization': f'Bearer {token}'})
+        with lock:
+            results.append(response.status_code)
+
+    run_concurrently([
+        (lambda user_id=user_id, quantity=rng.randint(1, 3): attempt(user_id, quantity))
+        for user_id in user_ids
+    ])
+    return results
+
+
+def settle_concurrently(app, bookings):
+    """Race two confirmations per paid booking against the expiry sweep"""
+    confirmations = []
+    lock = threading.Lock()
+
+    def pay(booking_id):
+        with app.app_context():
+            booking = Booking.query.get(booking_id)
+            confirmed = confirm_booking(booking)
+            db.session.commit()
+            with lock:
+                confirmations.append((booking_id, confirmed))
+
+    def sweep():
+        with app.app_context():
+            reservation_sweeper.sweep()
+
+    paid = [booking.id for booking in bookings[::2]]
+    targets = []
+    for booking_id in paid:
+        # Callback and status poll for the same payment
+        targets += [lambda booking_id=booking_id: pay(booking_id)] * 2
+    targets += [sweep] * 4
+    run_concurrently(targets)
+    return paid, confirmations
+
+
+def test_no_oversell(attempts=500, tickets=50):
+    app = create_app('testing')
+    limiter.enabled = False
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        try:
+            event_id, ticket_type_id = seed(attempts, tickets)
+            user_ids = [user.id for user in User.query.order_by(User.id).all()]
+
+            # Phase 1: everyone tries to book at once
+            results = book_concurrently(app, event_id, ticket_type_id, user_ids)
+            created = results.count(201)
+            rejected = results.count(400)
+            print(f"{attempts} attempts: {created} booked, {rejected} sold out, "
+                  f"{len(results) - created - rejected} errors")
+            assert created + rejected == attempts, f"Unexpected responses: {sorted(set(results))}"
+
+            db.session.expire_all()
+            ticket_type = TicketType.query.get(ticket_type_id)
+            bookings = Booking.query.filter_by(event_id=event_id, status='pending').all()
+            held = sum(booking.quantity for booking in bookings)
+            print(f"Reserved {ticket_type.quantity_reserved} of {tickets} tickets")
+            assert len(bookings) == created
+            assert held == ticket_type.quantity_reserved, "Reserved counter drifted from bookings"
+            assert held <= tickets, f"Oversold: {held} tickets held out of {tickets}"
+
+            # Phase 2: half of the bookings pay, the rest expire, concurrently
+            Booking.query.filter(Booking.id.in_([b.id for b in bookings[1::2]])).update(
+                {'reserved_until': datetime.utcnow() - timedelta(minutes=1)},
+                synchronize_session=False
+            )
+            db.session.commit()
+            paid, confirmations = settle_concurrently(app, bookings)
+
+            db.session.expire_all()
+            ticket_type = TicketType.query.get(ticket_type_id)
+            sold = sum(booking.quantity for booking in Booking.query.filter_by(
+                event_id=event_id, status='confirmed'))
+            print(f"Sold {ticket_type.quantity_sold}, reserved {ticket_type.quantity_reserved}, "
+                  f"available {ticket_type.quantity_available}")
+            winners = [booking_id for booking_id, confirmed in confirmations if confirmed]
+            assert sorted(winners) == sorted(paid), "A payment was confirmed twice or not at all"
+            assert ticket_type.quantity_sold == sold
+            assert ticket_type.quantity_reserved == 0
+            assert ticket_type.quantity_available == tickets - sold
+            assert Booking.query.filter_by(event_id=event_id, status='pending').count() == 0
+        finally:
+            db.session.remove()
+            db.drop_all()
+
+    print("✅ No tickets oversold")
+
+
+if __name__ == '__main__':
+    test_no_oversell(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 500,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    )